@@ -34,6 +34,9 @@ if __name__ == '__main__':
                         default=False)
     parser.add_argument("-e", "--edit", dest="edit", help="Open sim in editor",
                         action="store_true", default=False)
+    parser.add_argument("--profile-startup", dest="profile_startup",
+                        help="Print a breakdown of startup time",
+                        action="store_true", default=False)
     parser.add_argument("file", help=".ts2 file to open/edit", type=str,
                         nargs='?')
     args = parser.parse_args()
@@ -41,5 +44,9 @@ if __name__ == '__main__':
     if args.edit and args.file is None:
         sys.exit("ERROR: Need a file with -e option")
 
+    if args.profile_startup:
+        import ts2.startupprofiler
+        ts2.startupprofiler.start()
+
     import ts2.application
     ts2.application.Main(args=args)
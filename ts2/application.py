@@ -22,6 +22,7 @@ import sys
 from Qt import QtCore, QtGui, QtWidgets
 
 
+from ts2 import startupprofiler
 from ts2 import mainwindow
 from ts2 import ressources_rc
 from ts2.gui import dialogs
@@ -34,23 +35,30 @@ def Main(args=None):
 
     :param object args: Command line args from argparse
     """
-    app = QtWidgets.QApplication(sys.argv)
-    app.setApplicationName(__APP_SHORT__)
-    app.setApplicationName(__VERSION__)
-    app.setWindowIcon(QtGui.QIcon(QtGui.QPixmap(":/ts2.png")))
-    qtTranslator = QtCore.QTranslator()
-    qtTranslator.load("qt_" + QtCore.QLocale.system().name(),
-                      QtCore.QLibraryInfo.location(
-                                      QtCore.QLibraryInfo.TranslationsPath))
-    app.installTranslator(qtTranslator)
-    ts2Translator = QtCore.QTranslator()
-    ts2Translator.load(QtCore.QLocale.system(), "ts2", "_", "i18n", ".qm")
-    app.installTranslator(ts2Translator)
+    with startupprofiler.phase("Create QApplication"):
+        app = QtWidgets.QApplication(sys.argv)
+        app.setApplicationName(__APP_SHORT__)
+        app.setApplicationName(__VERSION__)
+        app.setWindowIcon(QtGui.QIcon(QtGui.QPixmap(":/ts2.png")))
+    with startupprofiler.phase("Load translations"):
+        qtTranslator = QtCore.QTranslator()
+        qtTranslator.load("qt_" + QtCore.QLocale.system().name(),
+                          QtCore.QLibraryInfo.location(
+                                          QtCore.QLibraryInfo.TranslationsPath))
+        app.installTranslator(qtTranslator)
+        ts2Translator = QtCore.QTranslator()
+        ts2Translator.load(QtCore.QLocale.system(), "ts2", "_", "i18n", ".qm")
+        app.installTranslator(ts2Translator)
     QtCore.qDebug(QtCore.QLocale.system().name())
     # TODO: Uncomment in production
     # try:
-    mw = mainwindow.MainWindow(args=args)
-    mw.show()
+    with startupprofiler.phase("Build main window"):
+        mw = mainwindow.MainWindow(args=args)
+    with startupprofiler.phase("Show main window"):
+        mw.show()
+    if startupprofiler.isActive():
+        # Report once the event loop has run and the window is painted
+        QtCore.QTimer.singleShot(0, startupprofiler.finish)
     return app.exec_()
     # except:
     #     dialogs.ExceptionDialog.popupException(None)
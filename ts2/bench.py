@@ -0,0 +1,274 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""Headless simulation benchmark.
+
+Usage::
+
+    python -m ts2.bench [-o results.json] [--duration SECS] [--seed N]
+                        [--auto-routes] [simulation.json ...]
+
+Each simulation (by default the simulations bundled with ts2) is loaded and
+run for a fixed simulated time span with a fixed random seed, in its own
+process so that peak memory figures are not mixed up. The results are
+written as JSON. With --auto-routes, routes are set automatically according
+to the timetables, otherwise trains stop at the first red signal.
+"""
+
+import argparse
+import functools
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import ts2
+from ts2.instrumentation import patchMethod
+
+BUNDLED_SIMULATIONS = [
+    "UK/drain.json",
+    "UK/liverpool-st.json",
+    "France/gretz-armainvilliers.json",
+    "Germany/goerlitz.json",
+]
+
+SUBSYSTEMS = {
+    "trainAdvance": [("ts2.trains.train", "Train", ("advance", "activate"))],
+    "signalUpdate": [("ts2.scenery.signals.signalitem", "SignalItem",
+                      ("updateSignalState",))],
+    "routeActivation": [("ts2.routing.route", "Route",
+                         ("activate", "desactivate"))],
+    "graphics": [("ts2.trains.train", "Train", ("drawTrain",)),
+                 ("ts2.scenery.abstract", "TrackItem",
+                  ("updateGraphics", "updateTrain", "drawTrain"))],
+}
+"""Methods timed for each subsystem. For TrackItem, the methods are timed in
+all the subclasses that override them."""
+
+
+class SubsystemTimer:
+    """Accumulates the time spent in each subsystem. Times are exclusive: the
+    time spent in a nested subsystem (e.g. signal updates triggered by a
+    train advancing) is only counted in the nested subsystem."""
+
+    def __init__(self):
+        self.times = {name: 0.0 for name in SUBSYSTEMS}
+        self.calls = {name: 0 for name in SUBSYSTEMS}
+        self._stack = []
+
+    def wrap(self, subsystem, func):
+        """Returns func wrapped so that its time is added to subsystem."""
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                childTime = self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += elapsed
+                self.times[subsystem] += elapsed - childTime
+                self.calls[subsystem] += 1
+        return timed
+
+    def install(self):
+        """Patches the methods listed in SUBSYSTEMS. This must be done before
+        the simulation is loaded, so that signal connections use the timed
+        methods."""
+        for subsystem, targets in SUBSYSTEMS.items():
+            for moduleName, className, methodNames in targets:
+                cls = getattr(importlib.import_module(moduleName), className)
+                for methodName in methodNames:
+                    patchMethod(cls, methodName,
+                                functools.partial(self.wrap, subsystem),
+                                subclasses=True)
+
+
+def peakMemory():
+    """Returns the peak resident memory of this process in kB, or None if it
+    is not available on this platform."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # Bytes on macOS, kB elsewhere
+        maxrss //= 1024
+    return maxrss
+
+
+def runSimulation(fileName, duration, seed, timeFactor, autoRoutes=False):
+    """Loads and runs the simulation in fileName in this process.
+
+    :return: the results as a dict
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from Qt import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    # Modules use qApp at import time, so import them after app creation
+    from ts2 import simulation
+    from ts2.simulationworker import HeadlessWindow
+
+    timer = SubsystemTimer()
+    timer.install()
+
+    memoryBefore = peakMemory()
+    start = time.perf_counter()
+    with open(fileName) as fileStream:
+        sim = simulation.load(HeadlessWindow(), fileStream, seed)
+    loadTime = time.perf_counter() - start
+    memoryAfterLoad = peakMemory()
+
+    # Drive the clock ourselves rather than with the QTimer
+    sim.pause()
+    sim.setOption("timeFactor", timeFactor)
+    sim.setAutoRouteSetting(autoRoutes)
+    secsPerTick = sim.timerInterval * timeFactor / 1000
+    ticks = int(duration / secsPerTick)
+    for subsystem in timer.times:
+        timer.times[subsystem] = 0.0
+        timer.calls[subsystem] = 0
+
+    start = time.perf_counter()
+    for i in range(ticks):
+        sim.timerOut()
+    runTime = time.perf_counter() - start
+    app.processEvents()
+
+    subsystems = {
+        name: {"time": timer.times[name], "calls": timer.calls[name]}
+        for name in SUBSYSTEMS
+    }
+    subsystems["other"] = {
+        "time": max(runTime - sum(timer.times.values()), 0.0),
+        "calls": ticks
+    }
+    return {
+        "simulation": sim.option("title"),
+        "file": fileName,
+        "trackItems": len(sim.trackItems),
+        "routes": len(sim.routes),
+        "services": len(sim.services),
+        "trains": len(sim.trains),
+        "loadTime": loadTime,
+        "ticks": ticks,
+        "runTime": runTime,
+        "ticksPerSecond": ticks / runTime if runTime else None,
+        "simulatedTime": ticks * secsPerTick,
+        "subsystems": subsystems,
+        "finalTime": sim.currentTime.toString("hh:mm:ss"),
+        "score": sim.scorer.score,
+        "autoRoutesSet": (sim.autoRouteSetter.routesSet
+                          if sim.autoRouteSetter else None),
+        "peakMemoryBeforeLoad": memoryBefore,
+        "peakMemoryAfterLoad": memoryAfterLoad,
+        "peakMemory": peakMemory(),
+    }
+
+
+def runInSubprocess(fileName, args):
+    """Runs the benchmark of fileName in a child process and returns its
+    results."""
+    packageParent = os.path.dirname(os.path.dirname(os.path.abspath(
+        ts2.__file__
+    )))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [packageParent] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    cmd = [sys.executable, "-m", "ts2.bench", "--single",
+           "--duration", str(args.duration), "--seed", str(args.seed),
+           "--time-factor", str(args.time_factor)]
+    if args.auto_routes:
+        cmd.append("--auto-routes")
+    cmd.append(fileName)
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, env=env,
+                          universal_newlines=True)
+    if proc.returncode != 0:
+        return {"file": fileName, "error": "exit code %i" % proc.returncode}
+    return json.loads(proc.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        "ts2.bench", description="Runs simulations headlessly and reports "
+                                 "performance figures as JSON."
+    )
+    parser.add_argument("files", nargs="*",
+                        help="simulation files (default: bundled ones)")
+    parser.add_argument("-o", "--output", help="write results to this file")
+    parser.add_argument("--duration", type=float, default=3600,
+                        help="simulated seconds to run (default: 3600)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default: 0)")
+    parser.add_argument("--time-factor", type=int, default=5,
+                        help="simulated seconds per real second of the "
+                             "game clock, sets the tick step (default: 5)")
+    parser.add_argument("--auto-routes", action="store_true",
+                        help="set routes automatically from the timetables")
+    parser.add_argument("--single", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single:
+        result = runSimulation(args.files[0], args.duration, args.seed,
+                               args.time_factor, args.auto_routes)
+        json.dump(result, sys.stdout)
+        return 0
+
+    files = args.files
+    if not files:
+        simulationsDir = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(ts2.__file__))),
+            "simulations"
+        )
+        files = [os.path.join(simulationsDir, f) for f in BUNDLED_SIMULATIONS]
+
+    results = {
+        "version": ts2.__VERSION__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "duration": args.duration,
+        "timeFactor": args.time_factor,
+        "autoRoutes": args.auto_routes,
+        "results": [runInSubprocess(f, args) for f in files],
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
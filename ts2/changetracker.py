@@ -0,0 +1,375 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Change tracking of the simulation state displayed to observers.
+
+When a :class:`ChangeTracker` is set as the ``changeTracker`` of a
+simulation, trains, signals, track items, routes and the scorer report to it
+each change of their displayed state. Each observer subscribes to the tracker
+and gets delta records holding only the state of the objects which changed
+since its previous record, so that the cost of a record grows with the
+amount of change and not with the size of the layout.
+
+Records are the dicts described in :func:`diffSnapshots`, with two more
+keys:
+
+- q: sequence number of the tracker when the record was made
+- p: sequence number of the previous record of the subscription, which the
+  record must be applied on. Keyframes hold the whole state instead, have
+  no p and are applied on an empty snapshot.
+
+A subscription gets a keyframe first, then every keyframeInterval records,
+and when it asks for it with :meth:`Subscription.resync`.
+"""
+
+import collections
+
+from Qt import QtCore
+
+from ts2.simulationworker import EMPTY_SNAPSHOT, SignalState, Snapshot, \
+    TrainState, highlightEntry, occupationEntry, signalState, takeSnapshot, \
+    trainState
+
+
+def _trainRow(trainId, state):
+    return [trainId, state.serviceCode, state.trainTypeCode, state.status,
+            state.speed] + list(state.head) + \
+        [state.nextPlaceIndex, state.stoppedTime, state.minimumStopTime,
+         state.initialDelay]
+
+
+def _occupationRow(entry):
+    return [entry[0], list(entry[1]), list(entry[2]), list(entry[3])]
+
+
+def _signalRow(tiId, state):
+    return [tiId] + list(state)
+
+
+def diffSnapshots(previous, current):
+    """Returns the delta from the snapshot previous to the snapshot current,
+    as a dict of lists with short keys which :func:`patchSnapshot` applies:
+
+    - c, t, s, sel: commands, time, score and selected signal
+    - tr: [trainId, serviceCode, trainTypeCode, status, speed, tiId,
+      previousTiId, positionOnTI, nextPlaceIndex, stoppedTime,
+      minimumStopTime, initialDelay] of each changed train, in trainId order
+    - oc, ocx: changed occupation entries, and tiId of freed track items
+    - hl, hlx: changed highlights, and tiId of track items without route
+    - sg: [tiId, aspectName, trainId, nextRoute, previousRoute] of each
+      changed signal
+    - rp, rpx: tiId of the points reversed, and put back to normal
+    - pr, prx: routeNum of the routes made persistent, and not persistent
+    - msg, req: messages and requests of current
+
+    Only the keys of non empty lists are given.
+    """
+    delta = {
+        "c": current.commands,
+        "t": current.time,
+        "s": current.score,
+        "sel": current.selectedSignal,
+    }
+
+    def add(key, values):
+        if values:
+            delta[key] = values
+
+    previousTrains = previous.trains
+    add("tr", [_trainRow(trainId, state)
+               for trainId, state in enumerate(current.trains)
+               if trainId >= len(previousTrains) or
+               state != previousTrains[trainId]])
+    for key, index, makeRow in (("oc", "occupation", _occupationRow),
+                                ("hl", "highlights", list)):
+        before = {entry[0]: entry for entry in getattr(previous, index)}
+        after = {entry[0]: entry for entry in getattr(current, index)}
+        add(key, [makeRow(entry) for tiId, entry in after.items()
+                  if before.get(tiId) != entry])
+        add(key + "x", [tiId for tiId in before if tiId not in after])
+    before = dict(previous.signals)
+    add("sg", [_signalRow(tiId, state) for tiId, state in current.signals
+               if before.get(tiId) != state])
+    for key, index in (("rp", "reversedPoints"), ("pr", "persistentRoutes")):
+        before = getattr(previous, index)
+        after = getattr(current, index)
+        add(key, sorted(after - before))
+        add(key + "x", sorted(before - after))
+    add("msg", [list(message) for message in current.messages])
+    add("req", [list(request) for request in current.requests])
+    return delta
+
+
+def patchSnapshot(previous, delta):
+    """Returns the snapshot obtained by applying delta, as returned by
+    :func:`diffSnapshots` or by a :class:`Subscription`, to the snapshot
+    previous. The fields which are not in delta are kept.
+
+    :raises IndexError: if delta skips trains which are not in previous
+    """
+    trainStates = list(previous.trains)
+    for row in delta.get("tr", ()):
+        state = TrainState(row[1], row[2], row[3], row[4], tuple(row[5:8]),
+                           row[8], row[9], row[10], row[11])
+        if row[0] < len(trainStates):
+            trainStates[row[0]] = state
+        elif row[0] == len(trainStates):
+            trainStates.append(state)
+        else:
+            raise IndexError(row[0])
+
+    def patchEntries(entries, key, makeEntry):
+        entries = collections.OrderedDict((entry[0], entry)
+                                          for entry in entries)
+        for tiId in delta.get(key + "x", ()):
+            entries.pop(tiId, None)
+        for row in delta.get(key, ()):
+            entries[row[0]] = makeEntry(row)
+        return tuple(entries.values())
+
+    def patchSet(values, key):
+        return (values - frozenset(delta.get(key + "x", ()))) | \
+            frozenset(delta.get(key, ()))
+
+    return Snapshot(
+        commands=delta.get("c", previous.commands),
+        time=delta.get("t", previous.time),
+        score=delta.get("s", previous.score),
+        trains=tuple(trainStates),
+        occupation=patchEntries(
+            previous.occupation, "oc",
+            lambda r: (r[0], tuple(r[1]), tuple(r[2]), tuple(r[3]))
+        ),
+        highlights=patchEntries(previous.highlights, "hl", tuple),
+        signals=patchEntries(previous.signals, "sg",
+                             lambda r: (r[0], SignalState(*r[1:]))),
+        reversedPoints=patchSet(previous.reversedPoints, "rp"),
+        persistentRoutes=patchSet(previous.persistentRoutes, "pr"),
+        selectedSignal=delta.get("sel", previous.selectedSignal),
+        messages=tuple(tuple(m) for m in delta.get("msg", ())),
+        requests=tuple(tuple(r) for r in delta.get("req", ()))
+    )
+
+
+class Changes:
+    """Keys of the objects which changed."""
+
+    def __init__(self):
+        """Constructor for the Changes class."""
+        self.trains = set()
+        self.occupation = set()
+        self.highlights = set()
+        self.signals = set()
+        self.points = set()
+        self.routes = set()
+        self.score = False
+
+    def __bool__(self):
+        return bool(self.trains or self.occupation or self.highlights or
+                    self.signals or self.points or self.routes or self.score)
+
+    def update(self, other):
+        """Adds the changes of other to these changes."""
+        self.trains |= other.trains
+        self.occupation |= other.occupation
+        self.highlights |= other.highlights
+        self.signals |= other.signals
+        self.points |= other.points
+        self.routes |= other.routes
+        self.score = self.score or other.score
+
+
+class Subscription:
+    """Delta records of a :class:`ChangeTracker` for one observer."""
+
+    def __init__(self, tracker, keyframeInterval):
+        """Constructor for the Subscription class."""
+        self.tracker = tracker
+        self.keyframeInterval = keyframeInterval
+        self.sequence = None
+        self.changes = Changes()
+        self._keyframeDue = True
+        self._records = 0
+
+    def resync(self):
+        """Makes the next record a keyframe."""
+        self._keyframeDue = True
+
+    def nextRecord(self):
+        """Returns the record of the changes since the previous record of
+        this subscription, or a keyframe."""
+        tracker = self.tracker
+        tracker.flush()
+        self._records += 1
+        if self._keyframeDue or \
+                (self.keyframeInterval and
+                 self._records >= self.keyframeInterval):
+            record = tracker.keyframe()
+            self._keyframeDue = False
+            self._records = 0
+        else:
+            record = tracker.record(self.changes)
+            record["p"] = self.sequence
+        record["q"] = tracker.sequence
+        self.sequence = tracker.sequence
+        self.changes = Changes()
+        return record
+
+
+class ChangeTracker(QtCore.QObject):
+    """Collects the changes of the state of a simulation and distributes
+    them to its subscriptions."""
+
+    def __init__(self, sim, keyframeInterval=1500):
+        """
+        :param sim: the simulation, of which this tracker becomes the
+        changeTracker
+        :param keyframeInterval: number of records between two keyframes
+        of a subscription, 0 for keyframes on subscription and resync only
+        """
+        super().__init__(sim)
+        self.simulation = sim
+        self.keyframeInterval = keyframeInterval
+        self.sequence = 0
+        self.subscriptions = []
+        self._changes = Changes()
+        self._trainIds = {}
+        self._indexTrains()
+        sim.scorer.scoreChanged.connect(self.scoreChanged)
+        sim.changeTracker = self
+
+    def _indexTrains(self):
+        trns = self.simulation.trains
+        for trainId in range(len(self._trainIds), len(trns)):
+            self._trainIds[id(trns[trainId])] = trainId
+            # New trains, e.g. split ones, must be sent at least once
+            self._changes.trains.add(trainId)
+
+    def trainChanged(self, train):
+        trainId = self._trainIds.get(id(train))
+        if trainId is None:
+            self._indexTrains()
+            trainId = self._trainIds[id(train)]
+        self._changes.trains.add(trainId)
+
+    def occupationChanged(self, ti):
+        self._changes.occupation.add(ti.tiId)
+
+    def highlightChanged(self, ti):
+        self._changes.highlights.add(ti.tiId)
+
+    def signalChanged(self, si):
+        self._changes.signals.add(si.tiId)
+
+    def pointsChanged(self, pi):
+        self._changes.points.add(pi.tiId)
+
+    def persistenceChanged(self, route):
+        self._changes.routes.add(route.routeNum)
+
+    @QtCore.pyqtSlot(int)
+    def scoreChanged(self):
+        self._changes.score = True
+
+    def subscribe(self):
+        """Returns a new :class:`Subscription` to this tracker."""
+        subscription = Subscription(self, self.keyframeInterval)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    def resync(self):
+        """Makes the next record of each subscription a keyframe, e.g.
+        after the state of the simulation was replaced."""
+        self._trainIds = {}
+        self._changes = Changes()
+        self._indexTrains()
+        for subscription in self.subscriptions:
+            subscription.resync()
+
+    def flush(self):
+        """Distributes the changes collected since the previous flush to
+        the subscriptions."""
+        if len(self._trainIds) != len(self.simulation.trains):
+            self._indexTrains()
+        if not self._changes:
+            return
+        self.sequence += 1
+        for subscription in self.subscriptions:
+            subscription.changes.update(self._changes)
+        self._changes = Changes()
+
+    def keyframe(self):
+        """Returns the record of the whole state of the simulation."""
+        record = diffSnapshots(EMPTY_SNAPSHOT, takeSnapshot(self.simulation))
+        record["k"] = 1
+        return record
+
+    def record(self, changes):
+        """Returns the record of the current state of the objects in
+        changes, a :class:`Changes` instance."""
+        sim = self.simulation
+        record = {"t": sim.currentTime.msecsSinceStartOfDay()}
+
+        def add(key, values):
+            if values:
+                record[key] = values
+
+        if changes.score:
+            record["s"] = sim.scorer.score
+        add("tr", [_trainRow(trainId, trainState(sim.trains[trainId]))
+                   for trainId in sorted(changes.trains)])
+        occupied = []
+        freed = []
+        for tiId in changes.occupation:
+            ti = sim.trackItem(tiId)
+            if ti.trainPresent():
+                occupied.append(_occupationRow(
+                    occupationEntry(ti, self._trainIds)
+                ))
+            else:
+                freed.append(tiId)
+        add("oc", occupied)
+        add("ocx", freed)
+        highlighted = []
+        released = []
+        for tiId in changes.highlights:
+            ti = sim.trackItem(tiId)
+            if ti.activeRoute is not None:
+                highlighted.append(list(highlightEntry(ti)))
+            else:
+                released.append(tiId)
+        add("hl", highlighted)
+        add("hlx", released)
+        add("sg", [_signalRow(tiId, signalState(sim.trackItem(tiId)))
+                   for tiId in changes.signals])
+        add("rp", [tiId for tiId in changes.points
+                   if sim.trackItem(tiId).pointsReversed])
+        add("rpx", [tiId for tiId in changes.points
+                    if not sim.trackItem(tiId).pointsReversed])
+        add("pr", [routeNum for routeNum in changes.routes
+                   if sim.routes[routeNum].persistent])
+        add("prx", [routeNum for routeNum in changes.routes
+                    if not sim.routes[routeNum].persistent])
+        return record
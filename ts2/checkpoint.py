@@ -0,0 +1,355 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""In-memory checkpoints of a running simulation.
+
+A checkpoint holds copies of the attributes of the objects which change
+during the game: the simulation, its trains, track items and routes, the
+route conflicts, the scorer and the automatic route setter, as well as the
+state of the random generator of the simulation. The objects themselves are
+not copied: restoring a checkpoint puts the attributes back in the same
+objects, so that a simulation can be rewound in place, with its scene and
+views.
+
+Most attributes, such as the geometry of the track items or the timetables,
+never change during a game. A checkpoint may therefore be taken against a
+base checkpoint, usually taken at load time, and then only keeps the
+attributes which differ from the base.
+
+The messages logged since the checkpoint are kept.
+"""
+
+from Qt import QtCore
+
+from ts2.game import logger
+
+SIMULATION_ATTRIBUTES = ("_time", "_selectedSignal", "_trains", "_options",
+                         "activeRouteNumbers", "autoRouteSetter")
+"""Attributes of the simulation which are part of the game state."""
+
+
+def _copyValue(value):
+    """Returns a copy of value in which containers are copied and other
+    objects are shared."""
+    valueType = type(value)
+    if valueType is list:
+        return [_copyValue(v) for v in value]
+    if valueType is dict:
+        return {k: _copyValue(v) for k, v in value.items()}
+    if valueType is set:
+        return {_copyValue(v) for v in value}
+    if isinstance(value, dict):
+        # e.g. OrderedDict
+        return valueType((k, _copyValue(v)) for k, v in value.items())
+    return value
+
+
+def _copyAttributes(attributes):
+    return {name: _copyValue(value) for name, value in attributes.items()}
+
+
+def _sameValue(value, other):
+    """Returns True if value and other hold the same objects. Objects are
+    compared by identity, except numbers and strings, so that custom
+    comparison operators are not called."""
+    if value is other:
+        return True
+    valueType = type(value)
+    if valueType is not type(other):
+        return False
+    if valueType in (int, float, str, bool):
+        return value == other
+    if valueType is list or valueType is tuple:
+        return len(value) == len(other) and \
+            all(_sameValue(v, o) for v, o in zip(value, other))
+    if isinstance(value, dict):
+        return value.keys() == other.keys() and \
+            all(_sameValue(v, other[k]) for k, v in value.items())
+    if valueType is set:
+        return value == other
+    return False
+
+
+_DELETED = object()
+"""Marks the attributes of a base checkpoint which an object no longer
+has."""
+
+
+def _deltaAttributes(attributes, baseAttributes):
+    """Returns copies of the attributes which differ from baseAttributes."""
+    delta = {name: _copyValue(value) for name, value in attributes.items()
+             if name not in baseAttributes or
+             not _sameValue(value, baseAttributes[name])}
+    for name in baseAttributes.keys() - attributes.keys():
+        delta[name] = _DELETED
+    return delta
+
+
+class Checkpoint:
+    """State of a simulation at a given time. Use :func:`takeCheckpoint` to
+    create one."""
+
+    def __init__(self, time, tick, states, randomState, base=None,
+                 elapsed=None):
+        """Constructor for the Checkpoint class."""
+        self.time = time
+        self.tick = tick
+        self.states = states
+        self.randomState = randomState
+        self.base = base
+        self.elapsed = elapsed
+        self._statesById = None
+
+    def statesById(self):
+        """Returns the attributes of the checkpoint as a dict {id(object):
+        attributes}."""
+        if self._statesById is None:
+            self._statesById = {id(obj): state for obj, state in self.states}
+        return self._statesById
+
+    def attributes(self, obj, state):
+        """Returns all the attributes of obj given its state in this
+        checkpoint."""
+        if self.base is None:
+            return state
+        attributes = dict(self.base.statesById().get(id(obj), {}))
+        for name, value in state.items():
+            if value is _DELETED:
+                del attributes[name]
+            else:
+                attributes[name] = value
+        return attributes
+
+    @property
+    def size(self):
+        """Number of attributes held by the checkpoint."""
+        return sum(len(state) for obj, state in self.states)
+
+
+def _stateObjects(sim):
+    objects = [sim.routeConflicts, sim.scorer]
+    objects.extend(sim.trains)
+    objects.extend(sim.trackItems.values())
+    objects.extend(sim.routes.values())
+    if sim.autoRouteSetter is not None:
+        objects.append(sim.autoRouteSetter)
+    return objects
+
+
+def takeCheckpoint(sim, tick=None, base=None, elapsed=None):
+    """Returns a :class:`Checkpoint` of the simulation sim.
+
+    :param tick: number of ticks run by the simulation, stored in the
+    checkpoint for the caller's convenience
+    :param base: full checkpoint of sim, if given only the attributes which
+    differ from it are copied
+    :param elapsed: game time elapsed in ms, stored in the checkpoint for the
+    caller's convenience
+    """
+    simAttributes = {name: getattr(sim, name)
+                     for name in SIMULATION_ATTRIBUTES}
+    objects = [(obj, vars(obj)) for obj in _stateObjects(sim)]
+    if base is None:
+        states = [(sim, _copyAttributes(simAttributes))]
+        states.extend((obj, _copyAttributes(attributes))
+                      for obj, attributes in objects)
+    else:
+        baseStates = base.statesById()
+        states = [(sim, _deltaAttributes(simAttributes, baseStates[id(sim)]))]
+        states.extend(
+            (obj, _deltaAttributes(attributes, baseStates.get(id(obj), {})))
+            for obj, attributes in objects
+        )
+    return Checkpoint(sim.currentTime, tick, states, sim.random.getstate(),
+                      base, elapsed)
+
+
+def restoreCheckpoint(sim, checkpoint):
+    """Puts the simulation sim back in the state of checkpoint, which must
+    have been taken on sim."""
+    trainsBefore = list(sim.trains)
+    autoRouteSetter = sim.autoRouteSetter
+    # Trains created after the checkpoint are removed from the list
+    sim.trainListModel.beginResetModel()
+    simState = checkpoint.attributes(*checkpoint.states[0])
+    for name, value in simState.items():
+        setattr(sim, name, _copyValue(value))
+    for obj, state in checkpoint.states[1:]:
+        attributes = vars(obj)
+        attributes.clear()
+        attributes.update(_copyAttributes(checkpoint.attributes(obj, state)))
+    sim.random.setstate(checkpoint.randomState)
+    sim.trainListModel.endResetModel()
+
+    # Signal connections are not part of the attributes
+    restoredTrains = {id(train) for train in sim.trains}
+    for train in trainsBefore:
+        if id(train) not in restoredTrains:
+            # Created after the checkpoint, e.g. by splitting a train
+            sim.timeElapsed.disconnect(train.advance)
+            sim.timeChanged.disconnect(train.activate)
+    if sim.autoRouteSetter is not autoRouteSetter:
+        if autoRouteSetter is not None:
+            sim.timeElapsed.disconnect(autoRouteSetter.update)
+        if sim.autoRouteSetter is not None:
+            sim.timeElapsed.connect(sim.autoRouteSetter.update)
+    if sim.forecaster is not None:
+        # Derived from the state, so computed again
+        sim.forecaster.reset()
+        sim.forecaster.update(0)
+    if sim.changeTracker is not None:
+        sim.changeTracker.resync()
+    for ti in sim.trackItems.values():
+        ti.updateGraphics()
+
+
+class CheckpointRing:
+    """Bounded list of checkpoints, which are spaced further apart as they get
+    older. The first checkpoint, usually the base of the others, and the last
+    one are always kept."""
+
+    def __init__(self, capacity):
+        """
+        :param capacity: maximum number of checkpoints kept
+        """
+        self.capacity = max(capacity, 3)
+        self.checkpoints = []
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def append(self, checkpoint):
+        """Adds checkpoint, which must have an elapsed time greater than the
+        others, and drops an older one if the ring is full."""
+        self.checkpoints.append(checkpoint)
+        if len(self.checkpoints) > self.capacity:
+            self._dropOne()
+
+    def _dropOne(self):
+        # Dropping a checkpoint merges the intervals on both sides of it:
+        # drop the one whose merged interval is the shortest compared with
+        # its age, so that intervals end up proportional to their age.
+        cps = self.checkpoints
+        latest = cps[-1].elapsed
+
+        def cost(i):
+            gap = cps[i + 1].elapsed - cps[i - 1].elapsed
+            return gap / (latest - cps[i + 1].elapsed + gap)
+
+        del cps[min(range(1, len(cps) - 1), key=cost)]
+
+    def before(self, elapsed):
+        """Returns the last checkpoint taken at or before elapsed, or the
+        first one."""
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint.elapsed <= elapsed:
+                return checkpoint
+        return self.checkpoints[0]
+
+    def truncate(self, elapsed):
+        """Drops the checkpoints taken after elapsed."""
+        while len(self.checkpoints) > 1 and \
+                self.checkpoints[-1].elapsed > elapsed:
+            self.checkpoints.pop()
+
+
+class Rewinder(QtCore.QObject):
+    """Takes a checkpoint of a running game every interval simulated seconds
+    and rewinds the game to a previous time."""
+
+    MSECS_PER_DAY = 24 * 3600 * 1000
+
+    rewound = QtCore.pyqtSignal(QtCore.QTime)
+
+    def __init__(self, sim, interval=60, capacity=24):
+        """
+        :param sim: the simulation, which must run in this process
+        :param interval: simulated seconds between two checkpoints
+        :param capacity: maximum number of checkpoints kept
+        """
+        super().__init__(sim)
+        self.simulation = sim
+        self.interval = interval * 1000
+        self.elapsed = 0
+        self._lastTime = sim.currentTime
+        self.base = takeCheckpoint(sim, elapsed=0)
+        self.ring = CheckpointRing(capacity)
+        self.ring.append(self.base)
+        # Connected after the simulation timer slot: checkpoints are taken
+        # between ticks
+        sim._timer.timeout.connect(self.onTick)
+
+    def _updateElapsed(self):
+        time = self.simulation.currentTime
+        self.elapsed += self._lastTime.msecsTo(time) % self.MSECS_PER_DAY
+        self._lastTime = time
+
+    def elapsedAt(self, time):
+        """Returns the game time elapsed at time, the last time the game
+        clock showed time."""
+        self._updateElapsed()
+        return self.elapsed - \
+            time.msecsTo(self._lastTime) % self.MSECS_PER_DAY
+
+    @property
+    def earliestTime(self):
+        """Earliest time to which the game can be rewound."""
+        return self.ring.checkpoints[0].time
+
+    @QtCore.pyqtSlot()
+    def onTick(self):
+        self._updateElapsed()
+        if self.elapsed - self.ring.checkpoints[-1].elapsed >= self.interval:
+            self.ring.append(takeCheckpoint(self.simulation, base=self.base,
+                                            elapsed=self.elapsed))
+
+    def rewind(self, time):
+        """Puts the game back in its state at time, which must be between
+        :attr:`earliestTime` and the current time, by restoring the last
+        checkpoint before time and running the simulation from it. The
+        checkpoints after time are dropped."""
+        sim = self.simulation
+        target = self.elapsedAt(time)
+        checkpoint = self.ring.before(target)
+        restoreCheckpoint(sim, checkpoint)
+        self.ring.truncate(checkpoint.elapsed)
+        self.elapsed = checkpoint.elapsed
+        self._lastTime = sim.currentTime
+        views = sim.scene.views()
+        for view in views:
+            view.setUpdatesEnabled(False)
+        try:
+            while self.elapsed < target:
+                sim.timerOut()
+                self._updateElapsed()
+        finally:
+            for view in views:
+                view.setUpdatesEnabled(True)
+        sim.messageLogger.addMessage(
+            self.tr("Game rewound to %s")
+            % sim.currentTime.toString("hh:mm:ss"),
+            logger.Message.SOFTWARE_MSG
+        )
+        self.rewound.emit(sim.currentTime)
+
+    def close(self):
+        """Stops taking checkpoints."""
+        self.simulation._timer.timeout.disconnect(self.onTick)
@@ -18,24 +18,31 @@
 #   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
+import contextlib
 import copy
+import functools
+import itertools
 import zipfile
 
 import simplejson as json
-from Qt import QtCore, QtWidgets, Qt
+from Qt import QtCore, QtGui, QtWidgets, Qt
 
 from ts2 import __FILE_FORMAT__
 from ts2 import simulation
 from ts2 import utils, trains
 from ts2.routing import position, route
 from ts2.scenery import abstract, placeitem, lineitem, platformitem, \
-    invisiblelinkitem, enditem, pointsitem, textitem
+    invisiblelinkitem, enditem, pointsitem, textitem, spatialindex
 from ts2.scenery.signals import signalitem
-from ts2.editor import editorscenebackground
+from ts2.editor import editorscenebackground, undo
 from ts2.game import logger
 
 translate = QtWidgets.qApp.translate
 
+SNAP_DISTANCE = 8.0
+"""Distance in pixels under which a dragged end of a TrackItem is snapped to
+the end of another TrackItem."""
+
 
 def json_hook(dct):
     """Hook method for json.load()."""
@@ -111,7 +118,7 @@ class OptionsModel(QtCore.QAbstractTableModel):
         if role == Qt.EditRole:
             if index.column() == 1:
                 optionKey = str(index.sibling(index.row(), 0).data())
-                self._editor.setOption(optionKey, value)
+                self._editor.editOption(optionKey, value)
                 return True
         return False
 
@@ -226,7 +233,11 @@ class Editor(simulation.Simulation):
         self._selectedRoute = None
         self._selectedTrain = None
         self._selectedItems = []
+        self._selectedIds = set()
         self._clipbooard = []
+        self._itemsIndex = spatialindex.GridIndex()
+        self._endsIndex = spatialindex.GridIndex(cellSize=20.0)
+        self.undoStack = undo.UndoStack(parent=self)
 
         self._displayedPositionGI = position.PositionGraphicsItem(self)
         self.registerGraphicsItem(self._displayedPositionGI)
@@ -240,6 +251,8 @@ class Editor(simulation.Simulation):
         self.updatePlaces()
         for ti in self.trackItems.values():
             ti.initialize(self)
+        for ti in self.trackItems.values():
+            self._indexTrackItem(ti)
         self.adjustSceneBackground()
         try:
             self._nextId = max(self._trackItems.keys()) + 1
@@ -259,6 +272,7 @@ class Editor(simulation.Simulation):
         if self.validateScenery():
             for rte in self.routes.values():
                 rte.initialize(self)
+            self.rebuildRoutesIndex()
             try:
                 self._nextRouteId = max(self._routes.keys()) + 1
             except ValueError:
@@ -267,6 +281,7 @@ class Editor(simulation.Simulation):
             trainType.initialize(self)
         for service in self.services.values():
             service.initialize(self)
+        self.buildTimetables()
         for train in self.trains:
             train.initialize(self)
         self._trains.sort(key=lambda x: x.currentService.lines and
@@ -367,12 +382,10 @@ class Editor(simulation.Simulation):
 
     def place(self, placeCode):
         """Returns the place defined by placeCode. Reimplemented from
-        Simulation so as not to rely on the places dictionary."""
+        Simulation to return None for unknown place codes, since they may be
+        typed in by the user."""
         if placeCode is not None and placeCode != "":
-            for ti in self._trackItems.values():
-                if isinstance(ti, placeitem.Place) \
-                        and ti.placeCode == placeCode:
-                    return ti
+            return self._places.get(placeCode)
         return None
 
     def checkSimulation(self):
@@ -436,6 +449,7 @@ class Editor(simulation.Simulation):
     def importServicesFromFile(self, fileName):
         """Imports the services from the ts2 formatted CSV file given by
         fileName, deleting any previous service in the editor if any."""
+        oldServices = self._services
         self._services = {}
         allowedHeaders = [
             "serviceCode", "description", "nextServiceCode", "autoReverse",
@@ -486,6 +500,19 @@ class Editor(simulation.Simulation):
                 )
                 self.services[serviceCode].initialize(self)
         file.close()
+        self.buildTimetables()
+        self.pushCollectionCommand(
+            self.tr("Import services"), self._servicesModel,
+            functools.partial(self._setServices, oldServices),
+            functools.partial(self._setServices, self._services),
+            sum(undo.objectSize(service) + sum(undo.objectSize(line)
+                                               for line in service.lines)
+                for service in oldServices.values())
+        )
+
+    def _setServices(self, services):
+        self._services = services
+        self.buildTimetables()
 
     def registerGraphicsItem(self, graphicItem):
         """Adds the graphicItem to the scene or to the libraryScene.
@@ -587,17 +614,44 @@ class Editor(simulation.Simulation):
         else:
             ti = abstract.TrackItem(parameters)
         ti.initialize(self)
-        self.expandBackgroundTo(ti)
         self._trackItems[self._nextId] = ti
         self._nextId += 1
+        self.updateTrackItemsGeometry([ti])
         self.updateSelection()
+        self.pushCommand(undo.TrackItemsCommand(self.tr("Create item"), self,
+                                                added=[ti]))
         return ti
 
     def deleteTrackItem(self, tiId):
         """Delete the TrackItem given by tiId."""
-        tiId = int(tiId)
-        self._trackItems[tiId].removeAllGraphicsItems()
-        del self._trackItems[tiId]
+        ti = self._trackItems[int(tiId)]
+        self.removeTrackItem(ti)
+        self.pushCommand(undo.TrackItemsCommand(self.tr("Delete item"), self,
+                                                removed=[ti]))
+
+    def removeTrackItem(self, ti):
+        """Removes the TrackItem ti from the scenery, keeping it unchanged so
+        that it can be put back with restoreTrackItem()."""
+        if isinstance(ti, placeitem.Place):
+            self.unindexPlace(ti)
+        elif isinstance(ti, lineitem.LineItem):
+            self.unindexLineItem(ti)
+        if ti.tiId in self._selectedIds:
+            self.removeItemFromSelection(ti)
+        ti.removeAllGraphicsItems()
+        self._unindexTrackItem(ti)
+        del self._trackItems[ti.tiId]
+
+    def restoreTrackItem(self, ti):
+        """Puts back on the scenery the TrackItem ti, which has been removed
+        with removeTrackItem()."""
+        self._trackItems[ti.tiId] = ti
+        if isinstance(ti, placeitem.Place):
+            self.indexPlace(ti)
+        elif isinstance(ti, lineitem.LineItem):
+            self.indexLineItem(ti)
+        ti.addAllGraphicsItems()
+        self.updateTrackItemsGeometry([ti])
 
     def deleteTrackItemLinks(self):
         """Delete all links between TrackItems"""
@@ -616,7 +670,10 @@ class Editor(simulation.Simulation):
         :type pos: QtCore.QPointF
         :param clickPos: is the position in the item's coordinates on which the
         mouse was clicked. it is used only if point has "origin" in its name.
-        point is the property of the TrackItem that will be modified."""
+        point is the property of the TrackItem that will be modified.
+
+        When a single item is moved by one of its ends, the end is snapped to
+        the end of another item closer than SNAP_DISTANCE."""
         if len(self.selectedItems) > 1:
             point = "origin"
         trackItem = self.trackItem(int(tiId))
@@ -624,36 +681,92 @@ class Editor(simulation.Simulation):
             pos -= clickPos
         pos = QtCore.QPointF(round(pos.x() / self.grid) * self.grid,
                              round(pos.y() / self.grid) * self.grid)
+        if len(self.selectedItems) <= 1 and \
+           point in ("origin", "start", "end") and \
+           self._linkEnds(trackItem):
+            pos = self.snapToEnd(pos, trackItem)
         translation = pos - getattr(trackItem, point)
+        moves = []
+        # Each setter updates the graphics of its item, only the spatial index
+        # and the scene background are updated once for all the items
         for ti in self.selectedItems:
-            currentPos = getattr(ti, point)
+            currentPos = QtCore.QPointF(getattr(ti, point))
             setattr(ti, point, currentPos + translation)
-            self.expandBackgroundTo(ti)
+            moves.append((ti, currentPos, QtCore.QPointF(getattr(ti, point))))
+        self.updateTrackItemsGeometry(self.selectedItems)
+        self.pushCommand(undo.MoveCommand(self.tr("Move items"), point,
+                                          moves))
         # ti.trackItemClicked.emit(int(tiId))
 
-    def expandBackgroundTo(self, trackItem):
-        """Expands the EditorSceneBackground to 300px around the given
-        TrackItem, if it is not already the case."""
-        tl = trackItem.graphicsItem.boundingRect().topLeft() + \
-            trackItem.graphicsItem.pos() + QtCore.QPointF(-300, -300)
-        br = trackItem.graphicsItem.boundingRect().bottomRight() + \
-            trackItem.graphicsItem.pos() + QtCore.QPointF(300, 300)
+    # ## Spatial index ######################################################
+
+    @staticmethod
+    def _linkEnds(ti):
+        """Returns the list of (name, point) of the ends through which ti can
+        be linked to other items."""
+        if isinstance(ti, (placeitem.Place, platformitem.PlatformItem,
+                           textitem.TextItem)):
+            return []
+        ends = [("origin", ti.origin), ("end", ti.end)]
+        if isinstance(ti, pointsitem.PointsItem):
+            ends.append(("reverse", ti.reverse))
+        return ends
+
+    def _indexTrackItem(self, ti):
+        rect = QtCore.QRectF()
+        for gi in ti.graphicsItems:
+            rect = rect.united(gi.sceneBoundingRect())
+        self._itemsIndex.insert(ti.tiId, rect)
+        for name in ("origin", "end", "reverse"):
+            self._endsIndex.remove((ti.tiId, name))
+        for name, point in self._linkEnds(ti):
+            self._endsIndex.insert((ti.tiId, name), point)
+
+    def _unindexTrackItem(self, ti):
+        self._itemsIndex.remove(ti.tiId)
+        for name in ("origin", "end", "reverse"):
+            self._endsIndex.remove((ti.tiId, name))
+
+    def updateTrackItemsGeometry(self, trackItems):
+        """Updates the spatial index after trackItems have been moved or
+        resized, and expands the scene background to them."""
+        for ti in trackItems:
+            if self._trackItems.get(ti.tiId) is ti:
+                self._indexTrackItem(ti)
+        self.expandSceneBackground()
+
+    def trackItemsInRect(self, rect):
+        """Returns the list of the trackItems whose bounding rect intersects
+        rect, in scene coordinates."""
+        return [self._trackItems[tiId]
+                for tiId in self._itemsIndex.itemsInRect(rect)]
+
+    def snapToEnd(self, pos, trackItem=None):
+        """Returns the end of another trackItem than trackItem which is the
+        nearest to pos within SNAP_DISTANCE, or pos if there is none."""
+        tiId = trackItem.tiId if trackItem is not None else None
+        key = self._endsIndex.nearest(pos, SNAP_DISTANCE,
+                                      lambda key: key[0] != tiId)
+        if key is None:
+            return pos
+        return self._endsIndex.rect(key).topLeft()
+
+    def expandSceneBackground(self):
+        """Expands the EditorSceneBackground to 300px around all the
+        trackItems, if it is not already the case."""
+        bounds = self._itemsIndex.bounds()
+        if bounds.isNull():
+            return
         rect = self._sceneBackground.rect()
-        if not rect.contains(tl):
-            rect.setLeft(min(tl.x(), rect.left()))
-            rect.setTop(min(tl.y(), rect.top()))
-        if not rect.contains(br):
-            rect.setRight(max(br.x(), rect.right()))
-            rect.setBottom(max(br.y(), rect.bottom()))
-        self._sceneBackground.setRect(rect)
-        self._sceneBackground.update()
+        newRect = rect.united(bounds.adjusted(-300, -300, 300, 300))
+        if newRect != rect:
+            self._sceneBackground.setRect(newRect)
 
     def adjustSceneBackground(self):
         """Adjusts the EditorSceneBackground to 300px around all trackitems of
         the scene"""
         self._sceneBackground.setRect(QtCore.QRectF(0, 0, 800, 600))
-        for ti in self._trackItems.values():
-            self.expandBackgroundTo(ti)
+        self.expandSceneBackground()
 
     @QtCore.pyqtSlot()
     def validateScenery(self):
@@ -684,11 +797,17 @@ class Editor(simulation.Simulation):
         .. todo:: Maybe this should return Error string or None
         """
         if self.context == utils.Context.EDITOR_ROUTES:
-            if (self._preparedRoute is not None) and \
-               (self._preparedRoute not in self._routes.values()):
-                routeNum = self._preparedRoute.routeNum
-                self._routes[routeNum] = self._preparedRoute
+            rte = self._preparedRoute
+            if (rte is not None) and \
+               (rte.routeNum not in self._routes) and \
+               (self.findRoute(rte.beginSignal, rte.endSignal) is None):
+                self._insertRoute(rte)
                 self.deselectRoute()
+                self.pushCollectionCommand(
+                    self.tr("Add route"), self._routesModel,
+                    functools.partial(self._removeRoute, rte),
+                    functools.partial(self._insertRoute, rte)
+                )
                 return True
         self.deselectRoute()
         return False
@@ -696,8 +815,23 @@ class Editor(simulation.Simulation):
     def deleteRoute(self, routeNum):
         """Deletes the route defined by routeNum"""
         if self.context == utils.Context.EDITOR_ROUTES:
-            self.deselectRoute()
-            del self._routes[routeNum]
+            rte = self._routes[routeNum]
+            self._removeRoute(rte)
+            self.pushCollectionCommand(
+                self.tr("Delete route"), self._routesModel,
+                functools.partial(self._insertRoute, rte),
+                functools.partial(self._removeRoute, rte),
+                undo.objectSize(rte)
+            )
+
+    def _insertRoute(self, rte):
+        self._routes[rte.routeNum] = rte
+        self.indexRoute(rte)
+
+    def _removeRoute(self, rte):
+        self.deselectRoute()
+        self.unindexRoute(rte)
+        del self._routes[rte.routeNum]
 
     @QtCore.pyqtSlot(int)
     def prepareRoute(self, signalId):
@@ -783,7 +917,9 @@ class Editor(simulation.Simulation):
         """Sets the trainHead of the selectedTrain to position if valid"""
         if self.context == utils.Context.EDITOR_TRAINS:
             if self._selectedTrain is not None and pos is not None:
-                self._selectedTrain.trainHead = pos
+                self.editAttributes(self.tr("Move train"),
+                                    [(self._selectedTrain, "trainHead", pos)],
+                                    self._trainsModel)
                 self.selectTrain(self.trains.index(self._selectedTrain))
 
     def addTrainType(self, code):
@@ -798,15 +934,29 @@ class Editor(simulation.Simulation):
                 "emergBraking": 1.5,
                 "length": 100
             }
-            self._trainTypes[code] = trains.TrainType(parameters)
-            self._trainTypes[code].initialize(self)
+            trainType = trains.TrainType(parameters)
+            trainType.initialize(self)
+            self._trainTypes[code] = trainType
+            self.pushCollectionCommand(
+                self.tr("Add train type"), self._trainTypesModel,
+                functools.partial(self._trainTypes.pop, code),
+                functools.partial(self._trainTypes.__setitem__, code,
+                                  trainType)
+            )
             return True
         return False
 
     def deleteTrainType(self, code):
         """Deletes the trainType defined by code"""
         if self.context == utils.Context.EDITOR_TRAINTYPES:
-            del self._trainTypes[code]
+            trainType = self._trainTypes.pop(code)
+            self.pushCollectionCommand(
+                self.tr("Delete train type"), self._trainTypesModel,
+                functools.partial(self._trainTypes.__setitem__, code,
+                                  trainType),
+                functools.partial(self._trainTypes.pop, code),
+                undo.objectSize(trainType)
+            )
 
     def addService(self, code):
         """Adds an empty Service to the services list."""
@@ -817,15 +967,37 @@ class Editor(simulation.Simulation):
                 "nextServiceCode": "",
                 "autoReverse": 0
             }
-            self._services[code] = trains.Service(parameters)
-            self._services[code].initialize(self)
+            service = trains.Service(parameters)
+            service.initialize(self)
+            self._insertService(service)
+            self.pushCollectionCommand(
+                self.tr("Add service"), self._servicesModel,
+                functools.partial(self._removeService, service),
+                functools.partial(self._insertService, service)
+            )
             return True
         return False
 
     def deleteService(self, code):
         """Deletes the service defined by code"""
         if self.context == utils.Context.EDITOR_SERVICES:
-            del self._services[code]
+            service = self._services[code]
+            self._removeService(service)
+            self.pushCollectionCommand(
+                self.tr("Delete service"), self._servicesModel,
+                functools.partial(self._insertService, service),
+                functools.partial(self._removeService, service),
+                undo.objectSize(service) + sum(undo.objectSize(line)
+                                               for line in service.lines)
+            )
+
+    def _insertService(self, service):
+        self._services[service.serviceCode] = service
+        service.addToTimetables()
+
+    def _removeService(self, service):
+        service.removeFromTimetables()
+        del self._services[service.serviceCode]
 
     def addServiceLine(self, service, index):
         """Adds a service line to service at the current index"""
@@ -840,26 +1012,62 @@ class Editor(simulation.Simulation):
             serviceLine = trains.ServiceLine(parameters)
             serviceLine.initialize(service)
             service.lines.insert(index, serviceLine)
+            self.pushCollectionCommand(
+                self.tr("Add service line"), self._serviceLinesModel,
+                functools.partial(self._removeServiceLine, service, index),
+                functools.partial(self._insertServiceLine, service, index,
+                                  serviceLine)
+            )
 
     def deleteServiceLine(self, service, index):
         """Deletes the service line of service defined by index"""
         if self.context == utils.Context.EDITOR_SERVICES:
-            del service.lines[index]
+            line = self._removeServiceLine(service, index)
+            self.pushCollectionCommand(
+                self.tr("Delete service line"), self._serviceLinesModel,
+                functools.partial(self._insertServiceLine, service, index,
+                                  line),
+                functools.partial(self._removeServiceLine, service, index),
+                undo.objectSize(line)
+            )
+
+    def _insertServiceLine(self, service, index, line):
+        service.lines.insert(index, line)
+        if line.place is not None:
+            line.place.addTimetable(line)
+
+    def _removeServiceLine(self, service, index):
+        line = service.lines.pop(index)
+        if line.place is not None:
+            line.place.removeTimetable(line)
+        return line
 
     def setupTrainsFromServices(self):
         """Removes all trains instances and creates a train for each relevant
         service, that is each service which is not following another one (i.e
         a service which is not the nextService of another service)."""
+        with self.undoStack.macro(self.tr("Setup trains from services")):
+            self._setupTrainsFromServices()
+
+    def _setupTrainsFromServices(self):
+        oldTrains = self._trains
         self._trains = []
-        serviceList = list(self.services.keys())
+        self.pushCollectionCommand(
+            self.tr("Delete trains"), self._trainsModel,
+            functools.partial(self._setTrains, oldTrains),
+            functools.partial(self._setTrains, [])
+        )
+        nextServiceCodes = set()
         for s in self.services.values():
             if s.nextServiceCode is not None and \
                s.nextServiceCode != "":
-                try:
-                    serviceList.remove(s.nextServiceCode)
-                except ValueError:
+                if s.nextServiceCode in self.services:
+                    nextServiceCodes.add(s.nextServiceCode)
+                else:
                     QtCore.qDebug("nextServiceCode: %s does not exist" %
                                   s.nextServiceCode)
+        serviceList = [sc for sc in self.services.keys()
+                       if sc not in nextServiceCodes]
         for sc in serviceList:
             train = self.addNewTrain()
             train.serviceCode = sc
@@ -890,7 +1098,11 @@ class Editor(simulation.Simulation):
         if self.context == utils.Context.EDITOR_TRAINS:
             if self._selectedTrain is not None:
                 reversedHead = self._selectedTrain.trainHead.reversed()
-                self._selectedTrain.trainHead = reversedHead
+                self.editAttributes(
+                    self.tr("Reverse train"),
+                    [(self._selectedTrain, "trainHead", reversedHead)],
+                    self._trainsModel
+                )
                 self.selectTrain(self.trains.index(self._selectedTrain))
 
     def addNewTrain(self):
@@ -900,8 +1112,8 @@ class Editor(simulation.Simulation):
             if pos is None:
                 raise Exception("No valid position found. Check scenery.")
             parameters = {
-                "serviceCode": list(self.services.values())[0].serviceCode,
-                "trainTypeCode": list(self.trainTypes.values())[0].code,
+                "serviceCode": next(iter(self.services.values())).serviceCode,
+                "trainTypeCode": next(iter(self.trainTypes.values())).code,
                 "speed": 0.0,
                 "trainHead": pos,
                 "appearTime": "00:00:00",
@@ -910,21 +1122,46 @@ class Editor(simulation.Simulation):
             }
             train = trains.Train(parameters)
             train.initialize(self)
+            index = len(self._trains)
             self._trains.append(train)
             self.trainsChanged.emit()
+            self.pushCollectionCommand(
+                self.tr("Add train"), self._trainsModel,
+                functools.partial(self._removeTrain, index),
+                functools.partial(self._insertTrain, index, train)
+            )
             return train
 
     def deleteTrain(self, index):
         """Deletes the train assigned to serviceCode"""
         if self.context == utils.Context.EDITOR_TRAINS:
-            del self.trains[index]
-            self.trainsChanged.emit()
+            train = self._removeTrain(index)
+            self.pushCollectionCommand(
+                self.tr("Delete train"), self._trainsModel,
+                functools.partial(self._insertTrain, index, train),
+                functools.partial(self._removeTrain, index),
+                undo.objectSize(train)
+            )
+
+    def _insertTrain(self, index, train):
+        self._trains.insert(index, train)
+        self.trainsChanged.emit()
+
+    def _removeTrain(self, index):
+        train = self._trains.pop(index)
+        self.trainsChanged.emit()
+        return train
+
+    def _setTrains(self, trainList):
+        self._trains = trainList
+        self.trainsChanged.emit()
 
     @QtCore.pyqtSlot(int)
     def updateContext(self, tabNum):
         """Updates the context of the editor, depending on the tab selected
         and given by tabNum."""
         self.unselectTrains()
+        previousContext = self._context
 
         if tabNum == 0:
             self._context = utils.Context.EDITOR_GENERAL
@@ -939,6 +1176,11 @@ class Editor(simulation.Simulation):
         elif tabNum == 5:
             self._context = utils.Context.EDITOR_TRAINS
 
+        if self._context == utils.Context.EDITOR_SCENERY and \
+                previousContext != utils.Context.EDITOR_SCENERY:
+            # The bounding rects of the items depend on the context
+            self.updateTrackItemsGeometry(self._trackItems.values())
+
         # QtCore.qDebug(">> List of selected TI")
         # for ti in self.selectedItems:
             # QtCore.qDebug("TI selected: %i" %ti.tiId )
@@ -951,25 +1193,62 @@ class Editor(simulation.Simulation):
     @QtCore.pyqtSlot()
     def updateSelection(self):
         """Updates the trackItem selection."""
-        selectedItems = self.selectedItems.copy()
-        for ti in selectedItems:
-            self.removeItemFromSelection(ti)
-
         # Synchronise trackItem selection with graphicsItem selection
-        for gi in self.scene.selectedItems():
-            self.addItemToSelection(gi.trackItem)
+        self.setSelection(gi.trackItem for gi in self.scene.selectedItems())
+
+    def setSelection(self, trackItems):
+        """Sets the trackItem selection to trackItems. Only the items whose
+        state changes are updated and selectionChanged is emitted once."""
+        selectedItems = []
+        selectedIds = set()
+        for ti in trackItems:
+            if ti.tiId not in selectedIds:
+                selectedIds.add(ti.tiId)
+                selectedItems.append(ti)
+        changed = False
+        for ti in self._selectedItems:
+            if ti.tiId not in selectedIds:
+                ti.selected = False
+                changed = True
+        for ti in selectedItems:
+            if ti.tiId not in self._selectedIds:
+                ti.selected = True
+                changed = True
+        self._selectedItems[:] = selectedItems
+        self._selectedIds = selectedIds
+        if changed:
+            self.selectionChanged.emit()
+
+    def selectItemsInRect(self, rect, keptItems=()):
+        """Selects the graphics items whose shape intersects rect, in scene
+        coordinates, and deselects the others except keptItems."""
+        path = QtGui.QPainterPath()
+        path.addRect(rect)
+        hits = [gi for ti in self.trackItemsInRect(rect)
+                for gi in ti.graphicsItems
+                if gi.collidesWithPath(gi.mapFromScene(path))]
+        self.scene.blockSignals(True)
+        try:
+            self.scene.clearSelection()
+            for gi in itertools.chain(keptItems, hits):
+                gi.setSelected(True)
+        finally:
+            self.scene.blockSignals(False)
+        self.updateSelection()
 
     def addItemToSelection(self, ti, selected=True):
         """Add the trackItem ti to the selection if selected is True and
         remove it if it is False."""
         if selected:
             ti.selected = True
-            if ti not in self.selectedItems:
-                self.selectedItems.append(ti)
+            if ti.tiId not in self._selectedIds:
+                self._selectedIds.add(ti.tiId)
+                self._selectedItems.append(ti)
         else:
             ti.selected = False
-            if ti in self.selectedItems:
-                self.selectedItems.remove(ti)
+            if ti.tiId in self._selectedIds:
+                self._selectedIds.discard(ti.tiId)
+                self._selectedItems.remove(ti)
         self.selectionChanged.emit()
 
     def removeItemFromSelection(self, ti):
@@ -998,25 +1277,131 @@ class Editor(simulation.Simulation):
             refPos = QtCore.QPointF(0, 0)
         translation = refPos + QtCore.QPointF(100, 100) - \
             self._clipbooard[0].origin
-        for ti in self._clipbooard:
-            newTi = self.createTrackItem(ti.tiTypeStr,
-                                         ti.origin + translation,
-                                         ti.end + translation)
-            newTi.maxSpeed = ti.maxSpeed
-            newTi._realLength = ti.realLength
-            if isinstance(newTi, signalitem.SignalItem):
-                newTi.signalTypeStr = ti.signalTypeStr
-                newTi.reverse = ti.reverse
-                newTi.origin = ti.origin + translation
-            elif isinstance(ti, pointsitem.PointsItem):
-                newTi.commonEnd = ti.commonEnd
-                newTi.normalEnd = ti.normalEnd
-                newTi.reverseEnd = ti.reverseEnd
-                newTi.origin = ti.origin + translation
+        with self.undoStack.macro(self.tr("Paste items")):
+            newItems = []
+            for ti in self._clipbooard:
+                newTi = self.createTrackItem(ti.tiTypeStr,
+                                             ti.origin + translation,
+                                             ti.end + translation)
+                newItems.append(newTi)
+                newTi.maxSpeed = ti.maxSpeed
+                newTi._realLength = ti.realLength
+                if isinstance(newTi, signalitem.SignalItem):
+                    newTi.signalTypeStr = ti.signalTypeStr
+                    newTi.reverse = ti.reverse
+                    newTi.origin = ti.origin + translation
+                elif isinstance(ti, pointsitem.PointsItem):
+                    newTi.commonEnd = ti.commonEnd
+                    newTi.normalEnd = ti.normalEnd
+                    newTi.reverseEnd = ti.reverseEnd
+                    newTi.origin = ti.origin + translation
+            self.updateTrackItemsGeometry(newItems)
 
     @QtCore.pyqtSlot()
     def deleteSelection(self):
         """Delete all the items of the current selection."""
-        for ti in self.selectedItems.copy():
-            self.removeItemFromSelection(ti)
-            self.deleteTrackItem(ti.tiId)
+        with self.undoStack.macro(self.tr("Delete items")):
+            for ti in self.selectedItems.copy():
+                self.removeItemFromSelection(ti)
+                self.deleteTrackItem(ti.tiId)
+
+    # ## Undo/redo ##########################################################
+
+    def pushCommand(self, command):
+        """Records on the undo stack the command of an operation which has
+        just been done in the current context."""
+        command.context = self._context
+        self.undoStack.push(command)
+
+    def pushCollectionCommand(self, text, model, undoFunc, redoFunc, size=0):
+        """Records an operation which added or removed objects shown by
+        model. The model is reset when the operation is undone or redone,
+        since the rows of the editor models follow the order of the
+        collections."""
+        def resetting(func):
+            def apply():
+                model.beginResetModel()
+                try:
+                    func()
+                finally:
+                    model.endResetModel()
+            return apply
+
+        self.pushCommand(undo.FunctionCommand(text, resetting(undoFunc),
+                                              resetting(redoFunc), size))
+
+    def editAttributes(self, text, edits, model=None):
+        """Sets attributes of objects and records the change on the undo
+        stack.
+
+        :param edits: list of (object, attribute, value)
+        :param model: model to notify when the change is undone or redone
+        """
+        changes = []
+        for obj, attribute, value in edits:
+            oldValue = getattr(obj, attribute)
+            setattr(obj, attribute, value)
+            if not undo.sameValue(getattr(obj, attribute), oldValue):
+                changes.append((obj, attribute, oldValue, value))
+        self._updateGeometryOf(obj for obj, attribute, value in edits)
+        if changes:
+            self.pushCommand(undo.AttributeCommand(text, changes, model))
+
+    def editOption(self, key, value):
+        """Sets the option key to value and records the change on the undo
+        stack."""
+        oldValue = self._options.get(key)
+        self.setOption(key, value)
+        if not undo.sameValue(oldValue, value):
+            self.pushCommand(undo.FunctionCommand(
+                self.tr("Edit option"),
+                functools.partial(self._setOptionValue, key, oldValue),
+                functools.partial(self._setOptionValue, key, value),
+                undo.valueSize(oldValue) + undo.valueSize(value)
+            ))
+
+    def _setOptionValue(self, key, value):
+        self.setOption(key, value)
+        model = self._optionsModel
+        model.dataChanged.emit(model.index(0, 0),
+                               model.index(model.rowCount() - 1, 1))
+
+    @contextlib.contextmanager
+    def _commandContext(self, command):
+        """Sets temporarily the context in which command was done, since
+        most setters only work in their own editor context."""
+        context = self._context
+        if command is not None and command.context is not None:
+            if command.context == utils.Context.EDITOR_SCENERY and \
+               self._sceneryValidated:
+                self.invalidateScenery()
+            self._context = command.context
+        try:
+            yield
+        finally:
+            self._context = context
+
+    def _updateGeometryOf(self, objects):
+        """Updates the geometry of the trackItems among objects, whose
+        attributes have been changed."""
+        self.updateTrackItemsGeometry(
+            [obj for obj in objects if isinstance(obj, abstract.TrackItem)]
+        )
+
+    @QtCore.pyqtSlot()
+    def undo(self):
+        """Reverts the last operation."""
+        command = self.undoStack.undoCommand()
+        with self._commandContext(command):
+            self.undoStack.undo()
+            if command is not None:
+                self._updateGeometryOf(command.objects())
+
+    @QtCore.pyqtSlot()
+    def redo(self):
+        """Applies again the last reverted operation."""
+        command = self.undoStack.redoCommand()
+        with self._commandContext(command):
+            self.undoStack.redo()
+            if command is not None:
+                self._updateGeometryOf(command.objects())
@@ -18,12 +18,13 @@
 #   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
-from Qt import QtCore, QtWidgets, Qt
+from Qt import QtCore, QtGui, QtWidgets, Qt
 
 
 class EditorSceneBackground(QtWidgets.QGraphicsRectItem):
     """The EditorSceneBackground is a graphics item set at the background of
-    the editor scene to handle drag and drop events."""
+    the editor scene to handle drag and drop events, and area selection when
+    the view has no drag mode."""
 
     def __init__(self, editor, x, y, width, height):
         """Constructor for the EditorSceneBackground class"""
@@ -31,6 +32,9 @@ class EditorSceneBackground(QtWidgets.QGraphicsRectItem):
         self.setZValue(-100)
         self.setAcceptDrops(True)
         self.editor = editor
+        self._rubberBand = None
+        self._rubberBandOrigin = None
+        self._keptSelection = []
         # pen = QtGui.QPen(Qt.cyan)
         # self.setPen(pen)
 
@@ -38,6 +42,7 @@ class EditorSceneBackground(QtWidgets.QGraphicsRectItem):
         """dragEnterEvent handler for the EditorSceneBackground."""
         if event.mimeData().hasText():
             event.accept()
+            self.editor.undoStack.seal()
             self.update()
 
     def dragMoveEvent(self, event):
@@ -66,12 +71,64 @@ class EditorSceneBackground(QtWidgets.QGraphicsRectItem):
                 clickPos = QtCore.QPointF(float(ox), float(oy))
                 self.editor.moveTrackItem(tiId, event.scenePos(),
                                           clickPos, point)
+                self.editor.undoStack.seal()
         else:
             event.ignore()
 
+    @staticmethod
+    def _isSelectionTool(event):
+        """Returns True if the event comes from a view with the selection
+        tool, i.e. without drag mode."""
+        widget = event.widget()
+        view = widget.parentWidget() if widget is not None else None
+        return isinstance(view, QtWidgets.QGraphicsView) and \
+            view.dragMode() == QtWidgets.QGraphicsView.NoDrag
+
     def mousePressEvent(self, event):
         """Event handler for the mousePressEvent. Empties the current item
-        selection if right button clicked."""
+        selection if right button clicked. Starts an area selection if left
+        button clicked with the selection tool, adding to the current
+        selection if Ctrl is pressed."""
         if event.buttons() == Qt.RightButton:
             self.editor.clearSelection()
+        elif event.button() == Qt.LeftButton and \
+                self._isSelectionTool(event):
+            if event.modifiers() & Qt.ControlModifier:
+                self._keptSelection = self.scene().selectedItems()
+            else:
+                self._keptSelection = []
+                self.editor.clearSelection()
+            self._rubberBandOrigin = event.scenePos()
+            self._rubberBand = QtWidgets.QGraphicsRectItem(
+                QtCore.QRectF(self._rubberBandOrigin, self._rubberBandOrigin)
+            )
+            pen = QtGui.QPen(Qt.white)
+            pen.setStyle(Qt.DashLine)
+            pen.setCosmetic(True)
+            self._rubberBand.setPen(pen)
+            self._rubberBand.setZValue(200)
+            self.scene().addItem(self._rubberBand)
+            event.accept()
+            return
         super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        """Event handler for the mouseMoveEvent. Selects the items in the
+        area selection rectangle."""
+        if self._rubberBand is not None:
+            rect = QtCore.QRectF(self._rubberBandOrigin,
+                                 event.scenePos()).normalized()
+            self._rubberBand.setRect(rect)
+            self.editor.selectItemsInRect(rect, self._keptSelection)
+        else:
+            super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        """Event handler for the mouseReleaseEvent. Ends the area
+        selection."""
+        if self._rubberBand is not None:
+            self.scene().removeItem(self._rubberBand)
+            self._rubberBand = None
+            self._keptSelection = []
+        else:
+            super().mouseReleaseEvent(event)
@@ -109,6 +109,22 @@ class EditorWindow(QtWidgets.QMainWindow):
         self.toolActions.addAction(self.selectionToolAction)
         self.panToolAction.setChecked(True)
 
+        self.undoAction = QtWidgets.QAction(self.tr("&Undo"), self)
+        self.undoAction.setShortcut(QtGui.QKeySequence.Undo)
+        undoActionTip = self.tr("Undo the last operation")
+        self.undoAction.setToolTip(undoActionTip)
+        self.undoAction.setStatusTip(undoActionTip)
+        self.undoAction.setEnabled(False)
+        self.undoAction.triggered.connect(self.undo)
+
+        self.redoAction = QtWidgets.QAction(self.tr("&Redo"), self)
+        self.redoAction.setShortcut(QtGui.QKeySequence.Redo)
+        redoActionTip = self.tr("Redo the last undone operation")
+        self.redoAction.setToolTip(redoActionTip)
+        self.redoAction.setStatusTip(redoActionTip)
+        self.redoAction.setEnabled(False)
+        self.redoAction.triggered.connect(self.redo)
+
         self.copyAction = QtWidgets.QAction(self.tr("&Copy"), self)
         self.copyAction.setShortcut(QtGui.QKeySequence.Copy)
         copyActionTip = self.tr("Copy the current selection to the clipboard")
@@ -158,6 +174,9 @@ class EditorWindow(QtWidgets.QMainWindow):
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.closeAction)
         self.editMenu = self.menuBar().addMenu(self.tr("&Edit"))
+        self.editMenu.addAction(self.undoAction)
+        self.editMenu.addAction(self.redoAction)
+        self.editMenu.addSeparator()
         self.editMenu.addAction(self.panToolAction)
         self.editMenu.addAction(self.selectionToolAction)
         self.editMenu.addSeparator()
@@ -565,6 +584,10 @@ class EditorWindow(QtWidgets.QMainWindow):
         self.trainsView.trainSelected.connect(self.editor.selectTrain)
         self.trainsView.trainsUnselected.connect(self.editor.unselectTrains)
 
+        # Undo/redo
+        self.editor.undoStack.indexChanged.connect(self.updateUndoActions)
+        self.updateUndoActions()
+
         self.validateSceneryBtnClicked()
         self.tabWidget.currentChanged.emit(self.tabWidget.currentIndex())
 
@@ -578,13 +601,15 @@ class EditorWindow(QtWidgets.QMainWindow):
             self.routesView.routeSelected,
             self.servicesView.serviceSelected,
             self.trainsView.trainSelected,
-            self.trainsView.trainsUnselected
+            self.trainsView.trainsUnselected,
+            self.editor.undoStack.indexChanged
         ]
         for signal in signals:
             try:
                 signal.disconnect()
             except TypeError:
                 pass
+        self.editor.messageLogger.close()
 
     closed = QtCore.pyqtSignal()
 
@@ -613,6 +638,8 @@ class EditorWindow(QtWidgets.QMainWindow):
                     closeEvent.ignore()
             else:
                 self.closed.emit()
+            if closeEvent.isAccepted() and self.editor is not None:
+                self.editor.messageLogger.close()
 
     @QtCore.pyqtSlot()
     def setPropertiesModel(self):
@@ -747,8 +774,39 @@ class EditorWindow(QtWidgets.QMainWindow):
 
     @QtCore.pyqtSlot()
     def setSelectionTool(self):
-        """Sets the selection tool."""
-        self.sceneryView.setDragMode(QtWidgets.QGraphicsView.RubberBandDrag)
+        """Sets the selection tool. Area selection is done by the scene
+        background of the editor, which looks up the items in its spatial
+        index."""
+        self.sceneryView.setDragMode(QtWidgets.QGraphicsView.NoDrag)
+
+    @QtCore.pyqtSlot()
+    def undo(self):
+        """Reverts the last operation of the editor."""
+        self.editor.undo()
+        self.setPropertiesModel()
+        self.setDirty("Undo")
+
+    @QtCore.pyqtSlot()
+    def redo(self):
+        """Applies again the last operation reverted in the editor."""
+        self.editor.redo()
+        self.setPropertiesModel()
+        self.setDirty("Redo")
+
+    @QtCore.pyqtSlot()
+    def updateUndoActions(self):
+        """Updates the undo and redo actions with the undo stack state."""
+        undoStack = self.editor.undoStack
+        self.undoAction.setEnabled(undoStack.canUndo())
+        self.undoAction.setText(
+            self.tr("&Undo %s") % undoStack.undoText()
+            if undoStack.canUndo() else self.tr("&Undo")
+        )
+        self.redoAction.setEnabled(undoStack.canRedo())
+        self.redoAction.setText(
+            self.tr("&Redo %s") % undoStack.redoText()
+            if undoStack.canRedo() else self.tr("&Redo")
+        )
 
     @QtCore.pyqtSlot()
     def copyItems(self):
@@ -776,8 +834,7 @@ class EditorWindow(QtWidgets.QMainWindow):
     def selectAll(self):
         """Select all the items on the scene."""
         self.editor.clearSelection()
-        for ti in self.editor.trackItems.values():
-            self.editor.addItemToSelection(ti, True)
+        self.editor.setSelection(self.editor.trackItems.values())
 
     @QtCore.pyqtSlot(int)
     def showHideDockWidgets(self, index):
@@ -0,0 +1,444 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Undo/redo of the editor operations.
+
+Each operation pushes on the :class:`UndoStack` a command holding only the
+delta of the operation: the old and new values of the edited attributes,
+the old and new positions of the moved items, or references to the added
+and removed objects. Undoing or redoing a command therefore takes a time
+proportional to the size of the edit, whatever the size of the simulation.
+"""
+
+import contextlib
+import sys
+
+from Qt import QtCore
+
+UNDO_LIMIT = 16 * 1024 * 1024
+"""Default maximum memory in bytes held by the commands of an UndoStack."""
+
+REFERENCE_SIZE = 8
+"""Size in bytes of a reference to an object which is still in use."""
+
+
+def valueSize(value):
+    """Returns the approximate size in bytes of value, including the
+    values of containers."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(valueSize(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(valueSize(k) + valueSize(v) for k, v in value.items())
+    return size
+
+
+def objectSize(obj):
+    """Returns the approximate size in bytes of obj and of its attributes,
+    for an object which is only referenced by a command."""
+    attributes = getattr(obj, "__dict__", {})
+    return (sys.getsizeof(obj) + sys.getsizeof(attributes) +
+            sum(sys.getsizeof(v) for v in attributes.values()))
+
+
+def sameValue(value1, value2):
+    """Returns True if value1 and value2 are the same value. Values of
+    different types are different, since some classes do not support
+    comparison with None."""
+    return value1 is value2 or (type(value1) is type(value2) and
+                                value1 == value2)
+
+
+class UndoCommand:
+    """Base class of the commands of the :class:`UndoStack`.
+
+    A command is pushed after its operation has been done, so that
+    :meth:`redo` is only called after :meth:`undo`.
+    """
+
+    def __init__(self, text):
+        """Constructor for the UndoCommand class."""
+        self.text = text
+        self.context = None
+        self.sealed = False
+
+    def undo(self):
+        """Reverts the operation."""
+        raise NotImplementedError
+
+    def redo(self):
+        """Applies the operation again."""
+        raise NotImplementedError
+
+    @property
+    def size(self):
+        """Approximate memory in bytes held by this command."""
+        return sys.getsizeof(self)
+
+    def mergeWith(self, command):
+        """Merges command, which has just been done, into this command.
+
+        :return: True if command was merged
+        """
+        return False
+
+    def isObsolete(self):
+        """Returns True if this command does not change anything."""
+        return False
+
+    def objects(self):
+        """Returns the list of the objects whose attributes are changed by
+        this command."""
+        return []
+
+
+class FunctionCommand(UndoCommand):
+    """Command calling undoFunc and redoFunc, which hold the delta of the
+    operation in their arguments."""
+
+    def __init__(self, text, undoFunc, redoFunc, size=0):
+        """Constructor for the FunctionCommand class."""
+        super().__init__(text)
+        self._undoFunc = undoFunc
+        self._redoFunc = redoFunc
+        self._size = size
+
+    def undo(self):
+        self._undoFunc()
+
+    def redo(self):
+        self._redoFunc()
+
+    @property
+    def size(self):
+        return super().size + self._size
+
+
+class AttributeCommand(UndoCommand):
+    """Command setting attributes of objects.
+
+    :param changes: list of (object, attribute, oldValue, newValue)
+    :param model: if not None, the model to notify when the values change
+    """
+
+    def __init__(self, text, changes, model=None):
+        """Constructor for the AttributeCommand class."""
+        super().__init__(text)
+        self._changes = changes
+        self._model = model
+
+    def _notify(self):
+        model = self._model
+        if model is not None and model.rowCount() and model.columnCount():
+            model.dataChanged.emit(
+                model.index(0, 0),
+                model.index(model.rowCount() - 1, model.columnCount() - 1)
+            )
+
+    def undo(self):
+        for obj, attribute, oldValue, newValue in reversed(self._changes):
+            setattr(obj, attribute, oldValue)
+        self._notify()
+
+    def redo(self):
+        for obj, attribute, oldValue, newValue in self._changes:
+            setattr(obj, attribute, newValue)
+        self._notify()
+
+    @property
+    def size(self):
+        return super().size + sum(
+            REFERENCE_SIZE + valueSize(oldValue) + valueSize(newValue)
+            for obj, attribute, oldValue, newValue in self._changes
+        )
+
+    def isObsolete(self):
+        return all(sameValue(oldValue, newValue)
+                   for obj, attribute, oldValue, newValue in self._changes)
+
+    def objects(self):
+        return [change[0] for change in self._changes]
+
+
+class MoveCommand(UndoCommand):
+    """Command moving the point of track items.
+
+    The successive moves of the same items during a drag are merged into a
+    single command, until the command is sealed.
+
+    :param moves: list of (trackItem, oldPos, newPos)
+    """
+
+    def __init__(self, text, point, moves):
+        """Constructor for the MoveCommand class."""
+        super().__init__(text)
+        self._point = point
+        self._moves = moves
+
+    def _apply(self, positionIndex):
+        for move in self._moves:
+            trackItem = move[0]
+            setattr(trackItem, self._point, QtCore.QPointF(move[positionIndex]))
+
+    def undo(self):
+        self._apply(1)
+
+    def redo(self):
+        self._apply(2)
+
+    @property
+    def size(self):
+        return super().size + len(self._moves) * (
+            REFERENCE_SIZE + 2 * sys.getsizeof(QtCore.QPointF())
+        )
+
+    def mergeWith(self, command):
+        if type(command) is not MoveCommand or \
+           command._point != self._point or \
+           len(command._moves) != len(self._moves) or \
+           any(move[0] is not other[0]
+               for move, other in zip(self._moves, command._moves)):
+            return False
+        self._moves = [(move[0], move[1], other[2])
+                       for move, other in zip(self._moves, command._moves)]
+        return True
+
+    def isObsolete(self):
+        return all(move[1] == move[2] for move in self._moves)
+
+    def objects(self):
+        return [move[0] for move in self._moves]
+
+
+class TrackItemsCommand(UndoCommand):
+    """Command adding and removing track items. The removed items are kept
+    by the command, so that they can be restored as they were."""
+
+    def __init__(self, text, editor, added=(), removed=()):
+        """Constructor for the TrackItemsCommand class."""
+        super().__init__(text)
+        self._editor = editor
+        self._added = list(added)
+        self._removed = list(removed)
+
+    def undo(self):
+        for trackItem in self._added:
+            self._editor.removeTrackItem(trackItem)
+        for trackItem in self._removed:
+            self._editor.restoreTrackItem(trackItem)
+
+    def redo(self):
+        for trackItem in self._removed:
+            self._editor.removeTrackItem(trackItem)
+        for trackItem in self._added:
+            self._editor.restoreTrackItem(trackItem)
+
+    @property
+    def size(self):
+        # Items referenced by the command only are counted in full.
+        return super().size + sum(
+            objectSize(trackItem) for trackItem in self._added + self._removed
+        )
+
+
+class MacroCommand(UndoCommand):
+    """Command grouping the commands pushed between
+    :meth:`UndoStack.beginMacro` and :meth:`UndoStack.endMacro`."""
+
+    def __init__(self, text):
+        """Constructor for the MacroCommand class."""
+        super().__init__(text)
+        self.commands = []
+
+    def undo(self):
+        for command in reversed(self.commands):
+            command.undo()
+
+    def redo(self):
+        for command in self.commands:
+            command.redo()
+
+    @property
+    def size(self):
+        return super().size + sum(c.size for c in self.commands)
+
+    def isObsolete(self):
+        return all(c.isObsolete() for c in self.commands)
+
+    def objects(self):
+        return [obj for c in self.commands for obj in c.objects()]
+
+
+class UndoStack(QtCore.QObject):
+    """Stack of the commands of the editor.
+
+    The total size of the commands is kept below limit bytes by discarding
+    the oldest commands.
+    """
+
+    def __init__(self, limit=UNDO_LIMIT, parent=None):
+        """Constructor for the UndoStack class."""
+        super().__init__(parent)
+        self.limit = limit
+        self._commands = []
+        self._sizes = []
+        self._totalSize = 0
+        self._index = 0
+        self._macros = []
+
+    indexChanged = QtCore.pyqtSignal(int)
+
+    @property
+    def totalSize(self):
+        """Approximate memory in bytes held by the commands."""
+        return self._totalSize
+
+    def count(self):
+        return len(self._commands)
+
+    def index(self):
+        """Returns the number of commands which can be undone."""
+        return self._index
+
+    def canUndo(self):
+        return self._index > 0 and not self._macros
+
+    def canRedo(self):
+        return self._index < len(self._commands) and not self._macros
+
+    def undoText(self):
+        return self._commands[self._index - 1].text if self.canUndo() else ""
+
+    def redoText(self):
+        return self._commands[self._index].text if self.canRedo() else ""
+
+    def undoCommand(self):
+        """Returns the command which undo() would revert, or None."""
+        return self._commands[self._index - 1] if self.canUndo() else None
+
+    def redoCommand(self):
+        """Returns the command which redo() would apply, or None."""
+        return self._commands[self._index] if self.canRedo() else None
+
+    def _drop(self, start, end):
+        for size in self._sizes[start:end]:
+            self._totalSize -= size
+        del self._commands[start:end]
+        del self._sizes[start:end]
+
+    def _setTop(self, command):
+        """Replaces the last command by command, or removes it if command is
+        None or obsolete."""
+        self._drop(len(self._commands) - 1, len(self._commands))
+        if command is not None and not command.isObsolete():
+            self._commands.append(command)
+            self._sizes.append(command.size)
+            self._totalSize += self._sizes[-1]
+        self._index = len(self._commands)
+
+    def push(self, command):
+        """Records command, which has already been done. The commands which
+        had been undone are discarded."""
+        if self._macros:
+            macro = self._macros[-1]
+            if not (macro.commands and not macro.commands[-1].sealed and
+                    macro.commands[-1].mergeWith(command)):
+                macro.commands.append(command)
+            return
+        self._drop(self._index, len(self._commands))
+        top = self._commands[-1] if self._commands else None
+        if top is not None and not top.sealed and top.mergeWith(command):
+            self._setTop(top)
+        elif not command.isObsolete():
+            if top is not None:
+                top.sealed = True
+            self._commands.append(command)
+            self._sizes.append(command.size)
+            self._totalSize += self._sizes[-1]
+            self._index = len(self._commands)
+        self._trim()
+        self.indexChanged.emit(self._index)
+
+    def _trim(self):
+        """Discards the oldest commands while over the limit, keeping at
+        least the last one."""
+        excess = 0
+        totalSize = self._totalSize
+        while excess < len(self._commands) - 1 and totalSize > self.limit:
+            totalSize -= self._sizes[excess]
+            excess += 1
+        if excess:
+            self._drop(0, excess)
+            self._index = max(self._index - excess, 0)
+
+    def seal(self):
+        """Prevents the last command from merging with the next ones, e.g.
+        at the end of a drag."""
+        if self._macros:
+            if self._macros[-1].commands:
+                self._macros[-1].commands[-1].sealed = True
+        elif self._commands:
+            self._commands[-1].sealed = True
+
+    def beginMacro(self, text):
+        """Starts grouping the pushed commands in a single command."""
+        self._macros.append(MacroCommand(text))
+
+    def endMacro(self):
+        """Pushes the command grouping the commands pushed since the
+        matching beginMacro()."""
+        macro = self._macros.pop()
+        if macro.commands:
+            macro.context = macro.commands[0].context
+            macro.sealed = True
+            self.push(macro)
+
+    @contextlib.contextmanager
+    def macro(self, text):
+        """Context manager grouping the commands pushed inside it."""
+        self.beginMacro(text)
+        try:
+            yield
+        finally:
+            self.endMacro()
+
+    def undo(self):
+        """Reverts the last command."""
+        if self.canUndo():
+            self._index -= 1
+            command = self._commands[self._index]
+            command.sealed = True
+            command.undo()
+            self.indexChanged.emit(self._index)
+
+    def redo(self):
+        """Applies again the last undone command."""
+        if self.canRedo():
+            command = self._commands[self._index]
+            command.redo()
+            self._index += 1
+            self.indexChanged.emit(self._index)
+
+    def clear(self):
+        """Discards all the commands."""
+        self._drop(0, len(self._commands))
+        self._index = 0
+        self.indexChanged.emit(self._index)
@@ -0,0 +1,461 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+import heapq
+from math import sqrt
+
+from Qt import QtCore
+
+from ts2.scenery import enditem
+from ts2.trains import TrainStatus
+
+
+def toSeconds(time):
+    """Returns the number of seconds since midnight of the QTime time, or
+    None if time is not valid."""
+    if time is None or not time.isValid():
+        return None
+    return time.msecsSinceStartOfDay() / 1000
+
+
+def scheduledTime(line, departure=False):
+    """Returns the scheduled arrival time in seconds of the ServiceLine line,
+    or its scheduled departure time if it has no arrival time or if departure
+    is True. Returns None if line has none of them."""
+    arrival = toSeconds(line.scheduledArrivalTime)
+    departureTime = toSeconds(line.scheduledDepartureTime)
+    if departure:
+        return departureTime if departureTime is not None else arrival
+    return arrival if arrival is not None else departureTime
+
+
+def runningTime(distance, speed, maxSpeed, accel, braking, stop=True):
+    """Returns the time needed to run distance metres, starting at speed,
+    accelerating at accel up to maxSpeed and, if stop is True, braking at
+    braking to stop at the end."""
+    if distance <= 0:
+        return 0.0
+    if maxSpeed <= 0:
+        return float("inf")
+    speed = min(speed, maxSpeed)
+    accel = accel if accel > 0 else 1e-3
+    braking = braking if braking > 0 else 1e-3
+    accelDistance = (maxSpeed ** 2 - speed ** 2) / (2 * accel)
+    if not stop:
+        if accelDistance >= distance:
+            finalSpeed = sqrt(speed ** 2 + 2 * accel * distance)
+            return (finalSpeed - speed) / accel
+        return (maxSpeed - speed) / accel + \
+            (distance - accelDistance) / maxSpeed
+    brakeDistance = maxSpeed ** 2 / (2 * braking)
+    if accelDistance + brakeDistance <= distance:
+        return (maxSpeed - speed) / accel + \
+            (distance - accelDistance - brakeDistance) / maxSpeed + \
+            maxSpeed / braking
+    peakSpeed = sqrt((distance + speed ** 2 / (2 * accel)) /
+                     (1 / (2 * accel) + 1 / (2 * braking)))
+    if peakSpeed <= speed:
+        # Already braking
+        return 2 * distance / speed
+    return (peakSpeed - speed) / accel + peakSpeed / braking
+
+
+class LineForecast:
+    """Expected arrival and departure times of a train at the place of a
+    :class:`~ts2.trains.service.ServiceLine`. Times are in seconds since
+    midnight."""
+
+    def __init__(self, train, line, arrival, departure):
+        """Constructor for the LineForecast class."""
+        self.train = train
+        self.line = line
+        self.arrival = arrival
+        self.departure = departure
+        self.conflicts = []
+
+    @property
+    def expectedArrival(self):
+        """Expected arrival time, as a QTime."""
+        return QtCore.QTime(0, 0).addSecs(int(round(self.arrival)))
+
+    @property
+    def expectedDeparture(self):
+        """Expected departure time, as a QTime."""
+        return QtCore.QTime(0, 0).addSecs(int(round(self.departure)))
+
+    @property
+    def delay(self):
+        """Expected delay at departure in seconds, or None if the line has
+        no scheduled departure time."""
+        scheduled = toSeconds(self.line.scheduledDepartureTime)
+        if scheduled is None:
+            return None
+        return self.departure - scheduled
+
+    def key(self):
+        """Rounded times, used to detect that the forecast changed."""
+        return int(round(self.arrival)), int(round(self.departure))
+
+
+class TrainForecast:
+    """Projection of a train along its service, with the data needed to
+    update it without walking the track again."""
+
+    def __init__(self, state):
+        """Constructor for the TrainForecast class."""
+        self.state = state
+        self.distance = None
+        self.cruiseSpeed = None
+        self.walkAge = 0.0
+        self.lines = []
+
+
+class DepartureForecaster(QtCore.QObject):
+    """Forecasts the expected times of the trains at each place, and the
+    platform conflicts between them.
+
+    A train is projected from its current position and speed: the distance
+    to its next place is measured along the track ahead of it, and run with
+    the acceleration, braking and maximum speed of its train type, limited
+    by the track speed limits. The following places are reached after the
+    scheduled running time between them. At each place where it must stop,
+    the train stays at least its minimum stop time, and does not leave before
+    the scheduled departure time. The trains following services are projected
+    too, up to maxServices services.
+
+    At each step, the track is only walked again for the trains whose
+    service, next place or status changed, or every rewalkInterval seconds
+    to take points changes into account. The distance run by the other
+    trains is subtracted from their remaining distance, so that updating
+    them is only arithmetic. Conflicts are only searched at the places whose
+    forecast changed.
+    """
+
+    def __init__(self, simulation, horizon=3600, maxServices=2,
+                 maxDistance=20000, rewalkInterval=30):
+        """Constructor for the DepartureForecaster class.
+
+        :param horizon: Trains which are not entered yet are only projected
+        if they enter in less than horizon seconds.
+        :param maxServices: Number of services projected for each train.
+        :param maxDistance: Maximum distance in metres walked along the track
+        to find the next place of a train.
+        :param rewalkInterval: Number of seconds after which the track is
+        walked again for running trains.
+        """
+        super().__init__(simulation)
+        self.simulation = simulation
+        self.horizon = horizon
+        self.maxServices = maxServices
+        self.maxDistance = maxDistance
+        self.rewalkInterval = rewalkInterval
+        self._places = {}
+        self.reset()
+        simulation.trainStatusChanged.connect(self.trackTrain)
+
+    def reset(self):
+        """Forgets the forecast, which is computed again from the current
+        state of the simulation at the next update, e.g. after the game was
+        rewound."""
+        self._changedPlaces = set(self._places)
+        self._trains = {}
+        self._places = {}
+        self._conflicts = {}
+        # Trains to update at each step, and the trains not entered yet
+        # sorted by entry time
+        self._tracked = {}
+        self._pending = []
+        for train in self.simulation.trains:
+            if train.status == TrainStatus.INACTIVE:
+                entryTime = self._entryTime(train)
+                if entryTime is not None:
+                    self._pending.append((entryTime, len(self._pending),
+                                          train))
+            else:
+                self._tracked[id(train)] = train
+        heapq.heapify(self._pending)
+
+    forecastChanged = QtCore.pyqtSignal(list)
+    """Emitted after an update with the codes of the places whose forecast
+    changed."""
+
+    # ## Queries ########################################################
+
+    def placeForecast(self, placeCode):
+        """Returns the LineForecasts at the place placeCode, sorted by
+        expected arrival time."""
+        return sorted(self._places.get(placeCode, {}).values(),
+                      key=lambda f: f.arrival)
+
+    def lineForecast(self, line):
+        """Returns the LineForecast of the ServiceLine line, or None if it is
+        not forecast, e.g. because its train already left the place."""
+        return self._places.get(line.placeCode, {}).get(id(line))
+
+    def trainForecast(self, train):
+        """Returns the LineForecasts of train, in the order of its
+        services."""
+        trainForecast = self._trains.get(id(train))
+        return list(trainForecast.lines) if trainForecast else []
+
+    def platformConflicts(self, placeCode):
+        """Returns the pairs of LineForecasts of different trains expected
+        on the same track of the place placeCode at the same time."""
+        return list(self._conflicts.get(placeCode, []))
+
+    # ## Update #########################################################
+
+    @QtCore.pyqtSlot(int)
+    def trackTrain(self, trainId):
+        """Updates the forecast of the train trainId at each step, e.g.
+        because its status changed."""
+        train = self.simulation.trains[trainId]
+        self._tracked[id(train)] = train
+
+    @QtCore.pyqtSlot(float)
+    def update(self, secs):
+        """Updates the forecast of the trains, secs seconds after the last
+        update."""
+        now = toSeconds(self.simulation.currentTime)
+        while self._pending and self._pending[0][0] <= now + self.horizon:
+            train = heapq.heappop(self._pending)[2]
+            self._tracked[id(train)] = train
+        for train in list(self._tracked.values()):
+            if not self._updateTrain(train, now, secs):
+                del self._tracked[id(train)]
+        changedPlaces = self._changedPlaces
+        self._changedPlaces = set()
+        for placeCode in changedPlaces:
+            self._updateConflicts(placeCode)
+        if changedPlaces:
+            self.forecastChanged.emit(sorted(changedPlaces))
+
+    def _updateTrain(self, train, now, secs):
+        """Updates the forecast of train. Returns False if the train has no
+        more place to call at."""
+        status = train.status
+        trainForecast = self._trains.get(id(train))
+        if status in (TrainStatus.OUT, TrainStatus.END_OF_SERVICE) or \
+                train.currentService is None or \
+                (status == TrainStatus.INACTIVE and
+                 self._entryTime(train) is None):
+            if trainForecast is not None:
+                self._setLines(train, [])
+                del self._trains[id(train)]
+            return False
+        state = (train.serviceCode, train.nextPlaceIndex, status)
+        if status == TrainStatus.INACTIVE and trainForecast is not None \
+                and trainForecast.state == state:
+            # Entry time does not change
+            return True
+        if trainForecast is None or trainForecast.state != state:
+            trainForecast = TrainForecast(state)
+            self._trains[id(train)] = trainForecast
+            self._walk(train, trainForecast)
+        elif status == TrainStatus.RUNNING:
+            trainForecast.walkAge += secs
+            if trainForecast.walkAge >= self.rewalkInterval or \
+                    trainForecast.distance is None:
+                self._walk(train, trainForecast)
+            else:
+                # The train has just advanced by its speed times secs
+                trainForecast.distance = max(
+                    trainForecast.distance - train.speed * secs, 0
+                )
+        self._setLines(train, self._project(train, trainForecast, now))
+        return True
+
+    def _entryTime(self, train):
+        """Returns the time in seconds at which train enters the scene, or
+        None if it has no valid appear time, in which case it never
+        enters."""
+        appearTime = toSeconds(train.appearTime)
+        if appearTime is None:
+            return None
+        return appearTime + train.initialDelay
+
+    def _isAtPlace(self, train, line):
+        ti = train.trainHead.trackItem
+        return getattr(ti, "placeCode", None) == line.placeCode
+
+    def _walk(self, train, trainForecast):
+        """Measures the distance from the train head to the end of the next
+        place of the train along the track ahead, and the mean speed allowed
+        by the track and the train type on the way."""
+        trainForecast.walkAge = 0.0
+        trainForecast.distance = None
+        index = train.nextPlaceIndex
+        if train.status == TrainStatus.INACTIVE:
+            index = 0
+        if index is None:
+            return
+        place = train.currentService.lines[index].place
+        maxSpeed = train.trainType.maxSpeed
+        pos = train.trainHead
+        ti = pos.trackItem
+        distance = ti.realLength - pos.positionOnTI
+        cruiseTime = distance / min(maxSpeed, ti.maxSpeed)
+        while distance < self.maxDistance:
+            if ti.place is place:
+                trainForecast.distance = distance
+                if cruiseTime > 0:
+                    trainForecast.cruiseSpeed = distance / cruiseTime
+                return
+            if isinstance(ti, enditem.EndItem):
+                return
+            try:
+                pos = pos.next()
+            except Exception:
+                # Track not linked, e.g. on points
+                return
+            ti = pos.trackItem
+            if ti is None:
+                return
+            distance += ti.realLength
+            cruiseTime += ti.realLength / min(maxSpeed, ti.maxSpeed)
+
+    def _dwell(self, train, line, arrival):
+        scheduled = toSeconds(line.scheduledDepartureTime)
+        if not line.mustStop:
+            return arrival
+        departure = arrival + train.minimumStopTime
+        if scheduled is not None:
+            departure = max(departure, scheduled)
+        return departure
+
+    def _project(self, train, trainForecast, now):
+        """Returns the LineForecasts of train."""
+        service = train.currentService
+        status = train.status
+        index = train.nextPlaceIndex
+        if status == TrainStatus.INACTIVE:
+            start = max(self._entryTime(train), now)
+            speed = train.initialSpeed
+            index = 0
+        else:
+            start = now
+            speed = train.speed
+        if index is None or not service.lines:
+            return []
+        trainType = train.trainType
+        line = service.lines[index]
+        if status == TrainStatus.STOPPED and self._isAtPlace(train, line):
+            arrival = start - train.stoppedTime
+            departure = max(self._dwell(train, line, arrival), start)
+        else:
+            if trainForecast.distance is None:
+                # Unknown path: assume the train keeps its schedule
+                scheduled = scheduledTime(line)
+                arrival = start if scheduled is None else max(start,
+                                                              scheduled)
+            else:
+                arrival = start + runningTime(
+                    trainForecast.distance, speed,
+                    trainForecast.cruiseSpeed or trainType.maxSpeed,
+                    trainType.stdAccel, trainType.stdBraking, line.mustStop
+                )
+            departure = self._dwell(train, line, arrival)
+        lines = [LineForecast(train, line, arrival, departure)]
+
+        # Following places are reached after the scheduled running time
+        # from the last place with a scheduled time
+        reference = (scheduledTime(line, departure=True), departure)
+        previousLine = line
+        serviceLines = service.lines[index + 1:]
+        services = 1
+        while True:
+            for line in serviceLines:
+                arrival = departure
+                scheduled = scheduledTime(line)
+                if line.placeCode != previousLine.placeCode and \
+                        scheduled is not None and reference[0] is not None \
+                        and scheduled >= reference[0]:
+                    arrival = max(arrival,
+                                  reference[1] + scheduled - reference[0])
+                departure = self._dwell(train, line, arrival)
+                lines.append(LineForecast(train, line, arrival, departure))
+                scheduled = scheduledTime(line, departure=True)
+                if scheduled is not None:
+                    reference = (scheduled, departure)
+                previousLine = line
+            if services >= self.maxServices or not service.nextServiceCode:
+                break
+            service = self.simulation.services.get(service.nextServiceCode)
+            if service is None:
+                break
+            serviceLines = service.lines
+            services += 1
+        return lines
+
+    def _setLines(self, train, lines):
+        """Replaces the LineForecasts of train by lines, and records the
+        places whose forecast changed."""
+        trainForecast = self._trains.get(id(train))
+        oldLines = trainForecast.lines if trainForecast else []
+        newIds = {id(f.line) for f in lines}
+        for forecast in oldLines:
+            if id(forecast.line) not in newIds:
+                placeForecast = self._places.get(forecast.line.placeCode, {})
+                if placeForecast.get(id(forecast.line)) is forecast:
+                    del placeForecast[id(forecast.line)]
+                    self._changedPlaces.add(forecast.line.placeCode)
+        for forecast in lines:
+            placeCode = forecast.line.placeCode
+            placeForecast = self._places.setdefault(placeCode, {})
+            old = placeForecast.get(id(forecast.line))
+            if old is not None and old.key() == forecast.key():
+                # Keep the old object, it holds the conflicts
+                old.arrival = forecast.arrival
+                old.departure = forecast.departure
+                forecast = old
+            else:
+                placeForecast[id(forecast.line)] = forecast
+                self._changedPlaces.add(placeCode)
+        if trainForecast is not None:
+            trainForecast.lines = [
+                self._places[f.line.placeCode][id(f.line)] for f in lines
+            ]
+
+    def _updateConflicts(self, placeCode):
+        """Finds the trains expected on the same track of placeCode at the
+        same time."""
+        byTrack = {}
+        for forecast in self._places.get(placeCode, {}).values():
+            forecast.conflicts = []
+            if forecast.line.mustStop and forecast.line.trackCode:
+                byTrack.setdefault(forecast.line.trackCode,
+                                   []).append(forecast)
+        conflicts = []
+        for forecasts in byTrack.values():
+            forecasts.sort(key=lambda f: f.arrival)
+            active = []
+            for forecast in forecasts:
+                active = [f for f in active if f.departure > forecast.arrival]
+                for other in active:
+                    if other.train is not forecast.train:
+                        other.conflicts.append(forecast)
+                        forecast.conflicts.append(other)
+                        conflicts.append((other, forecast))
+                active.append(forecast)
+        if conflicts:
+            self._conflicts[placeCode] = conflicts
+        else:
+            self._conflicts.pop(placeCode, None)
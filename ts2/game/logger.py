@@ -18,8 +18,15 @@
 #   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
+import array
+import bisect
+import collections
+import json
+import tempfile
+
 from Qt import QtCore, QtGui, Qt
 from ts2 import utils
+from ts2.utils import settings
 
 
 class Message(QtCore.QObject):
@@ -33,12 +40,13 @@ class Message(QtCore.QObject):
     def __init__(self, parameters):
         """Constructor for the Message class.
         :param parameters: dictionary to build the message. Should have a
-        'msgType' and a 'msgText' keys.
+        'msgType' and a 'msgText' keys, and may have a 'trainId' key.
         :type parameters: dict
         """
         super().__init__()
         self.msgType = parameters['msgType']
         self.msgText = parameters['msgText']
+        self.trainId = parameters.get('trainId')
 
     def __str__(self):
         """Returns the string representation of the message."""
@@ -46,72 +54,295 @@ class Message(QtCore.QObject):
 
     def for_json(self):
         """Dumps this message to JSON."""
-        return {
+        jsonData = {
             "__type__": "Message",
             "msgType": self.msgType,
             "msgText": self.msgText
         }
+        if self.trainId is not None:
+            jsonData["trainId"] = self.trainId
+        return jsonData
+
+
+class MessageSpill:
+    """Append-only file holding the messages which do not fit in memory any
+    more. Messages are written by pages, one JSON array per line, and the
+    last pages read back are cached."""
+
+    def __init__(self, cachedPages=4):
+        """Constructor for the MessageSpill class."""
+        self._file = None
+        self._pages = []
+        self._cache = collections.OrderedDict()
+        self.cachedPages = cachedPages
+
+    def __len__(self):
+        """Returns the number of pages in the file."""
+        return len(self._pages)
+
+    def append(self, messages):
+        """Writes the list of messages as a new page."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="ts2-messages-")
+        data = json.dumps(
+            [[m.msgType, m.msgText, m.trainId] for m in messages],
+            separators=(",", ":")
+        ).encode("utf-8") + b"\n"
+        self._file.seek(0, 2)
+        self._pages.append((self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def page(self, pageNum):
+        """Returns the list of messages of page pageNum."""
+        messages = self._cache.get(pageNum)
+        if messages is not None:
+            self._cache.move_to_end(pageNum)
+            return messages
+        offset, length = self._pages[pageNum]
+        self._file.seek(offset)
+        messages = [
+            Message({"msgType": t, "msgText": text, "trainId": trainId})
+            for t, text, trainId in json.loads(self._file.read(length))
+        ]
+        self._cache[pageNum] = messages
+        if len(self._cache) > self.cachedPages:
+            self._cache.popitem(last=False)
+        return messages
+
+    def close(self):
+        """Closes and deletes the file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._pages = []
+        self._cache.clear()
 
 
 class MessageLogger(QtCore.QAbstractTableModel):
     """A MessageLogger holds all messages that has been emitted to it and
-    format them so that it can be used directly as a model for views."""
+    format them so that it can be used directly as a model for views.
 
-    def __init__(self, parameters):
-        """Constructor for the MessageLogger class."""
+    The last maxMessages messages are kept in memory in a ring buffer. Older
+    messages are written to a temporary file by pages of pageSize messages,
+    and read back when a view displays them. The rows of the messages of
+    each type and of each train are indexed, so that the model can be
+    filtered without reading all the messages.
+    """
+
+    DEFAULT_MAX_MESSAGES = 1000
+    MAX_FILTER_CHANGES = 100
+    """Maximum number of row ranges inserted or removed when the filter
+    changes, above which the model is reset instead."""
+
+    def __init__(self, parameters, maxMessages=None, pageSize=100):
+        """Constructor for the MessageLogger class.
+
+        :param maxMessages: Number of messages kept in memory, and saved
+        with the game. Defaults to the message_log_size user setting.
+        :param pageSize: Number of messages written to or read from the
+        spill file at once.
+        """
         super().__init__()
-        self._messages = parameters.get('messages', []) + [Message(
+        if maxMessages is None:
+            maxMessages = settings.i(settings.MESSAGE_LOG_SIZE,
+                                     self.DEFAULT_MAX_MESSAGES)
+        self.pageSize = pageSize
+        self.maxMessages = max(maxMessages, pageSize)
+        self._ring = [None] * self.maxMessages
+        self._start = 0
+        self._count = 0
+        self._spill = MessageSpill()
+        self._spilledCount = 0
+        self._typeIndex = {}
+        self._trainIndex = {}
+        self._filter = None
+        self._filterRows = None
+        self._sentinel = Message(
             {'msgType': Message.SIMULATION_MSG, 'msgText': " "}
-        )]
+        )
         self.simulation = None
+        for message in parameters.get('messages', []):
+            self._append(message)
 
     def initialize(self, simulation):
         """Initializes the message logger once everything is loaded."""
         self.simulation = simulation
 
+    def close(self):
+        """Closes the file of the messages spilled to disk. This must be
+        done when the simulation is closed, after which the logger must not
+        be used any more."""
+        self._spill.close()
+
     def for_json(self):
-        """Dumps the messages to JSON."""
+        """Dumps the messages kept in memory to JSON."""
         messages = []
         if self.simulation.context == utils.Context.GAME:
-            messages = self._messages
+            messages = [self._ring[(self._start + i) % self.maxMessages]
+                        for i in range(self._count)]
         return {
             "__type__": "MessageLogger",
             "messages": messages
         }
 
-    def addMessage(self, msgText, msgType=Message.SIMULATION_MSG):
-        """Adds a message to the logger."""
-        row = len(self._messages) - 1
+    def _append(self, message):
+        """Stores message and returns its number."""
+        if self._count == self.maxMessages:
+            # Spill the oldest page
+            self._spill.append([
+                self._ring[(self._start + i) % self.maxMessages]
+                for i in range(self.pageSize)
+            ])
+            for i in range(self.pageSize):
+                self._ring[(self._start + i) % self.maxMessages] = None
+            self._start = (self._start + self.pageSize) % self.maxMessages
+            self._count -= self.pageSize
+            self._spilledCount += self.pageSize
+        num = self._spilledCount + self._count
+        self._ring[(self._start + self._count) % self.maxMessages] = message
+        self._count += 1
+        self._typeIndex.setdefault(
+            message.msgType, array.array("l")
+        ).append(num)
+        if message.trainId is not None:
+            self._trainIndex.setdefault(
+                message.trainId, array.array("l")
+            ).append(num)
+        return num
+
+    def __len__(self):
+        """Returns the total number of messages, including the ones spilled
+        to disk."""
+        return self._spilledCount + self._count
+
+    def message(self, num):
+        """Returns the message number num, reading it back from disk if it
+        is not in memory any more."""
+        if num < self._spilledCount:
+            return self._spill.page(num // self.pageSize)[num % self.pageSize]
+        return self._ring[(self._start + num - self._spilledCount) %
+                          self.maxMessages]
+
+    def messagesOfType(self, msgType):
+        """Returns the numbers of the messages of type msgType."""
+        return self._typeIndex.get(msgType, array.array("l"))
+
+    def messagesOfTrain(self, trainId):
+        """Returns the numbers of the messages about the train trainId."""
+        return self._trainIndex.get(trainId, array.array("l"))
+
+    def _matches(self, message):
+        msgType, trainId = self._filter
+        return (msgType is None or message.msgType == msgType) and \
+            (trainId is None or message.trainId == trainId)
+
+    def setFilter(self, msgType=None, trainId=None):
+        """Only shows the messages of type msgType and about the train
+        trainId. None values do not filter.
+
+        The rows which appear or disappear are inserted or removed by
+        ranges, so that views keep their state, unless there are too many
+        ranges."""
+        if msgType is None and trainId is None:
+            newFilter = None
+        else:
+            newFilter = (msgType, trainId)
+        if newFilter == self._filter:
+            return
+        newRows = None
+        if trainId is not None and msgType is not None:
+            types = self.messagesOfType(msgType)
+            newRows = array.array("l", [
+                num for num in self.messagesOfTrain(trainId)
+                if _contains(types, num)
+            ])
+        elif trainId is not None:
+            newRows = array.array("l", self.messagesOfTrain(trainId))
+        elif msgType is not None:
+            newRows = array.array("l", self.messagesOfType(msgType))
+        allRows = range(len(self))
+        oldRows = self._filterRows if self._filterRows is not None else allRows
+        targetRows = newRows if newRows is not None else allRows
+        changes = _rowChanges(oldRows, targetRows, self.MAX_FILTER_CHANGES)
+        if changes is None:
+            self.beginResetModel()
+            self._filter = newFilter
+            self._filterRows = newRows
+            self.endResetModel()
+            return
+        removed, inserted = changes
+        self._filter = newFilter
+        rows = list(oldRows)
+        self._filterRows = rows
+        root = QtCore.QModelIndex()
+        for first, last in reversed(removed):
+            self.beginRemoveRows(root, first, last)
+            del rows[first:last + 1]
+            self.endRemoveRows()
+        for first, last in inserted:
+            self.beginInsertRows(root, first, last)
+            rows[first:first] = targetRows[first:last + 1]
+            self.endInsertRows()
+        self._filterRows = newRows
+
+    def addMessage(self, msgText, msgType=Message.SIMULATION_MSG,
+                   trainId=None):
+        """Adds a message to the logger.
+
+        :param trainId: ID of the train the message is about, if any.
+        """
         if msgType == Message.SIMULATION_MSG:
             msgText = \
                 self.simulation.currentTime.toString("HH:mm - ") + msgText
         msgData = {
             'msgType': msgType,
-            'msgText': msgText
+            'msgText': msgText,
+            'trainId': trainId
         }
+        self.insertMessage(Message(msgData))
+
+    def insertMessage(self, message):
+        """Adds the Message instance message to the logger, as is."""
+        if self._filter is not None and not self._matches(message):
+            self._append(message)
+            return
+        row = self.rowCount() - 1
         self.beginInsertRows(QtCore.QModelIndex(), row, row)
-        self._messages.insert(row, Message(msgData))
+        num = self._append(message)
+        if self._filterRows is not None:
+            self._filterRows.append(num)
         self.endInsertRows()
 
     def rowCount(self, parent=None, *args, **kwargs):
         """Returns the number of rows of the model, corresponding to the
         number of messages in the logger."""
-        return len(self._messages)
+        if self._filterRows is not None:
+            return len(self._filterRows) + 1
+        return len(self) + 1
 
     def columnCount(self, parent=None, *args, **kwargs):
         """Returns the number of columns of the model"""
         return 1
 
+    def _rowMessage(self, row):
+        if self._filterRows is not None:
+            if row >= len(self._filterRows):
+                return self._sentinel
+            return self.message(self._filterRows[row])
+        if row >= len(self):
+            return self._sentinel
+        return self.message(row)
+
     def data(self, index, role=Qt.DisplayRole):
         """Returns the data at the given index"""
         if role == Qt.DisplayRole:
-            return str(self._messages[index.row()])
+            return str(self._rowMessage(index.row()))
         elif role == Qt.FontRole:
             return QtGui.QFont("Courier new")
         elif role == Qt.BackgroundRole:
             return QtGui.QBrush(Qt.black)
         elif role == Qt.ForegroundRole:
-            msgType = self._messages[index.row()].msgType
+            msgType = self._rowMessage(index.row()).msgType
             if msgType == Message.SOFTWARE_MSG:
                 return QtGui.QBrush(Qt.magenta)
             elif msgType == Message.PLAYER_WARNING_MSG:
@@ -126,3 +357,39 @@ class MessageLogger(QtCore.QAbstractTableModel):
     def flags(self, index):
         """Returns the flags of the model"""
         return Qt.ItemIsEnabled
+
+
+def _contains(sortedArray, value):
+    """Returns True if value is in the sorted array sortedArray."""
+    index = bisect.bisect_left(sortedArray, value)
+    return index < len(sortedArray) and sortedArray[index] == value
+
+
+def _rowChanges(oldRows, newRows, maxChanges):
+    """Returns the (removed, inserted) lists of the (first, last) ranges of
+    rows to remove from oldRows and then to insert to get newRows, both
+    sorted lists of message numbers, or None if there are more than
+    maxChanges ranges."""
+    removed = []
+    inserted = []
+    i = j = 0
+    while i < len(oldRows) or j < len(newRows):
+        if j == len(newRows) or \
+                (i < len(oldRows) and oldRows[i] < newRows[j]):
+            if removed and removed[-1][1] == i - 1:
+                removed[-1][1] = i
+            else:
+                removed.append([i, i])
+            i += 1
+        elif i == len(oldRows) or newRows[j] < oldRows[i]:
+            if inserted and inserted[-1][1] == j - 1:
+                inserted[-1][1] = j
+            else:
+                inserted.append([j, j])
+            j += 1
+        else:
+            i += 1
+            j += 1
+        if len(removed) + len(inserted) > maxChanges:
+            return None
+    return removed, inserted
@@ -88,7 +88,8 @@ class Scorer(QtCore.QObject):
             self.simulation.messageLogger.addMessage(
                 self.tr("Train %s arrived at station %s on platform %s instead"
                         " of %s") % (train.serviceCode, place.placeName,
-                                     actualPlatform, plannedPlatform)
+                                     actualPlatform, plannedPlatform),
+                trainId=trainId
             )
         scheduledArrivalTime = serviceLine.scheduledArrivalTime
         currentTime = self.simulation.currentTime
@@ -101,12 +102,14 @@ class Scorer(QtCore.QObject):
                 self.tr("Train %s arrived %i minutes late at station %s "
                         "(%+i minutes)") %
                 (train.serviceCode, secondsLate // 60, place.placeName,
-                 minutesLateByPlayer)
+                 minutesLateByPlayer),
+                trainId=trainId
             )
         else:
             self.simulation.messageLogger.addMessage(
                 self.tr("Train %s arrived on time at station %s") %
-                (train.serviceCode, place.placeName)
+                (train.serviceCode, place.placeName),
+                trainId=trainId
             )
 
     @QtCore.pyqtSlot(int)
@@ -116,4 +119,5 @@ class Scorer(QtCore.QObject):
         if train.nextPlaceIndex is not None:
             self.score += self.wrongDestinationPenalty
             self.simulation.messageLogger.addMessage(
-                self.tr("Train %s badly routed") % train.serviceCode)
+                self.tr("Train %s badly routed") % train.serviceCode,
+                trainId=trainId)
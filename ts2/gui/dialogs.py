@@ -115,10 +115,13 @@ class ServiceAssignDialog(QtWidgets.QDialog):
         )
         self.serviceListView = servicelistview.ServiceListView(self)
         self.serviceListView.setupServiceList(simulation)
+        filterBar = servicelistview.ServiceFilterBar(self.serviceListView, self)
+        filterBar.setupFilters(simulation)
         buttonBox = QtWidgets.QDialogButtonBox(
             QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel
         )
         layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(filterBar)
         layout.addWidget(self.serviceListView)
         layout.addWidget(buttonBox)
         self.setLayout(layout)
@@ -147,6 +150,9 @@ class ServiceAssignDialog(QtWidgets.QDialog):
             if newServiceCode != "":
                 train = simulation.trains[trainId]
                 train.serviceCode = newServiceCode
+        # Delete the dialog and its filter model, which is connected to the
+        # service list model of the simulation
+        sad.deleteLater()
 
     def closeEvent(self, event):
         """Save window postions on close"""
@@ -218,6 +224,52 @@ class SplitTrainDialog(QtWidgets.QDialog):
         super().closeEvent(event)
 
 
+class RewindDialog(QtWidgets.QDialog):
+    """Popup window for the user to select the time to which to rewind the
+    game."""
+
+    def __init__(self, parent, rewinder):
+        """Constructor for the RewindDialog."""
+        super().__init__(parent)
+        self.setObjectName("rewind_dialog")
+        self.setWindowTitle(self.tr("Rewind the game"))
+        currentTime = rewinder.simulation.currentTime
+        earliestTime = rewinder.earliestTime
+        if earliestTime > currentTime:
+            # The clock went past midnight since the earliest checkpoint
+            earliestTime = QtCore.QTime(0, 0)
+        layout = QtWidgets.QVBoxLayout()
+        label = QtWidgets.QLabel(self)
+        label.setText(
+            self.tr("Rewind the game to (from %s):")
+            % earliestTime.toString("hh:mm:ss")
+        )
+        layout.addWidget(label)
+        self.timeEdit = QtWidgets.QTimeEdit(self)
+        self.timeEdit.setDisplayFormat("hh:mm:ss")
+        self.timeEdit.setTimeRange(earliestTime, currentTime)
+        self.timeEdit.setTime(currentTime.addSecs(-300))
+        layout.addWidget(self.timeEdit)
+        buttonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel
+        )
+        layout.addWidget(buttonBox)
+        self.setLayout(layout)
+        buttonBox.accepted.connect(self.accept)
+        buttonBox.rejected.connect(self.reject)
+
+    @staticmethod
+    def getRewindTime(parent, rewinder):
+        """Pops up a rewind dialog and returns the selected time, or None if
+        the dialog was cancelled."""
+        rd = RewindDialog(parent, rewinder)
+        time = None
+        if rd.exec_() == QtWidgets.QDialog.Accepted:
+            time = rd.timeEdit.time()
+        rd.deleteLater()
+        return time
+
+
 class DownloadSimulationsDialog(QtWidgets.QDialog):
     """Popup window for the user to select download server."""
     def __init__(self, parent):
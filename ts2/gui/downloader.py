@@ -0,0 +1,197 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+import os
+import tempfile
+import time
+import zipfile
+from concurrent import futures
+from urllib import request
+
+from Qt import QtCore
+
+
+class DownloadCancelled(Exception):
+    """Raised inside the worker when the download is cancelled."""
+    pass
+
+
+class SimulationsDownloader(QtCore.QThread):
+    """Background thread that downloads a simulation archive and extracts it.
+
+    The archive is streamed to a temporary file by chunks so that progress
+    can be reported and the download cancelled at any time. Simulations
+    stored as plain JSON in the archive are recompressed to .ts2 files in
+    parallel. Files are written under a temporary name and renamed when
+    complete, so that a cancelled download does not leave truncated files.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    TIMEOUT = 30
+    PROGRESS_INTERVAL = 0.1
+    """Minimum time in seconds between two download progress signals"""
+
+    progress = QtCore.pyqtSignal("qint64", "qint64")
+    """Emitted with (done, total), total is 0 if unknown"""
+
+    message = QtCore.pyqtSignal(str)
+    failed = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+    succeeded = QtCore.pyqtSignal(int)
+    """Emitted with the number of files extracted"""
+
+    def __init__(self, url, simulationsDir, dataDir, parent=None,
+                 maxWorkers=None):
+        """Constructor for the SimulationsDownloader class.
+
+        :param str url: URL of the zip archive to download
+        :param str simulationsDir: where to put simulation files
+        :param str dataDir: where to put signal library (.tsl) files
+        """
+        super().__init__(parent)
+        self.url = url
+        self.simulationsDir = simulationsDir
+        self.dataDir = dataDir
+        self.maxWorkers = maxWorkers
+
+    def cancel(self):
+        """Requests the download to stop as soon as possible."""
+        self.requestInterruption()
+
+    def _checkCancelled(self):
+        if self.isInterruptionRequested():
+            raise DownloadCancelled()
+
+    def run(self):
+        try:
+            with tempfile.TemporaryFile() as tmpFile:
+                self.download(tmpFile)
+                with zipfile.ZipFile(tmpFile) as zipArchive:
+                    count = self.extract(zipArchive)
+        except DownloadCancelled:
+            self.cancelled.emit()
+        except Exception as err:
+            self.failed.emit(str(err))
+        else:
+            self.succeeded.emit(count)
+
+    def download(self, tmpFile):
+        """Streams the archive at self.url into tmpFile."""
+        self.message.emit(self.tr("Requesting %s") % self.url)
+        with request.urlopen(self.url, timeout=self.TIMEOUT) as response:
+            total = int(response.headers.get("Content-Length") or 0)
+            done = 0
+            self.progress.emit(done, total)
+            lastProgress = time.monotonic()
+            self.message.emit(self.tr("Downloading %s") % self.url)
+            while True:
+                self._checkCancelled()
+                chunk = response.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                tmpFile.write(chunk)
+                done += len(chunk)
+                now = time.monotonic()
+                if now - lastProgress >= self.PROGRESS_INTERVAL:
+                    self.progress.emit(done, total)
+                    lastProgress = now
+            self.progress.emit(done, total)
+        tmpFile.seek(0)
+
+    def extract(self, zipArchive):
+        """Extracts the simulations and signal libraries of zipArchive.
+
+        :return: the number of files extracted
+        """
+        jobs = []
+        for fileName in zipArchive.namelist():
+            fs = fileName.split('/', 1)
+            fn = fs[1] if len(fs) > 1 else fs[0]
+            if fileName.endswith(".ts2"):
+                jobs.append((fileName,
+                             os.path.join(self.simulationsDir, fn), False))
+            elif fileName.endswith(".tsl"):
+                jobs.append((fileName,
+                             os.path.join(self.dataDir,
+                                          os.path.basename(fileName)),
+                             False))
+            elif fileName.endswith(".json"):
+                jobs.append((fileName,
+                             os.path.join(self.simulationsDir,
+                                          fn.replace(".json", ".ts2")),
+                             True))
+
+        self.message.emit(self.tr("Extracting %i files") % len(jobs))
+        self.progress.emit(0, len(jobs))
+        done = 0
+        maxWorkers = self.maxWorkers or min(32, (os.cpu_count() or 1) + 4)
+        with futures.ThreadPoolExecutor(maxWorkers) as executor:
+            pending = set()
+
+            def waitFor(count):
+                # Waits until at most count jobs are pending
+                nonlocal pending, done
+                while len(pending) > count:
+                    finished, pending = futures.wait(
+                        pending, return_when=futures.FIRST_COMPLETED
+                    )
+                    for future in finished:
+                        future.result()
+                        done += 1
+                        self.progress.emit(done, len(jobs))
+                    self._checkCancelled()
+
+            try:
+                for fileName, target, recompress in jobs:
+                    self._checkCancelled()
+                    # Only a few files are held in memory at once
+                    waitFor(2 * maxWorkers - 1)
+                    # ZipFile reads are not meant to be concurrent, so the
+                    # archive is read here and only writing and compression
+                    # (which releases the GIL) are done in parallel.
+                    pending.add(executor.submit(
+                        self._writeFile, zipArchive.read(fileName), target,
+                        recompress
+                    ))
+                waitFor(0)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        return done
+
+    @staticmethod
+    def _writeFile(data, target, recompress):
+        """Writes data to target, as a BZIP2 compressed .ts2 archive if
+        recompress is True."""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmpName = target + ".part"
+        try:
+            if recompress:
+                with zipfile.ZipFile(tmpName, "w") as ts2Zip:
+                    ts2Zip.writestr("simulation.json", data,
+                                    compress_type=zipfile.ZIP_BZIP2)
+            else:
+                with open(tmpName, 'wb') as f:
+                    f.write(data)
+            os.replace(tmpName, target)
+        finally:
+            if os.path.exists(tmpName):
+                os.remove(tmpName)
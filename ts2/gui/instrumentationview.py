@@ -0,0 +1,112 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+from Qt import QtCore, QtWidgets, Qt
+
+
+class InstrumentationView(QtWidgets.QWidget):
+    """Debug widget displaying the tick statistics collected by
+    :class:`~ts2.instrumentation.Instrumentation`."""
+
+    STAT_HEADERS = ["Subsystem", "Calls/tick", "ms/tick", "p50 ms", "p99 ms"]
+    TRAIN_HEADERS = ["Train", "Service", "Avg advance ms"]
+
+    def __init__(self, instrumentation, parent=None):
+        """Constructor for the InstrumentationView class."""
+        super().__init__(parent)
+        self.instrumentation = instrumentation
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        hbox = QtWidgets.QHBoxLayout()
+        self.lblTicks = QtWidgets.QLabel()
+        hbox.addWidget(self.lblTicks, 1)
+        buttReset = QtWidgets.QToolButton()
+        buttReset.setText(self.tr("Reset"))
+        buttReset.clicked.connect(self.onReset)
+        hbox.addWidget(buttReset)
+        layout.addLayout(hbox)
+
+        self.statsTable = self._makeTable(self.STAT_HEADERS)
+        layout.addWidget(self.statsTable, 3)
+        self.trainsTable = self._makeTable(self.TRAIN_HEADERS)
+        layout.addWidget(self.trainsTable, 2)
+
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setInterval(1000)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+    def _makeTable(self, headers):
+        table = QtWidgets.QTableWidget(0, len(headers), self)
+        table.setHorizontalHeaderLabels([self.tr(h) for h in headers])
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    @staticmethod
+    def _setRow(table, row, values):
+        for column, value in enumerate(values):
+            if isinstance(value, float):
+                text = "%.3f" % value
+            else:
+                text = str(value)
+            item = table.item(row, column)
+            if item is None:
+                item = QtWidgets.QTableWidgetItem()
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(row, column, item)
+            item.setText(text)
+
+    @QtCore.pyqtSlot()
+    def refresh(self):
+        """Updates the displayed statistics."""
+        inst = self.instrumentation
+        self.lblTicks.setText(
+            self.tr("Ticks: %i - Overruns: %i") % (inst.ticks, inst.overruns)
+        )
+        stats = inst.statistics()
+        self.statsTable.setRowCount(len(stats))
+        for row, values in enumerate(stats):
+            self._setRow(self.statsTable, row, values)
+
+        trains = inst.slowestTrains()
+        self.trainsTable.setRowCount(len(trains))
+        for row, (train, avg) in enumerate(trains):
+            self._setRow(self.trainsTable, row,
+                         (train.trainId, train.serviceCode, avg))
+        self.statsTable.resizeColumnToContents(0)
+
+    @QtCore.pyqtSlot()
+    def onReset(self):
+        self.instrumentation.reset()
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refreshTimer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refreshTimer.stop()
+        super().hideEvent(event)
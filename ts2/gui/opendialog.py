@@ -1,16 +1,13 @@
 
 import os
-import tempfile
-import zipfile
 import fnmatch
-from urllib import request
 
 from Qt import QtCore, QtWidgets, Qt
-import json
 
 import ts2
 from ts2.utils import settings
 from ts2.gui import widgets
+from ts2.gui.simulationindex import SimulationIndex, SimulationIndexer
 
 translate = QtWidgets.qApp.translate
 
@@ -102,6 +99,11 @@ class OpenDialog(QtWidgets.QDialog):
         self.treeSims.header().setStretchLastSection(True)
         self.treeSims.itemDoubleClicked.connect(self.onTreeSimsItemDblClicked)
 
+        self.downloader = None
+        self.simIndex = SimulationIndex()
+        self.simIndexer = None
+        self._simItems = {}
+
         # =====================================
         # Recent
 
@@ -141,54 +143,68 @@ class OpenDialog(QtWidgets.QDialog):
         self.buttGroup.button(tab).setChecked(True)
 
     def onDownload(self):
-        """Downloads zip when Download button clicked"""
-        QtWidgets.qApp.setOverrideCursor(Qt.WaitCursor)
+        """Downloads zip when Download button clicked, or cancels the
+        running download."""
+        if self.downloader is not None:
+            self.downloader.cancel()
+            self.statusBar.showMessage(self.tr("Cancelling download"))
+            return
 
         if settings.debug:
             url = "http://localhost/~ts2/ts2-data-master.zip"
         else:
             url = "%s/archive/master.zip" % self.txtUrl.text().strip('/')
 
+        self.stopIndexer()
         self.statusBar.showBusy(True)
-        self.statusBar.showMessage("Requesting %s" % url)
-        self.buttDownload.setDisabled(True)
-
-        response = request.urlopen(url)
-
-        with tempfile.TemporaryFile() as tmpFile:
-            tmpFile.write(response.read())
-            with zipfile.ZipFile(tmpFile) as zipArchive:
-                for fileName in zipArchive.namelist():
-                    fs = fileName.split('/', 1)
-                    fn = fs[1] if len(fs) > 1 else fs[0]
-                    if fileName.endswith(".ts2"):
-                        fName = os.path.join(settings.simulationsDir, fn)
-                        os.makedirs(os.path.dirname(fName), exist_ok=True)
-                        with open(fName, 'wb') as f:
-                            f.write(zipArchive.read(fileName))
-
-                    elif fileName.endswith(".tsl"):
-                        fName = os.path.join(settings.userDataDir,
-                                             os.path.basename(fileName))
-                        with open(fName, 'wb') as f:
-                            f.write(zipArchive.read(fileName))
-
-                    elif fileName.endswith(".json"):
-                        fName = os.path.join(settings.simulationsDir,
-                                             fn.replace(".json", ".ts2"))
-                        os.makedirs(os.path.dirname(fName), exist_ok=True)
-                        with zipfile.ZipFile(fName, "w") as ts2Zip:
-                            ts2Zip.writestr("simulation.json",
-                                            zipArchive.read(fileName),
-                                            compress_type=zipfile.ZIP_BZIP2)
-
-        QtWidgets.qApp.restoreOverrideCursor()
+        self.buttDownload.setText(self.tr("Cancel"))
+        self.txtUrl.setDisabled(True)
+
+        # Imported here because urllib is slow to import
+        from ts2.gui.downloader import SimulationsDownloader
+        self.downloader = SimulationsDownloader(
+            url, settings.simulationsDir, settings.userDataDir, self
+        )
+        self.downloader.progress.connect(self.statusBar.showProgress)
+        self.downloader.message.connect(self.statusBar.showMessage)
+        self.downloader.succeeded.connect(self.onDownloadSucceeded)
+        self.downloader.failed.connect(self.onDownloadFailed)
+        self.downloader.cancelled.connect(self.onDownloadCancelled)
+        self.downloader.finished.connect(self.onDownloadFinished)
+        self.downloader.start()
+
+    @QtCore.pyqtSlot(int)
+    def onDownloadSucceeded(self, count):
+        self.statusBar.showMessage(
+            self.tr("Download done, %i files extracted") % count, timeout=2
+        )
 
+    @QtCore.pyqtSlot(str)
+    def onDownloadFailed(self, error):
+        self.statusBar.showMessage(self.tr("Download failed: %s") % error,
+                                   warn=True)
+
+    @QtCore.pyqtSlot()
+    def onDownloadCancelled(self):
+        self.statusBar.showMessage(self.tr("Download cancelled"), timeout=2)
+
+    @QtCore.pyqtSlot()
+    def onDownloadFinished(self):
+        self.downloader = None
         self.statusBar.showBusy(False)
-        self.statusBar.showMessage("Download done", timeout=2)
-        self.buttDownload.setDisabled(False)
+        self.buttDownload.setText(self.tr("Download"))
+        self.txtUrl.setDisabled(False)
         self.onRefreshSims()
 
+    def stopDownloader(self):
+        """Cancels the running download, if any, and waits for the worker
+        thread to exit."""
+        if self.downloader is not None:
+            self.downloader.finished.disconnect(self.onDownloadFinished)
+            self.downloader.cancel()
+            self.downloader.wait()
+            self.downloader = None
+
     def onNavButtClicked(self, butt):
 
         idx = self.buttGroup.id(butt)
@@ -202,9 +218,14 @@ class OpenDialog(QtWidgets.QDialog):
         self.stackWidget.setCurrentIndex(idx)
 
     def onRefreshSims(self):
-        """Reloads the simulations dir"""
-        self.statusBar.showMessage("Loading")
+        """Reloads the simulations dir.
+
+        Rows are filled immediately from the metadata index, then the files
+        that are new or have changed since they were last indexed are
+        rescanned in a background thread and their rows updated."""
+        self.stopIndexer()
         self.treeSims.clear()
+        self._simItems = {}
 
         ts2_files = {}
         for root, dirnames, filenames in os.walk(settings.simulationsDir):
@@ -214,29 +235,88 @@ class OpenDialog(QtWidgets.QDialog):
                     ts2_files[d] = []
                 ts2_files[d].append(os.path.join(root, filename))
 
+        staleFiles = []
         for folder in sorted(ts2_files.keys()):
             pitem = QtWidgets.QTreeWidgetItem()
             pitem.setText(C.name, folder)
             pitem.setFirstColumnSpanned(True)
             self.treeSims.addTopLevelItem(pitem)
-            for file_path in ts2_files[folder]:
-                with zipfile.ZipFile(file_path, "r") as zippy:
-
-                    # wtf, confused why bytes returned
-                    bytesData = zippy.read("simulation.json")
-                    data = json.loads(bytesData.decode())
-                    nfo = data['options']
-
-                    item = QtWidgets.QTreeWidgetItem(pitem)
-                    item.setText(C.name, nfo['title'])
-                    item.setText(C.description, nfo['description'])
-                    item.setText(C.file_name, os.path.basename(file_path))
-                    item.setText(C.file_path, file_path)
+            for file_path in sorted(ts2_files[folder]):
+                item = QtWidgets.QTreeWidgetItem(pitem)
+                item.setText(C.file_name, os.path.basename(file_path))
+                item.setText(C.file_path, file_path)
+                self._simItems[file_path] = item
+                stamp = SimulationIndex.fileStamp(file_path)
+                metadata = self.simIndex.get(file_path, stamp)
+                if metadata is None:
+                    item.setText(C.name, os.path.basename(file_path))
+                    item.setText(C.description, self.tr("Loading..."))
+                    staleFiles.append((file_path, stamp))
+                else:
+                    self._setSimItemMetadata(item, metadata)
             pitem.setExpanded(True)
 
+        self.simIndex.prune(self._simItems.keys())
         self.treeSims.resizeColumnToContents(C.name)
+
+        if staleFiles:
+            self.statusBar.showBusy(True)
+            self.statusBar.showMessage(
+                self.tr("Scanning %i simulations") % len(staleFiles)
+            )
+            self.simIndexer = SimulationIndexer(staleFiles, self)
+            self.simIndexer.fileIndexed.connect(self.onSimFileIndexed)
+            self.simIndexer.finished.connect(self.onSimIndexerFinished)
+            self.simIndexer.start()
+        else:
+            self.simIndex.save()
+
+    @QtCore.pyqtSlot(str, object, object)
+    def onSimFileIndexed(self, filePath, stamp, metadata):
+        """Updates the index and the row of filePath with the metadata read
+        by the indexer thread."""
+        if stamp is not None:
+            self.simIndex.update(filePath, stamp, metadata)
+        item = self._simItems.get(filePath)
+        if item is not None:
+            self._setSimItemMetadata(item, metadata)
+
+    @QtCore.pyqtSlot()
+    def onSimIndexerFinished(self):
+        if self.sender() is not self.simIndexer:
+            return
+        self.simIndexer = None
+        self.simIndex.save()
+        self.treeSims.resizeColumnToContents(C.name)
+        self.statusBar.showBusy(False)
         self.statusBar.showMessage("")
 
+    def stopIndexer(self):
+        """Stops the indexer thread if it is running."""
+        if self.simIndexer is not None:
+            self.simIndexer.requestInterruption()
+            self.simIndexer.wait()
+            self.simIndexer = None
+            self.statusBar.showBusy(False)
+
+    def _setSimItemMetadata(self, item, metadata):
+        item.setText(C.name, metadata["title"] or item.text(C.file_name))
+        if metadata.get("error"):
+            item.setText(C.description,
+                         self.tr("Error: %s") % metadata["error"])
+            item.setToolTip(C.name, "")
+            return
+        item.setText(C.description, metadata["description"])
+        item.setToolTip(
+            C.name,
+            self.tr("Version %s - %i items, %i routes, %i services, "
+                    "%i trains") % (metadata["version"],
+                                    metadata["trackItems"],
+                                    metadata["routes"],
+                                    metadata["services"],
+                                    metadata["trains"])
+        )
+
     def onRefreshRecent(self):
         """Reloads the recent items"""
         self.treeRecent.clear()
@@ -264,6 +344,12 @@ class OpenDialog(QtWidgets.QDialog):
             self.openFile.emit(filePath)
             self.accept()
 
+    def done(self, result):
+        self.stopDownloader()
+        self.stopIndexer()
+        self.simIndex.save()
+        super().done(result)
+
     def _make_nav_button(self, txt, idx):
         butt = QtWidgets.QToolButton()
         butt.setText(txt)
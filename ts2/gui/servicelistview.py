@@ -21,10 +21,12 @@
 from Qt import QtCore, QtWidgets
 
 from ts2 import simulation
+from ts2.trains import ServiceFilterModel
 
 
 class ServiceListView(QtWidgets.QTreeView):
-    """TODO Document ServiceListView"""
+    """List of the services of the simulation, which can be sorted by
+    clicking on the headers and filtered with a :class:`ServiceFilterBar`."""
 
     def __init__(self, parent):
         super().__init__(parent)
@@ -41,28 +43,31 @@ class ServiceListView(QtWidgets.QTreeView):
         trainId. """
         if self.simulation is not None:
             serviceCode = self.simulation.trains[trainId].serviceCode
-            for i in range(self.model().rowCount()):
-                index = self.model().index(i, 0)
-                if self.model().data(index) == serviceCode:
-                    self.selectionModel().select(
-                        index,
-                        QtCore.QItemSelectionModel.Rows |
-                        QtCore.QItemSelectionModel.ClearAndSelect
-                    )
+            row = self.model().rowOfService(serviceCode)
+            if row < 0:
+                self.selectionModel().clearSelection()
+                return
+            self.selectionModel().select(
+                self.model().index(row, 0),
+                QtCore.QItemSelectionModel.Rows |
+                QtCore.QItemSelectionModel.ClearAndSelect
+            )
 
     @QtCore.pyqtSlot(simulation.Simulation)
     def setupServiceList(self, sim):
         """Updates the service list view."""
         self.simulation = sim
-        # if self.model() is None:
-        model = self.simulation.serviceListModel
-        model.updateModel()
-        self.setModel(model)
+        sim.serviceListModel.updateModel()
+        oldModel = self.model()
+        self.setModel(ServiceFilterModel(sim, self))
+        if oldModel is not None:
+            oldModel.deleteLater()
         self.setSortingEnabled(True)
+        self.sortByColumn(1, QtCore.Qt.AscendingOrder)
         for i in range(0, 4):
             self.resizeColumnToContents(i)
         self.header().setStretchLastSection(False)
-        self.header().setSortIndicatorShown(False)
+        self.header().setSortIndicatorShown(True)
         self.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
 
     @QtCore.pyqtSlot(QtCore.QItemSelection, QtCore.QItemSelection)
@@ -76,3 +81,70 @@ class ServiceListView(QtWidgets.QTreeView):
         index = selected.indexes()[0]
         if index.isValid():
             self.serviceSelected.emit(index.data())
+
+
+class ServiceFilterBar(QtWidgets.QWidget):
+    """Search and filter fields of a :class:`ServiceListView`."""
+
+    def __init__(self, serviceListView, parent=None):
+        """Constructor for the ServiceFilterBar class."""
+        super().__init__(parent)
+        self.serviceListView = serviceListView
+        layout = QtWidgets.QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.txtServiceCode = QtWidgets.QLineEdit(self)
+        self.txtServiceCode.setPlaceholderText(self.tr("Service code"))
+        self.txtServiceCode.setClearButtonEnabled(True)
+        self.txtServiceCode.textChanged.connect(self.onServiceCode)
+        layout.addWidget(self.txtServiceCode)
+
+        self.cboEntryPlace = QtWidgets.QComboBox(self)
+        self.cboEntryPlace.currentIndexChanged.connect(self.onEntryPlace)
+        layout.addWidget(self.cboEntryPlace)
+
+        self.cboExitPlace = QtWidgets.QComboBox(self)
+        self.cboExitPlace.currentIndexChanged.connect(self.onExitPlace)
+        layout.addWidget(self.cboExitPlace)
+        layout.addStretch()
+
+    @staticmethod
+    def _fillPlaces(comboBox, allText, placeNames):
+        comboBox.blockSignals(True)
+        comboBox.clear()
+        comboBox.addItem(allText, None)
+        for placeName in sorted(placeNames):
+            comboBox.addItem(placeName, placeName)
+        comboBox.blockSignals(False)
+
+    @QtCore.pyqtSlot(simulation.Simulation)
+    def setupFilters(self, sim):
+        """Fills the filter fields for the simulation sim, which must be set
+        up in the service list view first."""
+        services = sim.services.values()
+        self._fillPlaces(self.cboEntryPlace, self.tr("All entry points"),
+                         {s.entryPlaceName for s in services if s.lines})
+        self._fillPlaces(self.cboExitPlace, self.tr("All exit points"),
+                         {s.exitPlaceName for s in services if s.lines})
+        self.onServiceCode(self.txtServiceCode.text())
+        self.onEntryPlace()
+        self.onExitPlace()
+
+    @QtCore.pyqtSlot(str)
+    def onServiceCode(self, text):
+        model = self.serviceListView.model()
+        if model is not None:
+            model.setServiceCodePrefix(text.strip())
+
+    @QtCore.pyqtSlot()
+    def onEntryPlace(self):
+        model = self.serviceListView.model()
+        if model is not None:
+            model.setFilter("entryPlace", self.cboEntryPlace.currentData())
+
+    @QtCore.pyqtSlot()
+    def onExitPlace(self):
+        model = self.serviceListView.model()
+        if model is not None:
+            model.setFilter("exitPlace", self.cboExitPlace.currentData())
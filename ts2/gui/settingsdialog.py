@@ -66,6 +66,30 @@ class SettingsDialog(QtWidgets.QDialog):
         self.chkLoadLast.toggled.connect(self.onLoadLast)
         grid.addWidget(self.chkLoadLast, row, 1, 1, 1)
 
+        # Simulation worker
+        row += 1
+        self.chkWorker = QtWidgets.QCheckBox(self)
+        self.chkWorker.setText(
+            self.tr("Run simulations in a background process")
+        )
+        self.chkWorker.setToolTip(
+            self.tr("Keeps the scenery responsive with large simulations. "
+                    "Applies to the simulations loaded afterwards.")
+        )
+        self.chkWorker.toggled.connect(self.onWorker)
+        grid.addWidget(self.chkWorker, row, 1, 1, 1)
+
+        # Replays
+        row += 1
+        self.chkRecord = QtWidgets.QCheckBox(self)
+        self.chkRecord.setText(self.tr("Record games for replay"))
+        self.chkRecord.setToolTip(
+            self.tr("Records the games played in the foreground in the "
+                    "replays folder, to be replayed with ts2.replay.")
+        )
+        self.chkRecord.toggled.connect(self.onRecord)
+        grid.addWidget(self.chkRecord, row, 1, 1, 1)
+
         # ======================
         # Path Options
         grp = QtWidgets.QGroupBox()
@@ -111,6 +135,12 @@ class SettingsDialog(QtWidgets.QDialog):
     def loadSettings(self):
         v = settings.b(settings.LOAD_LAST, False)
         self.chkLoadLast.setChecked(v)
+        self.chkWorker.setChecked(
+            settings.b(settings.SIMULATION_WORKER, False)
+        )
+        self.chkRecord.setChecked(
+            settings.b(settings.RECORD_REPLAYS, False)
+        )
 
         self.txtDataDir.setText(settings.userDataDir)
         self.txtSimsDir.setText(settings.simulationsDir)
@@ -120,6 +150,16 @@ class SettingsDialog(QtWidgets.QDialog):
         settings.setValue(settings.LOAD_LAST, v)
         settings.sync()
 
+    def onWorker(self):
+        v = 1 if self.chkWorker.isChecked() else 0
+        settings.setValue(settings.SIMULATION_WORKER, v)
+        settings.sync()
+
+    def onRecord(self):
+        v = 1 if self.chkRecord.isChecked() else 0
+        settings.setValue(settings.RECORD_REPLAYS, v)
+        settings.sync()
+
     def closeEvent(self, ev):
         settings.setValue(settings.INITIAL_SETUP, "1")
         settings.sync()
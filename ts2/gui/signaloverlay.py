@@ -0,0 +1,116 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+from Qt import QtCore, QtGui, QtWidgets, Qt
+
+from ts2.routing import conflicts
+
+
+class SignalRoutesOverlay(QtWidgets.QGraphicsObject):
+    """Scene overlay shown while the player has selected the first signal of
+    a route. It frames the end signal of each route starting at the selected
+    signal: green if the route can be set, orange if it can be set but a
+    train is on it, and red with the reason if it cannot be set."""
+
+    MARGIN = 3
+
+    def __init__(self, simulation):
+        """Constructor for the SignalRoutesOverlay class."""
+        super().__init__()
+        self.simulation = simulation
+        self.statuses = []
+        self._rect = QtCore.QRectF()
+        self.font = QtGui.QFont("Courier new", 8)
+        self.setZValue(200)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setVisible(False)
+        simulation.selectedSignalChanged.connect(self.refresh)
+        simulation.timeChanged.connect(self.onTimeChanged)
+        simulation.registerGraphicsItem(self)
+
+    @QtCore.pyqtSlot()
+    def refresh(self):
+        """Reads the status of the routes from the selected signal."""
+        si = self.simulation.selectedSignal
+        if si is None:
+            statuses = []
+        else:
+            statuses = self.simulation.routeStatusesFrom(si)
+        rect = QtCore.QRectF()
+        metrics = QtGui.QFontMetricsF(self.font)
+        for status in statuses:
+            frame = self._frame(status)
+            rect = rect.united(frame)
+            label = self._label(status)
+            if label:
+                rect = rect.united(QtCore.QRectF(
+                    frame.bottomLeft(),
+                    QtCore.QSizeF(metrics.width(label), metrics.height())
+                ))
+        self.prepareGeometryChange()
+        self.statuses = statuses
+        self._rect = rect
+        self.setVisible(bool(statuses))
+        self.update()
+
+    @QtCore.pyqtSlot(QtCore.QTime)
+    def onTimeChanged(self, time):
+        """Route and occupancy states change as trains run."""
+        if self.isVisible():
+            self.refresh()
+
+    def _frame(self, status):
+        gi = status.route.endSignal.graphicsItem
+        return gi.sceneBoundingRect().adjusted(
+            -self.MARGIN, -self.MARGIN, self.MARGIN, self.MARGIN
+        )
+
+    def _label(self, status):
+        if status.reason == conflicts.RouteStatus.CONFLICTING_ROUTE:
+            return self.tr("Conflict")
+        elif status.reason == conflicts.RouteStatus.POINTS_LOCKED:
+            return self.tr("Points locked")
+        return ""
+
+    def boundingRect(self):
+        return self._rect
+
+    def paint(self, painter, option, widget=None):
+        painter.setFont(self.font)
+        for status in self.statuses:
+            if not status.activable:
+                color = Qt.red
+            elif status.occupied:
+                color = QtGui.QColor("orange")
+            else:
+                color = Qt.green
+            painter.setPen(QtGui.QPen(color, 1.5))
+            painter.setBrush(Qt.NoBrush)
+            frame = self._frame(status)
+            painter.drawRect(frame)
+            label = self._label(status)
+            if label:
+                painter.drawText(
+                    frame.bottomLeft() + QtCore.QPointF(
+                        0, painter.fontMetrics().ascent()
+                    ),
+                    label
+                )
@@ -0,0 +1,171 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+import json
+import os
+import zipfile
+
+from Qt import QtCore
+
+from ts2.utils import settings
+
+
+class SimulationIndex:
+    """Persistent cache of the metadata of simulation files.
+
+    Each entry is keyed on the file path and is only valid as long as the
+    file modification time and size are unchanged, so that the open dialog
+    does not have to unzip and parse every simulation to display its title.
+    """
+
+    FILE_NAME = "simulations_index.json"
+    FORMAT = 1
+
+    def __init__(self, fileName=None):
+        """Constructor for the SimulationIndex class."""
+        self.fileName = fileName or os.path.join(settings.cacheDir,
+                                                 self.FILE_NAME)
+        self._entries = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Loads the index from disk. A missing or corrupt index file is
+        silently discarded, it will be rebuilt on next scan."""
+        self._entries = {}
+        try:
+            with open(self.fileName, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("format") == self.FORMAT:
+            self._entries = data.get("entries", {})
+
+    def save(self):
+        """Writes the index to disk if it has changed."""
+        if not self._dirty:
+            return
+        tmpName = self.fileName + ".tmp"
+        try:
+            with open(tmpName, "w", encoding="utf-8") as f:
+                json.dump({"format": self.FORMAT, "entries": self._entries},
+                          f)
+            os.replace(tmpName, self.fileName)
+        except OSError:
+            return
+        self._dirty = False
+
+    @staticmethod
+    def fileStamp(filePath):
+        """Returns the (mtime, size) tuple that validates an entry of
+        filePath, or None if the file cannot be accessed."""
+        try:
+            st = os.stat(filePath)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, filePath, stamp=None):
+        """Returns the cached metadata of filePath, or None if there is no
+        entry or if the entry is stale."""
+        entry = self._entries.get(filePath)
+        if entry is None:
+            return None
+        stamp = stamp or self.fileStamp(filePath)
+        if stamp is None or [entry["mtime"], entry["size"]] != list(stamp):
+            return None
+        return entry["metadata"]
+
+    def update(self, filePath, stamp, metadata):
+        """Stores the metadata of filePath as read at stamp."""
+        self._entries[filePath] = {
+            "mtime": stamp[0],
+            "size": stamp[1],
+            "metadata": metadata
+        }
+        self._dirty = True
+
+    def prune(self, filePaths):
+        """Removes the entries of files that are not in filePaths."""
+        keep = set(filePaths)
+        for filePath in list(self._entries.keys()):
+            if filePath not in keep:
+                del self._entries[filePath]
+                self._dirty = True
+
+    @staticmethod
+    def readMetadata(filePath):
+        """Reads the metadata of the simulation in filePath. This is the
+        expensive operation that the index avoids.
+
+        :rtype: dict
+        """
+        if zipfile.is_zipfile(filePath):
+            with zipfile.ZipFile(filePath, "r") as zippy:
+                data = json.loads(zippy.read("simulation.json").decode())
+        else:
+            with open(filePath, encoding="utf-8") as f:
+                data = json.load(f)
+        nfo = data.get('options', {})
+        return {
+            "title": nfo.get('title', ""),
+            "description": nfo.get('description', ""),
+            "version": nfo.get('version', ""),
+            "trackItems": len(data.get('trackItems', {})),
+            "routes": len(data.get('routes', {})),
+            "trains": len(data.get('trains', [])),
+            "services": len(data.get('services', {})),
+            "error": ""
+        }
+
+
+class SimulationIndexer(QtCore.QThread):
+    """Background thread that reads the metadata of the given simulation
+    files. Results are sent back with the fileIndexed signal, so that the
+    index itself is only ever modified from the GUI thread."""
+
+    fileIndexed = QtCore.pyqtSignal(str, object, object)
+
+    def __init__(self, files, parent=None):
+        """Constructor for the SimulationIndexer class.
+
+        :param files: list of (filePath, stamp) tuples to scan.
+        """
+        super().__init__(parent)
+        self.files = list(files)
+
+    def run(self):
+        for filePath, stamp in self.files:
+            if self.isInterruptionRequested():
+                return
+            try:
+                metadata = SimulationIndex.readMetadata(filePath)
+            except Exception as err:
+                metadata = {
+                    "title": os.path.basename(filePath),
+                    "description": "",
+                    "version": "",
+                    "trackItems": 0,
+                    "routes": 0,
+                    "trains": 0,
+                    "services": 0,
+                    "error": str(err)
+                }
+            self.fileIndexed.emit(filePath, stamp, metadata)
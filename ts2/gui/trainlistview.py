@@ -21,10 +21,15 @@
 from Qt import QtCore, QtWidgets
 
 from ts2 import simulation
+from ts2.trains import TrainStatus, TrainFilterModel
+
+LATE_MINUTES = 5
+"""Minimum lateness of the trains shown by the "Late" filter."""
 
 
 class TrainListView(QtWidgets.QTreeView):
-    """ TODO Document TrainListView class"""
+    """List of the trains of the simulation, which can be sorted by clicking
+    on the headers and filtered with a :class:`TrainFilterBar`."""
 
     def __init__(self, parent):
         super().__init__(parent)
@@ -38,7 +43,11 @@ class TrainListView(QtWidgets.QTreeView):
 
     @QtCore.pyqtSlot(int)
     def updateTrainSelection(self, trainId):
-        index = self.model().index(trainId, 0)
+        row = self.model().rowOfTrain(trainId)
+        if row < 0:
+            self.selectionModel().clearSelection()
+            return
+        index = self.model().index(row, 0)
         self.selectionModel().select(index,
                                      QtCore.QItemSelectionModel.Rows |
                                      QtCore.QItemSelectionModel.ClearAndSelect)
@@ -46,21 +55,19 @@ class TrainListView(QtWidgets.QTreeView):
     @QtCore.pyqtSlot(simulation.Simulation)
     def setupTrainList(self, sim):
         self.simulation = sim
-        # if self.model() is None:
-        # trainsSortedModel = QSortFilterProxyModel()
-        # trainsSortedModel.setSourceModel()
-        self.setModel(self.simulation.trainListModel)
+        oldModel = self.model()
+        self.setModel(TrainFilterModel(sim, self))
+        if oldModel is not None:
+            oldModel.deleteLater()
         self.header().setStretchLastSection(False)
-        self.header().setSortIndicatorShown(False)
+        self.header().setSortIndicatorShown(True)
         self.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
-        self.simulation.trainStatusChanged.connect(self.model().update)
-        # self.simulation.timeChanged.connect(self.model().update)
-        # self.trainSelected.connect(self.simulation.selectedTrainModel.setTrainByServiceCode)
+        self.simulation.trainStatusChanged.connect(sim.trainListModel.update)
 
     def contextMenuEvent(self, event):
         index = self.selectionModel().selection().indexes()[0]
         if index.isValid():
-            train = self.simulation.trains[index.row()]
+            train = self.simulation.trains[self.model().trainId(index.row())]
             train.showTrainActionsMenu(self, event.globalPos())
 
     @QtCore.pyqtSlot(QtCore.QItemSelection, QtCore.QItemSelection)
@@ -69,4 +76,79 @@ class TrainListView(QtWidgets.QTreeView):
         if len(selected.indexes()) > 0:
             index = selected.indexes()[0]
             if index.isValid():
-                self.trainSelected.emit(index.row())
+                self.trainSelected.emit(self.model().trainId(index.row()))
+
+
+class TrainFilterBar(QtWidgets.QWidget):
+    """Search and filter fields of a :class:`TrainListView`."""
+
+    def __init__(self, trainListView, parent=None):
+        """Constructor for the TrainFilterBar class."""
+        super().__init__(parent)
+        self.trainListView = trainListView
+        layout = QtWidgets.QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.txtServiceCode = QtWidgets.QLineEdit(self)
+        self.txtServiceCode.setPlaceholderText(self.tr("Service code"))
+        self.txtServiceCode.setClearButtonEnabled(True)
+        self.txtServiceCode.textChanged.connect(self.onServiceCode)
+        layout.addWidget(self.txtServiceCode)
+
+        self.cboStatus = QtWidgets.QComboBox(self)
+        self.cboStatus.addItem(self.tr("All trains"), None)
+        for status in (TrainStatus.RUNNING, TrainStatus.STOPPED,
+                       TrainStatus.WAITING, TrainStatus.INACTIVE,
+                       TrainStatus.OUT, TrainStatus.END_OF_SERVICE):
+            self.cboStatus.addItem(TrainStatus.text(status), status)
+        self.cboStatus.addItem(
+            self.tr("Late by %i min or more") % LATE_MINUTES, "late"
+        )
+        self.cboStatus.currentIndexChanged.connect(self.onStatus)
+        layout.addWidget(self.cboStatus)
+
+        self.cboNextPlace = QtWidgets.QComboBox(self)
+        self.cboNextPlace.currentIndexChanged.connect(self.onNextPlace)
+        layout.addWidget(self.cboNextPlace)
+        layout.addStretch()
+
+    @QtCore.pyqtSlot(simulation.Simulation)
+    def setupFilters(self, sim):
+        """Fills the filter fields for the simulation sim, which must be set
+        up in the train list view first."""
+        self.cboNextPlace.blockSignals(True)
+        self.cboNextPlace.clear()
+        self.cboNextPlace.addItem(self.tr("All next places"), None)
+        for place in sorted(sim.places.values(),
+                            key=lambda p: p.placeName):
+            self.cboNextPlace.addItem(place.placeName, place.placeCode)
+        self.cboNextPlace.blockSignals(False)
+        self.onServiceCode(self.txtServiceCode.text())
+        self.onStatus()
+        self.onNextPlace()
+
+    @QtCore.pyqtSlot(str)
+    def onServiceCode(self, text):
+        model = self.trainListView.model()
+        if model is not None:
+            model.setServiceCodePrefix(text.strip())
+
+    @QtCore.pyqtSlot()
+    def onStatus(self):
+        model = self.trainListView.model()
+        if model is None:
+            return
+        status = self.cboStatus.currentData()
+        if status == "late":
+            model.setFilter("status", None)
+            model.setFilter("late", lambda late: late >= LATE_MINUTES)
+        else:
+            model.setFilter("late", None)
+            model.setFilter("status", status)
+
+    @QtCore.pyqtSlot()
+    def onNextPlace(self):
+        model = self.trainListView.model()
+        if model is not None:
+            model.setFilter("nextPlace", self.cboNextPlace.currentData())
@@ -103,18 +103,11 @@ class XGraphicsView(QtWidgets.QGraphicsView):
 
 
 class StatusBar(QtWidgets.QStatusBar):
-    """A horizontal bar with embedded progress bar
-
-    .. todo: The progressBar is not showing progress !!
-    """
+    """A horizontal bar with embedded progress bar"""
 
     def __init__(self, parent=None):
         super().__init__(parent)
 
-        self.progressTimer = QtCore.QTimer()
-        self.progressTimer.setInterval(100)
-        self.progressTimer.timeout.connect(self.onProgressTimeout)
-
         self.progressContainerWidget = HBoxWidget()
         self.progressContainerWidget.setFixedWidth(100)
         self.progressContainerWidget.setFixedHeight(15)
@@ -145,20 +138,26 @@ class StatusBar(QtWidgets.QStatusBar):
         else:
             super().showMessage(txt)
 
-    @QtCore.pyqtSlot()
-    def onProgressTimeout(self):
-        print("onTimer")
-        QtWidgets.qApp.processEvents()
-
     def showBusy(self, is_busy):
         """Shows the progress bar and makes busy bee"""
-        if is_busy:
-            self.progressBar.setRange(0, 0)
-            self.progressTimer.start()
+        self.progressBar.setRange(0, 0)
+        self.progressBar.setVisible(is_busy)
+
+    @QtCore.pyqtSlot("qint64", "qint64")
+    def showProgress(self, value, maximum):
+        """Shows the progress bar with the given progress. If maximum is not
+        strictly positive, the progress is unknown and the bar is shown
+        busy."""
+        if maximum > 2 ** 31 - 1:
+            # The progress bar range is an int
+            value = value * 1000 // maximum
+            maximum = 1000
+        if maximum > 0:
+            self.progressBar.setRange(0, maximum)
+            self.progressBar.setValue(min(value, maximum))
         else:
             self.progressBar.setRange(0, 0)
-            self.progressTimer.stop()
-        self.progressBar.setVisible(is_busy)
+        self.progressBar.setVisible(True)
 
 
 class ToolBarGroup(QtWidgets.QWidget):
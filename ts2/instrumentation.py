@@ -0,0 +1,239 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""Opt-in per tick instrumentation of the simulation.
+
+Nothing in this module is active until :func:`install` is called: it then
+replaces the instrumented methods by timed wrappers, so that the game runs
+the original code, without any check, when instrumentation is disabled.
+:func:`install` must be called before the simulation is loaded, because
+signal connections are bound to the methods at that time.
+"""
+
+import collections
+import functools
+import importlib
+import time
+
+
+def allSubclasses(cls):
+    """Returns the list of all the subclasses of cls, recursively."""
+    subclasses = []
+    for subclass in cls.__subclasses__():
+        subclasses.append(subclass)
+        subclasses.extend(allSubclasses(subclass))
+    return subclasses
+
+
+def patchMethod(cls, methodName, makeWrapper, subclasses=False):
+    """Replaces the method methodName of cls by makeWrapper(method).
+
+    The method may be inherited by cls, e.g. a Qt event handler. If
+    subclasses is True, the method is also replaced in all the subclasses of
+    cls which override it.
+    """
+    classes = [cls] + (allSubclasses(cls) if subclasses else [])
+    for klass in classes:
+        if klass is cls:
+            func = getattr(cls, methodName, None)
+        else:
+            func = klass.__dict__.get(methodName)
+        if func is None:
+            continue
+        wrapper = functools.wraps(func)(makeWrapper(func))
+        # Qt would call the original slot through the meta object, bypassing
+        # the wrapper, if it kept the pyqtSlot signature.
+        wrapper.__dict__.pop("__pyqtSignature__", None)
+        setattr(klass, methodName, wrapper)
+
+
+INSTRUMENTED = [
+    ("Simulation.timerOut", "ts2.simulation", "Simulation", "timerOut"),
+    ("Train.advance", "ts2.trains.train", "Train", "advance"),
+    ("  updateSignalActions", "ts2.trains.train", "Train",
+     "updateSignalActions"),
+    ("  setSpeed", "ts2.trains.train", "Train", "setSpeed"),
+    ("  updateStatus", "ts2.trains.train", "Train", "updateStatus"),
+    ("  drawTrain", "ts2.trains.train", "Train", "drawTrain"),
+    ("  executeActions", "ts2.trains.train", "Train", "executeActions"),
+    ("SignalItem.updateSignalState", "ts2.scenery.signals.signalitem",
+     "SignalItem", "updateSignalState"),
+    ("Route.activate", "ts2.routing.route", "Route", "activate"),
+    ("Route.desactivate", "ts2.routing.route", "Route", "desactivate"),
+    ("Scene repaint", "ts2.gui.widgets", "XGraphicsView", "paintEvent"),
+]
+"""(name, module, class, method) of the instrumented methods"""
+
+TICK_KEY = "Simulation.timerOut"
+TRAIN_KEY = "Train.advance"
+
+
+class Instrumentation:
+    """Collects the duration of the instrumented methods.
+
+    For each instrumented method, the durations of the last calls are kept
+    to compute percentiles, and the time spent per tick over the last ticks
+    is kept to compute averages. Recursive calls are only timed once.
+    """
+
+    def __init__(self, sampleSize=2000, tickWindow=120, trainDecay=0.05):
+        """Constructor for the Instrumentation class."""
+        self.names = [entry[0] for entry in INSTRUMENTED]
+        self.samples = {name: collections.deque(maxlen=sampleSize)
+                        for name in self.names}
+        self.tickTotals = collections.deque(maxlen=tickWindow)
+        self.overruns = 0
+        self.ticks = 0
+        self.trainDecay = trainDecay
+        self.trainTimes = {}
+        self._depth = {name: 0 for name in self.names}
+        self._currentTick = {name: [0, 0.0] for name in self.names}
+        self._installed = False
+
+    def install(self):
+        """Replaces the instrumented methods by timed wrappers."""
+        if self._installed:
+            return
+        for name, moduleName, className, methodName in INSTRUMENTED:
+            module = importlib.import_module(moduleName)
+            cls = getattr(module, className)
+            if name == TICK_KEY:
+                makeWrapper = self._makeTickWrapper
+            elif name == TRAIN_KEY:
+                makeWrapper = self._makeTrainWrapper
+            else:
+                makeWrapper = functools.partial(self._makeWrapper, name)
+            patchMethod(cls, methodName, makeWrapper)
+        self._installed = True
+
+    def _record(self, name, elapsed):
+        self.samples[name].append(elapsed)
+        current = self._currentTick[name]
+        current[0] += 1
+        current[1] += elapsed
+
+    def _makeWrapper(self, name, func):
+        depth = self._depth
+
+        def timed(*args, **kwargs):
+            if depth[name]:
+                return func(*args, **kwargs)
+            depth[name] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                depth[name] -= 1
+                self._record(name, time.perf_counter() - start)
+        return timed
+
+    def _makeTrainWrapper(self, func):
+        def timed(train, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(train, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._record(TRAIN_KEY, elapsed)
+                previous = self.trainTimes.get(id(train), (train, elapsed))[1]
+                self.trainTimes[id(train)] = (
+                    train,
+                    previous + self.trainDecay * (elapsed - previous)
+                )
+        return timed
+
+    def _makeTickWrapper(self, func):
+        def timed(simulation, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(simulation, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._record(TICK_KEY, elapsed)
+                self.ticks += 1
+                if elapsed * 1000 > simulation.timerInterval:
+                    self.overruns += 1
+                self.tickTotals.append({
+                    name: tuple(value)
+                    for name, value in self._currentTick.items()
+                })
+                for value in self._currentTick.values():
+                    value[0] = 0
+                    value[1] = 0.0
+        return timed
+
+    @staticmethod
+    def percentile(sortedSamples, fraction):
+        """Returns the fraction percentile of sortedSamples (nearest rank)."""
+        if not sortedSamples:
+            return 0.0
+        index = min(int(fraction * len(sortedSamples)),
+                    len(sortedSamples) - 1)
+        return sortedSamples[index]
+
+    def statistics(self):
+        """Returns a list of (name, callsPerTick, msPerTick, p50 ms, p99 ms)
+        for each instrumented method."""
+        ticks = len(self.tickTotals) or 1
+        stats = []
+        for name in self.names:
+            calls = sum(t[name][0] for t in self.tickTotals)
+            total = sum(t[name][1] for t in self.tickTotals)
+            samples = sorted(self.samples[name])
+            stats.append((name, calls / ticks, total * 1000 / ticks,
+                          self.percentile(samples, 0.5) * 1000,
+                          self.percentile(samples, 0.99) * 1000))
+        return stats
+
+    def slowestTrains(self, count=10):
+        """Returns a list of (train, average ms per advance) of the count
+        trains with the highest moving average advance time."""
+        trains = sorted(self.trainTimes.values(), key=lambda t: t[1],
+                        reverse=True)
+        return [(train, avg * 1000) for train, avg in trains[:count]]
+
+    def reset(self):
+        """Clears all the collected data."""
+        for samples in self.samples.values():
+            samples.clear()
+        for value in self._currentTick.values():
+            value[0] = 0
+            value[1] = 0.0
+        self.tickTotals.clear()
+        self.trainTimes.clear()
+        self.overruns = 0
+        self.ticks = 0
+
+
+_instrumentation = None
+
+
+def install():
+    """Enables the instrumentation and returns it."""
+    global _instrumentation
+    if _instrumentation is None:
+        _instrumentation = Instrumentation()
+        _instrumentation.install()
+    return _instrumentation
+
+
+def instance():
+    """Returns the Instrumentation instance, or None if it is disabled."""
+    return _instrumentation
@@ -20,14 +20,15 @@
 
 import zipfile
 import os
+import random
 
 from Qt import QtCore, QtGui, QtWidgets, Qt
 
 from ts2 import simulation, utils
 from ts2.gui import dialogs, trainlistview, servicelistview, widgets, \
-    opendialog, settingsdialog
+    settingsdialog, signaloverlay
+from ts2.game import logger
 from ts2.scenery import placeitem
-from ts2.editor import editorwindow
 from ts2.utils import settings
 
 from ts2 import __PROJECT_WWW__, __PROJECT_HOME__, __PROJECT_BUGS__, \
@@ -59,6 +60,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # Simulation
         self.simulation = None
+        self.signalOverlay = None
+        self.rewinder = None
 
         # Actions  ======================================
         self.openAction = QtWidgets.QAction(self.tr("&Open..."), self)
@@ -72,12 +75,25 @@ class MainWindow(QtWidgets.QMainWindow):
         self.openRecentAction.setMenu(menu)
         menu.triggered.connect(self.onRecent)
 
+        self.connectAction = QtWidgets.QAction(
+            self.tr("&Connect to server..."), self
+        )
+        self.connectAction.setToolTip(self.tr("Play a simulation run by a "
+                                              "simulation server"))
+        self.connectAction.triggered.connect(self.onConnectToServer)
+
         self.saveGameAsAction = QtWidgets.QAction(self.tr("&Save game"), self)
         self.saveGameAsAction.setShortcut(QtGui.QKeySequence.SaveAs)
         self.saveGameAsAction.setToolTip(self.tr("Save the current game"))
         self.saveGameAsAction.triggered.connect(self.saveGame)
         self.saveGameAsAction.setEnabled(False)
 
+        self.rewindAction = QtWidgets.QAction(self.tr("&Rewind..."), self)
+        self.rewindAction.setToolTip(self.tr("Rewind the game to an earlier "
+                                             "time"))
+        self.rewindAction.triggered.connect(self.onRewind)
+        self.rewindAction.setEnabled(False)
+
         # Properties
         self.propertiesAction = QtWidgets.QAction(self.tr("Sim &Properties..."),
                                                   self)
@@ -109,6 +125,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.editorCurrAction.setToolTip(self.tr("Open this sim in editor"))
         self.editorCurrAction.triggered.connect(self.onEditorCurrent)
 
+        self.autoRoutesAction = QtWidgets.QAction(self.tr("Auto routes"),
+                                                  self)
+        self.autoRoutesAction.setCheckable(True)
+        self.autoRoutesAction.setToolTip(
+            self.tr("Set routes automatically according to the timetables")
+        )
+
         # Web Links
         self.actionGroupWwww = QtWidgets.QActionGroup(self)
         self.actionGroupWwww.triggered.connect(self.onWwwAction)
@@ -142,8 +165,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.fileMenu = self.menuBar().addMenu(self.tr("&File"))
         self.fileMenu.addAction(self.openAction)
         self.fileMenu.addAction(self.openRecentAction)
+        self.fileMenu.addAction(self.connectAction)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.saveGameAsAction)
+        self.fileMenu.addAction(self.rewindAction)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.propertiesAction)
         self.fileMenu.addAction(self.settingsAction)
@@ -176,6 +201,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.addToolBar(tbar)
         tbg.addAction(self.openAction)
         tbg.addAction(self.editorCurrAction)
+        tbg.addAction(self.autoRoutesAction)
 
         # =========
         # Speed
@@ -331,6 +357,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.placeInfoView.setItemsExpandable(False)
         self.placeInfoView.setRootIsDecorated(False)
         self.placeInfoView.setModel(placeitem.Place.selectedPlaceModel)
+        placeitem.Place.selectedPlaceModel.modelReset.connect(
+            self.updateForecasting
+        )
         hb.addWidget(self.placeInfoView)
 
         hb.setSpacing(0)
@@ -346,9 +375,23 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QDockWidget.DockWidgetFloatable
         )
         self.trainListPanel.setObjectName("trains_panel")
+        wid = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout()
+        vbox.setSpacing(0)
+        vbox.setContentsMargins(0, 0, 0, 0)
+        wid.setLayout(vbox)
         self.trainListView = trainlistview.TrainListView(self)
+        self.trainFilterBar = trainlistview.TrainFilterBar(
+            self.trainListView, self
+        )
         self.simulationLoaded.connect(self.trainListView.setupTrainList)
-        self.trainListPanel.setWidget(self.trainListView)
+        self.simulationLoaded.connect(self.trainFilterBar.setupFilters)
+        self.trainFilterBar.cboStatus.currentIndexChanged.connect(
+            self.updateForecasting
+        )
+        vbox.addWidget(self.trainFilterBar)
+        vbox.addWidget(self.trainListView)
+        self.trainListPanel.setWidget(wid)
         self.addDockWidget(Qt.BottomDockWidgetArea, self.trainListPanel)
 
         # Services
@@ -358,9 +401,20 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QDockWidget.DockWidgetFloatable
         )
         self.serviceListPanel.setObjectName("services_panel")
+        wid = QtWidgets.QWidget()
+        vbox = QtWidgets.QVBoxLayout()
+        vbox.setSpacing(0)
+        vbox.setContentsMargins(0, 0, 0, 0)
+        wid.setLayout(vbox)
         self.serviceListView = servicelistview.ServiceListView(self)
+        self.serviceFilterBar = servicelistview.ServiceFilterBar(
+            self.serviceListView, self
+        )
         self.simulationLoaded.connect(self.serviceListView.setupServiceList)
-        self.serviceListPanel.setWidget(self.serviceListView)
+        self.simulationLoaded.connect(self.serviceFilterBar.setupFilters)
+        vbox.addWidget(self.serviceFilterBar)
+        vbox.addWidget(self.serviceListView)
+        self.serviceListPanel.setWidget(wid)
         self.addDockWidget(Qt.BottomDockWidgetArea, self.serviceListPanel)
         self.tabifyDockWidget(self.serviceListPanel, self.trainListPanel)
 
@@ -369,17 +423,58 @@ class MainWindow(QtWidgets.QMainWindow):
         self.loggerPanel.setFeatures(QtWidgets.QDockWidget.DockWidgetMovable |
                                      QtWidgets.QDockWidget.DockWidgetFloatable)
         self.loggerPanel.setObjectName("logger_panel")
+        wid = QtWidgets.QWidget()
+        vb = QtWidgets.QVBoxLayout()
+        vb.setSpacing(0)
+        vb.setContentsMargins(0, 0, 0, 0)
+        wid.setLayout(vb)
+        self.loggerFilterCombo = QtWidgets.QComboBox(self)
+        self.loggerFilterCombo.addItem(self.tr("All messages"), None)
+        self.loggerFilterCombo.addItem(self.tr("Simulation messages"),
+                                       logger.Message.SIMULATION_MSG)
+        self.loggerFilterCombo.addItem(self.tr("Warnings"),
+                                       logger.Message.PLAYER_WARNING_MSG)
+        self.loggerFilterCombo.addItem(self.tr("Software messages"),
+                                       logger.Message.SOFTWARE_MSG)
+        self.loggerFilterCombo.addItem(self.tr("Selected train"), "train")
+        self.loggerFilterCombo.currentIndexChanged.connect(
+            self.updateLoggerFilter
+        )
+        vb.addWidget(self.loggerFilterCombo)
         self.loggerView = QtWidgets.QTreeView(self)
         self.loggerView.setItemsExpandable(False)
         self.loggerView.setRootIsDecorated(False)
         self.loggerView.setHeaderHidden(True)
+        self.loggerView.setUniformRowHeights(True)
         self.loggerView.setPalette(QtGui.QPalette(Qt.black))
         self.loggerView.setVerticalScrollMode(
             QtWidgets.QAbstractItemView.ScrollPerItem
         )
-        self.loggerPanel.setWidget(self.loggerView)
+        vb.addWidget(self.loggerView)
+        self.loggerPanel.setWidget(wid)
         self.addDockWidget(Qt.BottomDockWidgetArea, self.loggerPanel)
 
+        # Tick instrumentation, only in debug mode
+        if settings.debug:
+            from ts2 import instrumentation
+            from ts2.gui import instrumentationview
+            inst = instrumentation.install()
+            self.instrumentationPanel = QtWidgets.QDockWidget(
+                self.tr("Tick profile"), self
+            )
+            self.instrumentationPanel.setFeatures(
+                QtWidgets.QDockWidget.DockWidgetMovable |
+                QtWidgets.QDockWidget.DockWidgetFloatable |
+                QtWidgets.QDockWidget.DockWidgetClosable
+            )
+            self.instrumentationPanel.setObjectName("instrumentation_panel")
+            self.instrumentationPanel.setWidget(
+                instrumentationview.InstrumentationView(inst, self)
+            )
+            self.simulationLoaded.connect(inst.reset)
+            self.addDockWidget(Qt.RightDockWidgetArea,
+                               self.instrumentationPanel)
+
         # ===========================================
         # Main Board
         self.board = QtWidgets.QWidget(self)
@@ -462,14 +557,30 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.simulationDisconnect()
                 self.simulation = None
 
+            worker = settings.b(settings.SIMULATION_WORKER, False)
+            recording = not worker and \
+                settings.b(settings.RECORD_REPLAYS, False)
+            seed = None
+            if recording:
+                # The simulation draws its random values from its own
+                # generator, so the seed and the player commands are enough
+                # to replay the game
+                seed = random.randrange(2 ** 32)
             try:
-                if zipfile.is_zipfile(fileName):
+                if worker:
+                    from ts2 import simulationworker
+                    # The file is parsed once for both processes
+                    data = simulation.readData(fileName)
+                    self.simulation = simulation.loadData(self, data)
+                    simulationworker.SimulationWorker(self.simulation, data)
+                elif zipfile.is_zipfile(fileName):
                     with zipfile.ZipFile(fileName) as zipArchive:
                         with zipArchive.open("simulation.json") as file:
-                            self.simulation = simulation.load(self, file)
+                            self.simulation = simulation.load(self, file,
+                                                              seed)
                 else:
                     with open(fileName) as file:
-                        self.simulation = simulation.load(self, file)
+                        self.simulation = simulation.load(self, file, seed)
             except (utils.FormatException,
                     utils.MissingDependencyException) as err:
                 QtWidgets.QMessageBox.critical(
@@ -483,28 +594,101 @@ class MainWindow(QtWidgets.QMainWindow):
                 dialogs.ExceptionDialog.popupException(self, err)
                 self.simulation = None
             else:
-                self.setWindowTitle(self.tr(
-                    "ts2 - Train Signalling Simulator - %s") % fileName)
-                self.lblTitle.setText(self.simulation.option("title"))
-                self.simulationConnect()
-                self.simulationLoaded.emit(self.simulation)
-
-                self.buttPause.toggled.connect(self.simulation.pause)
-                self.buttPause.toggled.connect(self.setPauseButtonText)
-                self.timeFactorSpinBox.valueChanged.connect(
-                    self.simulation.setTimeFactor
-                )
-                self.timeFactorSpinBox.setValue(
-                   float(self.simulation.option("timeFactor"))
-                )
+                if recording:
+                    self.startRecording(fileName, seed)
+                self.setupLoadedSimulation(fileName)
                 settings.addRecent(fileName)
                 self.refreshRecent()
-                self.setControlsDisabled(False)
             finally:
                 QtWidgets.QApplication.restoreOverrideCursor()
         else:
             self.onOpenSimulation()
 
+    def startRecording(self, fileName, seed):
+        """Records the game on the simulation loaded from fileName with
+        seed."""
+        from ts2 import replay
+        recordingName = "%s-%s.tsr" % (
+            os.path.splitext(os.path.basename(fileName))[0],
+            QtCore.QDateTime.currentDateTime().toString("yyyyMMdd-hhmmss")
+        )
+        try:
+            replay.Recorder(self.simulation,
+                            os.path.join(settings.replaysDir, recordingName),
+                            fileName, seed)
+        except OSError as err:
+            QtWidgets.QMessageBox.warning(
+                self,
+                self.tr("Error while recording the game"),
+                str(err),
+                QtWidgets.QMessageBox.Ok
+            )
+
+    @QtCore.pyqtSlot()
+    def onConnectToServer(self):
+        from ts2 import server
+        address, ok = QtWidgets.QInputDialog.getText(
+            self, self.tr("Connect to server"),
+            self.tr("Simulation server address (host:port):"),
+            text="127.0.0.1:%i" % server.DEFAULT_PORT
+        )
+        if ok and address:
+            self.connectToServer(address)
+
+    def connectToServer(self, address):
+        """Loads the simulation run by the simulation server at address, a
+        "host:port" string, and mirrors it."""
+        from ts2 import server
+        QtWidgets.qApp.setOverrideCursor(Qt.WaitCursor)
+
+        if self.simulation is not None:
+            self.simulationDisconnect()
+            self.simulation = None
+
+        try:
+            host, port = server.parseAddress(address)
+            self.simulation = server.connect(self, host, port)
+        except (OSError, ValueError, utils.FormatException) as err:
+            QtWidgets.QMessageBox.critical(
+                self,
+                self.tr("Error while connecting to the server"),
+                str(err),
+                QtWidgets.QMessageBox.Ok
+            )
+            self.simulation = None
+        except Exception as err:
+            dialogs.ExceptionDialog.popupException(self, err)
+            self.simulation = None
+        else:
+            self.fileName = None
+            self.setupLoadedSimulation(address)
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+
+    def setupLoadedSimulation(self, source):
+        """Sets up the window for the simulation just loaded from source, a
+        file name or a server address."""
+        self.setWindowTitle(self.tr(
+            "ts2 - Train Signalling Simulator - %s") % source)
+        self.lblTitle.setText(self.simulation.option("title"))
+        self.simulationConnect()
+        self.simulationLoaded.emit(self.simulation)
+
+        self.buttPause.toggled.connect(self.simulation.pause)
+        self.buttPause.toggled.connect(self.setPauseButtonText)
+        self.timeFactorSpinBox.valueChanged.connect(
+            self.simulation.setTimeFactor
+        )
+        self.timeFactorSpinBox.setValue(
+           int(float(self.simulation.option("timeFactor")))
+        )
+        self.setControlsDisabled(False)
+        if self.simulation.worker is None:
+            # The state of remote simulations is not available here
+            from ts2 import checkpoint
+            self.rewinder = checkpoint.Rewinder(self.simulation)
+            self.rewindAction.setEnabled(True)
+
     def simulationConnect(self):
         """Connects the signals and slots to the simulation."""
 
@@ -514,6 +698,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.loggerView.setModel(self.simulation.messageLogger)
         # Set scene
         self.view.setScene(self.simulation.scene)
+        self.signalOverlay = signaloverlay.SignalRoutesOverlay(
+            self.simulation
+        )
         # TrainListView
         self.trainListView.trainSelected.connect(
             self.simulation.trainSelected
@@ -547,12 +734,24 @@ class MainWindow(QtWidgets.QMainWindow):
         self.simulation.messageLogger.rowsInserted.connect(
             self.loggerView.scrollToBottom
         )
+        self.simulation.trainSelected.connect(self.updateLoggerFilter)
+        self.updateLoggerFilter()
         # Panel
         self.simulation.timeChanged.connect(self.clockWidget.setTime)
         self.simulation.scorer.scoreChanged.connect(
             self.scoreDisplay.display
         )
         self.scoreDisplay.display(self.simulation.scorer.score)
+        # Automatic route setting
+        self.autoRoutesAction.toggled.connect(
+            self.simulation.setAutoRouteSetting
+        )
+        self.simulation.setAutoRouteSetting(self.autoRoutesAction.isChecked())
+        # Departure forecast
+        self.simulation.forecastChanged.connect(
+            placeitem.Place.selectedPlaceModel.updateForecast
+        )
+        self.updateForecasting()
 
         # Menus
         self.saveGameAsAction.setEnabled(True)
@@ -560,10 +759,19 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def simulationDisconnect(self):
         """Disconnects the simulation for deletion."""
+        if self.simulation.worker is not None:
+            self.simulation.worker.stop()
+        if self.simulation.recorder is not None:
+            self.simulation.recorder.close()
+        if self.rewinder is not None:
+            self.rewinder.close()
+            self.rewinder = None
+            self.rewindAction.setEnabled(False)
         # Unset models
         self.trainInfoView.setModel(None)
         self.serviceInfoView.setModel(None)
         self.loggerView.setModel(None)
+        self.simulation.messageLogger.close()
         # Unset scene
         self.view.setScene(None)
         # Disconnect signals
@@ -595,6 +803,10 @@ class MainWindow(QtWidgets.QMainWindow):
             self.simulation.scorer.scoreChanged.disconnect()
         except TypeError:
             pass
+        try:
+            self.autoRoutesAction.toggled.disconnect()
+        except TypeError:
+            pass
         # Menus
         self.saveGameAsAction.setEnabled(False)
         self.propertiesAction.setEnabled(False)
@@ -649,6 +861,30 @@ class MainWindow(QtWidgets.QMainWindow):
                 train.showTrainActionsMenu(self.trainInfoView,
                                            self.trainInfoView.mapToGlobal(pos))
 
+    @QtCore.pyqtSlot()
+    def onRewind(self):
+        """Rewinds the game to a time chosen by the player."""
+        if not self.buttPause.isChecked():
+            self.buttPause.click()
+        time = dialogs.RewindDialog.getRewindTime(self, self.rewinder)
+        if time is None:
+            return
+        sim = self.simulation
+        if sim.recorder is not None:
+            # A replay cannot follow the game past a rewind
+            sim.recorder.close()
+        # The player's speed is kept, the rest of the game is rewound
+        timeFactor = sim.option("timeFactor")
+        QtWidgets.qApp.setOverrideCursor(Qt.WaitCursor)
+        try:
+            self.rewinder.rewind(time)
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+        sim.setOption("timeFactor", timeFactor)
+        self.clockWidget.setTime(sim.currentTime)
+        self.scoreDisplay.display(sim.scorer.score)
+        self.autoRoutesAction.setChecked(sim.autoRouteSetter is not None)
+
     @QtCore.pyqtSlot()
     def onEditorCurrent(self):
         if self.fileName:
@@ -660,6 +896,8 @@ class MainWindow(QtWidgets.QMainWindow):
         if not self.buttPause.isChecked():
             self.buttPause.click()
         if not self.editorOpened:
+            # The editor is imported here as most users only play
+            from ts2.editor import editorwindow
             self.editorWindow = editorwindow.EditorWindow(self, fileName)
             self.editorWindow.simulationConnect()
             self.editorWindow.closed.connect(self.onEditorClosed)
@@ -716,6 +954,14 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         """Save window postions on close"""
+        if self.simulation is not None and \
+                self.simulation.worker is not None:
+            self.simulation.worker.stop()
+        if self.simulation is not None and \
+                self.simulation.recorder is not None:
+            self.simulation.recorder.close()
+        if self.simulation is not None:
+            self.simulation.messageLogger.close()
         settings.saveWindow(self)
         settings.sync()
         super().closeEvent(event)
@@ -753,12 +999,38 @@ class MainWindow(QtWidgets.QMainWindow):
         self.lblServiceInfoCode.setText(serviceCode)
         self.lblServiceInfoDescription.setText(serv.description)
 
+    @QtCore.pyqtSlot()
+    def updateLoggerFilter(self):
+        """Filters the messages according to the logger filter combo box."""
+        if self.simulation is None:
+            return
+        msgType = self.loggerFilterCombo.currentData()
+        if msgType == "train":
+            train = self.simulation.selectedTrainModel.train
+            trainId = train.trainId if train is not None else -1
+            self.simulation.messageLogger.setFilter(trainId=trainId)
+        else:
+            self.simulation.messageLogger.setFilter(msgType=msgType)
+        self.loggerView.scrollToBottom()
+
+    @QtCore.pyqtSlot()
+    def updateForecasting(self):
+        """Enables the departure forecast only while it is shown, i.e. when
+        the expected times of a place or the late trains are displayed."""
+        if self.simulation is None:
+            return
+        self.simulation.setForecasting(
+            placeitem.Place.selectedPlaceModel.place is not None or
+            self.trainFilterBar.cboStatus.currentData() == "late"
+        )
+
     def onPlaceSelected(self):
         place = placeitem.Place.selectedPlaceModel.place
         self.lblPlaceInfoName.setText(place.name)
 
     def setControlsDisabled(self, state):
         self.editorCurrAction.setDisabled(state)
+        self.autoRoutesAction.setDisabled(state)
         self.zoomWidget.setDisabled(state)
 
     def openSettingsDialog(self):
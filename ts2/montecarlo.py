@@ -0,0 +1,256 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Monte Carlo analysis of the delays of a simulation.
+
+Usage::
+
+    python -m ts2.montecarlo [-n RUNS] [-j PROCESSES] [--duration SECS]
+                             [--seed N] [--manual-routes] [-o results.json]
+                             simulation.json
+
+The entry delays and the stop times of the trains are random, so that each
+game is one sample. This runs the simulation headlessly RUNS times, with the
+seeds N, N+1, ..., in a pool of worker processes. Unless --manual-routes is
+given, routes are set by the automatic route setter, so that all the runs
+use the same dispatching policy. Each worker parses the simulation file
+once and builds a fresh simulation from the parsed data for each run.
+
+The results, written as JSON, aggregate over all the runs:
+
+- the punctuality, i.e. the share of the station arrivals less than 1 and
+  5 minutes late,
+- the distribution of the lateness at each station,
+- the distribution of the final score,
+- the knock-on delays, i.e. the delay gained by the trains inside the area
+  on top of their delay when entering it.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+
+import ts2
+
+PUNCTUALITY_THRESHOLDS = (60, 300)
+"""Lateness in seconds under which an arrival is counted as punctual."""
+
+_worker = {}
+"""Per process state: the parsed simulation data and the Qt application."""
+
+
+def initWorker(fileName):
+    """Initializes a worker process: creates the Qt application and parses
+    the simulation file."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from Qt import QtWidgets
+    _worker["app"] = QtWidgets.QApplication.instance() or \
+        QtWidgets.QApplication([])
+    # Modules use qApp at import time, so import them after app creation
+    from ts2 import simulation
+    _worker["data"] = simulation.readData(fileName)
+
+
+def runOnce(seed, duration, timeFactor, autoRoutes):
+    """Runs the simulation parsed by :func:`initWorker` with the given seed,
+    and returns the raw results of the run as a dict."""
+    # Modules use qApp at import time, so import them after app creation
+    from ts2 import simulation
+    from ts2.simulationworker import HeadlessWindow
+    from ts2.trains import TrainStatus
+
+    sim = simulation.loadData(HeadlessWindow(), _worker["data"], seed)
+    sim.pause()
+    sim.setOption("timeFactor", timeFactor)
+    sim.setAutoRouteSetting(autoRoutes)
+
+    arrivals = []
+
+    def onArrival(trainId):
+        train = sim.trains[trainId]
+        line = train.currentService.lines[train.nextPlaceIndex]
+        if not line.scheduledArrivalTime.isValid():
+            return
+        lateness = line.scheduledArrivalTime.secsTo(sim.currentTime)
+        arrivals.append((line.placeCode, train.serviceCode, lateness,
+                         lateness - train.initialDelay))
+
+    for train in sim.trains:
+        train.trainStoppedAtStation.connect(onArrival)
+
+    secsPerTick = sim.timerInterval * timeFactor / 1000
+    start = time.perf_counter()
+    for i in range(int(duration / secsPerTick)):
+        sim.timerOut()
+    runTime = time.perf_counter() - start
+    _worker["app"].processEvents()
+
+    trainsOut = sum(1 for t in sim.trains if t.status == TrainStatus.OUT)
+    return {
+        "seed": seed,
+        "score": sim.scorer.score,
+        "arrivals": arrivals,
+        "trainsOut": trainsOut,
+        "runTime": runTime,
+    }
+
+
+def _runTask(args):
+    return runOnce(*args)
+
+
+def distribution(values):
+    """Returns summary statistics of the list of numbers values."""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def percentile(fraction):
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    return {
+        "count": len(values),
+        "mean": statistics.mean(values),
+        "stdev": statistics.pstdev(values),
+        "min": values[0],
+        "p10": percentile(0.1),
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "max": values[-1],
+    }
+
+
+def aggregate(runs):
+    """Aggregates the raw results of the runs."""
+    arrivals = [a for run in runs for a in run["arrivals"]]
+    lateness = [a[2] for a in arrivals]
+    knockOn = [a[3] for a in arrivals]
+    stations = {}
+    for placeCode, serviceCode, late, gained in arrivals:
+        stations.setdefault(placeCode, []).append(late)
+    punctuality = {
+        "within%is" % threshold: (
+            sum(1 for late in lateness if late < threshold) / len(lateness)
+            if lateness else None
+        )
+        for threshold in PUNCTUALITY_THRESHOLDS
+    }
+    perRunPunctuality = [
+        sum(1 for a in run["arrivals"] if a[2] < PUNCTUALITY_THRESHOLDS[-1]) /
+        len(run["arrivals"])
+        for run in runs if run["arrivals"]
+    ]
+    return {
+        "runs": len(runs),
+        "arrivals": len(arrivals),
+        "punctuality": punctuality,
+        "punctualityPerRun": distribution(perRunPunctuality),
+        "lateness": distribution(lateness),
+        "stations": {placeCode: distribution(values)
+                     for placeCode, values in sorted(stations.items())},
+        "score": distribution([run["score"] for run in runs]),
+        "knockOnDelay": distribution(knockOn),
+        "knockOnDelayed": (sum(1 for d in knockOn if d >= 60) / len(knockOn)
+                           if knockOn else None),
+        "trainsOut": distribution([run["trainsOut"] for run in runs]),
+    }
+
+
+def runBatch(fileName, runs, processes=None, duration=3600, seed=0,
+             timeFactor=5, autoRoutes=True):
+    """Runs the simulation fileName runs times in a pool of processes
+    worker processes (one per core by default), and returns the aggregated
+    results and the raw results of each run."""
+    tasks = [(seed + i, duration, timeFactor, autoRoutes)
+             for i in range(runs)]
+    # Qt must not be forked, hence spawn
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, initializer=initWorker,
+                      initargs=(fileName,)) as pool:
+        results = list(pool.imap_unordered(_runTask, tasks))
+    results.sort(key=lambda r: r["seed"])
+    return aggregate(results), results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        "ts2.montecarlo", description="Runs a simulation many times with "
+                                      "different seeds and reports delay "
+                                      "statistics as JSON."
+    )
+    parser.add_argument("file", help="simulation file")
+    parser.add_argument("-o", "--output", help="write results to this file")
+    parser.add_argument("-n", "--runs", type=int, default=16,
+                        help="number of runs (default: 16)")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="worker processes (default: number of cores)")
+    parser.add_argument("--duration", type=float, default=3600,
+                        help="simulated seconds per run (default: 3600)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the first run (default: 0)")
+    parser.add_argument("--time-factor", type=int, default=5,
+                        help="simulated seconds per real second of the "
+                             "game clock, sets the tick step (default: 5)")
+    parser.add_argument("--manual-routes", action="store_true",
+                        help="do not set routes automatically")
+    parser.add_argument("--raw", action="store_true",
+                        help="include the arrivals of each run")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    summary, runs = runBatch(args.file, args.runs, args.processes,
+                             args.duration, args.seed, args.time_factor,
+                             not args.manual_routes)
+    results = {
+        "version": ts2.__VERSION__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "file": args.file,
+        "seed": args.seed,
+        "duration": args.duration,
+        "timeFactor": args.time_factor,
+        "autoRoutes": not args.manual_routes,
+        "processes": args.processes or os.cpu_count(),
+        "wallTime": time.perf_counter() - start,
+        "summary": summary,
+    }
+    if args.raw:
+        results["runs"] = runs
+    else:
+        results["runs"] = [{key: value for key, value in run.items()
+                            if key != "arrivals"} for run in runs]
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Recording and deterministic replay of games.
+
+Usage::
+
+    python -m ts2.replay recording.tsr [--simulation FILE] [--until HH:MM:SS]
+                         [--seek HH:MM:SS ...]
+
+The random values of a simulation, the delays of the trains at entry and
+their stop times, are drawn from its own generator, which nothing else uses,
+and the game clock advances by fixed steps, so a game is reproduced exactly
+from:
+
+- the simulation file, identified by its hash,
+- the seed of the random generator of the simulation,
+- the player commands, i.e. the methods decorated with
+  :func:`~ts2.utils.playerCommand`, with the number of clock ticks run
+  before each of them.
+
+The :class:`Recorder` writes these to a recording, one JSON object per line,
+along with the hash of the state of the simulation every hashInterval ticks.
+The :class:`Replayer` runs the recording again without the game clock, as
+fast as possible, checks the hashes, and keeps checkpoints so that it can
+seek to any tick or time by running at most checkpointInterval ticks.
+"""
+
+import argparse
+import bisect
+import contextlib
+import hashlib
+import os
+import sys
+import time
+
+import simplejson as json
+from Qt import QtCore
+
+from ts2 import checkpoint, simulation, simulationworker, utils
+
+RECORDING_VERSION = 1
+
+UNRECORDED_COMMANDS = {"saveGame"}
+"""Player commands which do not change the state of the game."""
+
+UNREPLAYED_COMMANDS = {"pause"}
+"""Player commands which are recorded but not replayed, because the replay
+drives the clock itself."""
+
+
+def fileHash(fileName):
+    """Returns the SHA-256 hash of the content of fileName."""
+    sha = hashlib.sha256()
+    with open(fileName, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def stateHash(sim):
+    """Returns a hash of the state of the simulation sim, as displayed to
+    the player: time, score, trains, occupation, routes and signals."""
+    snapshot = simulationworker.takeSnapshot(sim)
+    state = (snapshot.time, snapshot.score, snapshot.trains,
+             snapshot.occupation, snapshot.highlights, snapshot.signals,
+             sorted(snapshot.reversedPoints),
+             sorted(snapshot.persistentRoutes), snapshot.selectedSignal)
+    return hashlib.sha1(repr(state).encode("utf-8")).hexdigest()
+
+
+class Recorder(QtCore.QObject):
+    """Records the game played on a simulation. The simulation must have
+    been loaded with seed, and the recorder must be created before any
+    player command."""
+
+    def __init__(self, sim, fileName, simulationFile, seed, hashInterval=120):
+        """
+        :param sim: the simulation
+        :param fileName: file to write the recording to
+        :param simulationFile: file from which sim was loaded
+        :param seed: seed with which sim was loaded
+        :param hashInterval: number of ticks between two state hashes
+        """
+        super().__init__(sim)
+        self.simulation = sim
+        self.fileName = fileName
+        self.hashInterval = hashInterval
+        self.tick = 0
+        self._depth = 0
+        self._ticking = False
+        self._file = open(fileName, "w", encoding="utf-8")
+        self._write({
+            "type": "header",
+            "version": RECORDING_VERSION,
+            "simulation": os.path.abspath(simulationFile),
+            "hash": fileHash(simulationFile),
+            "seed": seed,
+            "title": sim.option("title"),
+        })
+        self._writeHash()
+        # Count the ticks and tell them from player commands
+        sim._timer.timeout.disconnect(sim.timerOut)
+        sim._timer.timeout.connect(self.runTick)
+        sim.recorder = self
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def _writeHash(self):
+        self._write({
+            "type": "hash",
+            "tick": self.tick,
+            "time": self.simulation.currentTime.msecsSinceStartOfDay(),
+            "hash": stateHash(self.simulation)
+        })
+
+    @QtCore.pyqtSlot()
+    def runTick(self):
+        """Runs a tick of the game clock."""
+        self._ticking = True
+        try:
+            self.simulation.timerOut()
+        finally:
+            self._ticking = False
+        self.tick += 1
+        if self.tick % self.hashInterval == 0:
+            self._writeHash()
+
+    @contextlib.contextmanager
+    def recording(self, target, methodName, args):
+        """Context manager recording the player command methodName called
+        with args on target while it is executed. The commands called by the
+        simulation itself, during a tick or by another command, are not
+        recorded since they are executed again by the replay."""
+        if self._depth == 0 and not self._ticking and \
+                methodName not in UNRECORDED_COMMANDS:
+            sim = self.simulation
+            self._write({
+                "type": "command",
+                "tick": self.tick,
+                "time": sim.currentTime.msecsSinceStartOfDay(),
+                "kind": "simulation" if target is sim else "train",
+                "trainId": None if target is sim else target.trainId,
+                "method": methodName,
+                "args": list(args)
+            })
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+
+    def close(self):
+        """Stops recording."""
+        sim = self.simulation
+        if sim.recorder is self:
+            if self.tick % self.hashInterval:
+                # Marks the end of the recording
+                self._writeHash()
+            sim.recorder = None
+            sim._timer.timeout.disconnect(self.runTick)
+            sim._timer.timeout.connect(sim.timerOut)
+            self._file.close()
+
+
+def readRecording(fileName):
+    """Returns the header, the commands and the hashes of the recording
+    fileName. The hashes are given as a dict {tick: hash}.
+
+    :raises ts2.utils.FormatException: if fileName is not a recording
+    """
+    header = None
+    commands = []
+    hashes = {}
+    with open(fileName, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Last line of a recording interrupted by a crash
+                break
+            if entry.get("type") == "header":
+                header = entry
+            elif entry.get("type") == "command":
+                commands.append(entry)
+            elif entry.get("type") == "hash":
+                hashes[entry["tick"]] = entry["hash"]
+    if header is None or header.get("version") != RECORDING_VERSION:
+        raise utils.FormatException(
+            "%s is not a ts2 recording" % fileName
+        )
+    return header, commands, hashes
+
+
+class Replayer:
+    """Replays a recording on a simulation loaded for it."""
+
+    def __init__(self, fileName, simulationFile=None,
+                 checkpointInterval=1200):
+        """
+        :param fileName: the recording
+        :param simulationFile: the simulation file, by default the one
+        given in the recording
+        :param checkpointInterval: number of ticks between two checkpoints
+
+        :raises ts2.utils.FormatException: if the simulation file is not the
+        recorded one
+        """
+        self.header, self.commands, self.hashes = readRecording(fileName)
+        simulationFile = simulationFile or self.header["simulation"]
+        if fileHash(simulationFile) != self.header["hash"]:
+            raise utils.FormatException(
+                "%s is not the simulation of the recording" % simulationFile
+            )
+        self.checkpointInterval = checkpointInterval
+        self._commandTicks = [command["tick"] for command in self.commands]
+        self.mismatches = []
+        self.checkedHashes = 0
+        data = simulation.readData(simulationFile)
+        self.simulation = simulation.loadData(
+            simulationworker.HeadlessWindow(), data, self.header["seed"]
+        )
+        self.simulation.pause()
+        self.tick = 0
+        self._nextCommand = 0
+        self.checkpoints = [checkpoint.takeCheckpoint(self.simulation, 0)]
+        self.checkHash()
+
+    @property
+    def lastTick(self):
+        """Last tick of which the state is known from the recording."""
+        return max(list(self.hashes) + self._commandTicks)
+
+    def checkHash(self):
+        """Compares the state of the simulation with the recorded hash of
+        the current tick, if any."""
+        recorded = self.hashes.get(self.tick)
+        if recorded is not None:
+            self.checkedHashes += 1
+            if stateHash(self.simulation) != recorded:
+                self.mismatches.append(self.tick)
+
+    def step(self):
+        """Executes the commands recorded before the current tick, then
+        runs the tick."""
+        sim = self.simulation
+        while self._nextCommand < len(self.commands) and \
+                self.commands[self._nextCommand]["tick"] <= self.tick:
+            command = self.commands[self._nextCommand]
+            self._nextCommand += 1
+            if command["method"] in UNREPLAYED_COMMANDS:
+                continue
+            simulationworker.executeCommand(
+                sim, command["kind"], command["trainId"], command["method"],
+                command["args"]
+            )
+            # Commands such as setTimeFactor start the game clock
+            sim.pause()
+        sim.timerOut()
+        self.tick += 1
+        self.checkHash()
+        if self.tick % self.checkpointInterval == 0 and \
+                self.tick > self.checkpoints[-1].tick:
+            self.checkpoints.append(
+                checkpoint.takeCheckpoint(sim, self.tick)
+            )
+
+    def _restore(self, cp):
+        checkpoint.restoreCheckpoint(self.simulation, cp)
+        self.tick = cp.tick
+        self._nextCommand = bisect.bisect_left(self._commandTicks, cp.tick)
+
+    def seek(self, tick):
+        """Puts the simulation in its state after tick ticks, starting from
+        the closest checkpoint or from the current state."""
+        ticks = [cp.tick for cp in self.checkpoints]
+        cp = self.checkpoints[bisect.bisect_right(ticks, tick) - 1]
+        if not cp.tick <= self.tick <= tick:
+            self._restore(cp)
+        while self.tick < tick:
+            self.step()
+
+    def seekTime(self, msecs):
+        """Puts the simulation in its state at the first tick at which its
+        time is msecs since midnight or later."""
+        cps = [cp for cp in self.checkpoints
+               if cp.time.msecsSinceStartOfDay() <= msecs]
+        if cps and not (cps[-1].tick <= self.tick and
+                        self.simulation.currentTime.msecsSinceStartOfDay()
+                        <= msecs):
+            self._restore(cps[-1])
+        while self.simulation.currentTime.msecsSinceStartOfDay() < msecs:
+            self.step()
+
+    def run(self, tick=None):
+        """Replays up to tick, by default up to the end of the recording.
+        Returns the list of ticks at which the state did not match the
+        recording."""
+        self.seek(self.lastTick if tick is None else tick)
+        return self.mismatches
+
+
+def parseTime(text):
+    time_ = QtCore.QTime.fromString(text, "hh:mm:ss")
+    if not time_.isValid():
+        raise argparse.ArgumentTypeError("invalid time: %s" % text)
+    return time_.msecsSinceStartOfDay()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        "ts2.replay", description="Replays a recorded game headlessly and "
+                                  "checks that it matches the recording."
+    )
+    parser.add_argument("recording", help="recording file (.tsr)")
+    parser.add_argument("--simulation",
+                        help="simulation file, if it was moved")
+    parser.add_argument("--until", type=parseTime,
+                        help="stop at this time (hh:mm:ss)")
+    parser.add_argument("--seek", type=parseTime, action="append",
+                        default=[], help="seek to this time after the "
+                                         "replay (hh:mm:ss), repeatable")
+    parser.add_argument("--checkpoint-interval", type=int, default=1200,
+                        help="ticks between two checkpoints (default: "
+                             "1200)")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from Qt import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    start = time.perf_counter()
+    replayer = Replayer(args.recording, args.simulation,
+                        args.checkpoint_interval)
+    loadTime = time.perf_counter() - start
+    start = time.perf_counter()
+    if args.until is not None:
+        replayer.seekTime(args.until)
+    else:
+        replayer.run()
+    runTime = time.perf_counter() - start
+    sim = replayer.simulation
+    print("%s: %i ticks, %i commands, %i hashes checked, replayed in "
+          "%.2fs (+%.2fs load), now at %s, score %i"
+          % (replayer.header.get("title"), replayer.tick,
+             replayer._nextCommand, replayer.checkedHashes, runTime, loadTime,
+             sim.currentTime.toString("hh:mm:ss"), sim.scorer.score))
+    for msecs in args.seek:
+        start = time.perf_counter()
+        replayer.seekTime(msecs)
+        print("Seek to %s: tick %i in %.3fs"
+              % (sim.currentTime.toString("hh:mm:ss"), replayer.tick,
+                 time.perf_counter() - start))
+    if replayer.mismatches:
+        print("State differs from the recording at ticks: %s"
+              % ", ".join(str(t) for t in replayer.mismatches[:20]))
+        return 1
+    print("Replay matches the recording")
+    del app
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+from Qt import QtCore
+
+from ts2.scenery import lineitem, enditem, pointsitem
+from ts2.scenery.signals import signalitem
+from ts2.trains import TrainStatus
+from . import position
+
+EXIT = None
+"""Goal of the trains which have no more place to call at: leaving the
+area."""
+
+
+class AutoRouteSetter(QtCore.QObject):
+    """Automatic route setting driven by the trains timetables.
+
+    At each step, for each active train, the engine finds the first signal
+    ahead of the train which has no route set from it, and the next place of
+    the train service. If the train is close enough to the signal, it asks
+    for the first route of the shortest chain of routes from this signal to
+    the planned track of the place (any track of the place if the planned
+    one cannot be reached). Trains stopped at a station ask for their route
+    shortly before their departure time, and trains held at a signal ask
+    for it whatever the distance. The requests are then served by decreasing
+    lateness of the trains, so that the latest train wins when two requested
+    routes conflict. Routes are not set onto occupied track.
+
+    Chains are searched once for each signal and goal, since the routes do
+    not change during the game.
+    """
+
+    def __init__(self, simulation, leadTime=60, minDistance=400,
+                 chainLength=2, maxSearchDepth=12):
+        """Constructor for the AutoRouteSetter class.
+
+        :param leadTime: A route is set when the train is less than leadTime
+        seconds from its begin signal at its current speed, or when it is
+        due to depart from a station in less than leadTime seconds.
+        :param minDistance: A route is always set when the train is closer
+        than minDistance metres from its begin signal.
+        :param chainLength: Maximum number of routes set ahead of a train.
+        :param maxSearchDepth: Maximum number of routes of a chain.
+        """
+        super().__init__(simulation)
+        self.simulation = simulation
+        self.leadTime = leadTime
+        self.minDistance = minDistance
+        self.chainLength = chainLength
+        self.maxSearchDepth = maxSearchDepth
+        self.routesSet = 0
+        self._routeTargets = {}
+        self._exitSignals = set()
+        self._chains = {}
+        self.setup()
+
+    def setup(self):
+        """Computes the places served by each route, and the signals after
+        which trains leave the area."""
+        self._routeTargets = {}
+        self._chains = {}
+        for rte in self.simulation.routes.values():
+            targets = set()
+            for pos in rte.positions[1:]:
+                ti = pos.trackItem
+                if isinstance(ti, lineitem.LineItem) and ti.placeCode:
+                    targets.add((ti.placeCode, ti.trackCode))
+                    targets.add((ti.placeCode, ""))
+            self._routeTargets[rte.routeNum] = targets
+        self._exitSignals = set()
+        endSignals = {rte.endSignal.tiId: rte.endSignal
+                      for rte in self.simulation.routes.values()}
+        placesAhead = {}
+        for si in endSignals.values():
+            places, leadsOut = self._placesAhead(si)
+            placesAhead[si.tiId] = places
+            if leadsOut and not self.simulation.routesFrom(si):
+                self._exitSignals.add(si.tiId)
+        # Places on the plain line after the end signal, e.g. beyond the
+        # last signal before the exit, are also reached by the route
+        for rte in self.simulation.routes.values():
+            self._routeTargets[rte.routeNum] |= \
+                placesAhead[rte.endSignal.tiId]
+
+    def _placesAhead(self, si, maxItems=200):
+        """Walks the line ahead of si up to the next points or the next
+        signal from which routes start.
+
+        :return: (places, leadsOut) - the (placeCode, trackCode) of the line
+        items met, and True if the line leads out of the area.
+        """
+        places = set()
+        cur = position.Position(si, si.previousItem, 0)
+        for i in range(maxItems):
+            cur = cur.next()
+            ti = cur.trackItem
+            if ti is None or isinstance(ti, pointsitem.PointsItem):
+                break
+            if isinstance(ti, signalitem.SignalItem) and \
+                    ti.isOnPosition(cur) and self.simulation.routesFrom(ti):
+                break
+            if isinstance(ti, enditem.EndItem):
+                return places, True
+            if isinstance(ti, lineitem.LineItem) and ti.placeCode:
+                places.add((ti.placeCode, ti.trackCode))
+                places.add((ti.placeCode, ""))
+        return places, False
+
+    def findChain(self, si, goal):
+        """
+        :param si: The :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        to start from.
+        :param goal: A (placeCode, trackCode) tuple, trackCode being empty
+        for any track of the place, or EXIT.
+        :return: The shortest chain of routes from si to a route reaching
+        goal, or None if there is none.
+        :rtype: tuple of :class:`~ts2.routing.route.Route`
+        """
+        key = (si.tiId, goal)
+        if key not in self._chains:
+            if goal is EXIT:
+                def isGoal(rte):
+                    return rte.endSignal.tiId in self._exitSignals
+            else:
+                def isGoal(rte):
+                    return goal in self._routeTargets[rte.routeNum]
+            paths = self.simulation.routeGraph.search(
+                si, isGoal, maxDepth=self.maxSearchDepth
+            )
+            self._chains[key] = paths[0] if paths else None
+        return self._chains[key]
+
+    def _goals(self, lines, index):
+        """Yields the goals to try for a train whose next place is at index
+        in lines. A train which cannot reach any of its next places, e.g.
+        because it must be reversed first, is left to the player."""
+        if index is None:
+            yield EXIT
+            return
+        for line in lines[index:index + 3]:
+            if line.trackCode:
+                yield (line.placeCode, line.trackCode)
+            yield (line.placeCode, "")
+
+    def _nextSignal(self, train, maxItems=500):
+        """Returns the first signal ahead of the train head and its distance,
+        or (None, 0) if the train leaves the area before any signal."""
+        cur = train.trainHead
+        distance = cur.trackItem.realLength - cur.positionOnTI
+        for i in range(maxItems):
+            if isinstance(cur.trackItem, enditem.EndItem):
+                return None, 0
+            cur = cur.next()
+            ti = cur.trackItem
+            if ti is None:
+                return None, 0
+            if isinstance(ti, signalitem.SignalItem) and ti.isOnPosition(cur):
+                return ti, distance
+            distance += ti.realLength
+        return None, 0
+
+    def routeRequest(self, train, now):
+        """
+        :return: (lateness, route) - the route to set now for train, and the
+        lateness of the train in seconds, or None if no route is to be set.
+        """
+        service = train.currentService
+        if service is None:
+            return None
+        lines = service.lines
+        index = train.nextPlaceIndex
+        if train.status == TrainStatus.STOPPED:
+            # Wait until departure is near and route towards the next place
+            if index is None or index + 1 >= len(lines):
+                return None
+            departure = lines[index].scheduledDepartureTime
+            if departure.isNull() or now.secsTo(departure) > self.leadTime:
+                return None
+            index += 1
+        si, distance = self._nextSignal(train)
+        if si is None:
+            return None
+        # Follow the routes already set ahead of the train
+        for i in range(self.chainLength):
+            rte = si.nextActiveRoute
+            if rte is None:
+                break
+            if index is not None:
+                line = lines[index]
+                if (line.placeCode, "") in self._routeTargets[rte.routeNum]:
+                    if line.mustStop:
+                        # The train will stop at the end of this route
+                        return None
+                    index = index + 1 if index + 1 < len(lines) else None
+            distance += self.simulation.routeGraph.routeLength(rte)
+            si = rte.endSignal
+        else:
+            return None
+        if train.status != TrainStatus.WAITING and \
+                distance > max(self.minDistance, train.speed * self.leadTime):
+            # Too early, unless the train is held by a signal already
+            return None
+        for goal in self._goals(lines, index):
+            chain = self.findChain(si, goal)
+            if chain is not None:
+                return self.lateness(lines, index, now), chain[0]
+        return None
+
+    @staticmethod
+    def lateness(lines, index, now):
+        """Returns the lateness in seconds of a train heading for the place
+        at index in lines."""
+        if index is None:
+            return 0
+        line = lines[index]
+        scheduled = line.scheduledArrivalTime
+        if scheduled.isNull():
+            scheduled = line.scheduledDepartureTime
+        if scheduled.isNull():
+            return 0
+        return scheduled.secsTo(now)
+
+    @QtCore.pyqtSlot(float)
+    def update(self, secs):
+        """Sets the routes requested by the trains, latest trains first.
+        This slot is connected to the simulation timeElapsed signal."""
+        now = self.simulation.currentTime
+        requests = []
+        for train in self.simulation.trains:
+            if train.isActive():
+                request = self.routeRequest(train, now)
+                if request is not None:
+                    requests.append(request)
+        if not requests:
+            return
+        requests.sort(key=lambda r: r[0], reverse=True)
+        statuses = self.simulation.routeConflicts.routeStatuses(
+            self.simulation, [rte for lateness, rte in requests]
+        )
+        for status in statuses:
+            rte = status.route
+            if status.activable and not status.occupied \
+                    and rte.beginSignal.nextActiveRoute is None \
+                    and rte.isActivable():
+                rte.activate()
+                self.routesSet += 1
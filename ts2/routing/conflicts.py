@@ -0,0 +1,200 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+class RouteStatus:
+    """Whether a route can be activated now, and if not, why.
+
+    The reasons are the class constants. A route whose items are occupied by
+    a train can still be activated, so occupied is given in addition to the
+    reason.
+    """
+    CONFLICTING_ROUTE = "conflictingRoute"
+    POINTS_LOCKED = "pointsLocked"
+
+    def __init__(self, route, reason=None, blockingRoute=None,
+                 occupied=False):
+        """Constructor for the RouteStatus class."""
+        self.route = route
+        self.reason = reason
+        self.blockingRoute = blockingRoute
+        self.occupied = occupied
+
+    @property
+    def activable(self):
+        """True if the route can be activated."""
+        return self.reason is None
+
+
+class RouteConflicts:
+    """Precomputed conflict matrix between the routes of a simulation.
+
+    Each route is given a bit. For each route R, the conflict mask holds the
+    bits of all the routes S which, when active, may prevent R from being
+    activated, i.e. S goes through an item of R (other than its begin and end
+    signals) or through the conflict item of one of them. A route conflicts
+    with itself, since setting it again is subject to the same checks.
+
+    The mask of the routes holding at least one track item is maintained as
+    routes are set and released, so that a route with no conflicting route
+    held is known to be activable with a single bitwise AND. Since a route
+    can be released item by item as the train tail passes, a conflicting
+    route being held only means that the route may not be activable: the
+    items must then be checked.
+    """
+
+    def __init__(self):
+        """Constructor for the RouteConflicts class."""
+        self._bits = {}
+        self._routes = []
+        self._conflictMasks = []
+        self._heldCounts = []
+        self.heldMask = 0
+        self._valid = False
+
+    def invalidate(self):
+        """Marks the matrix for rebuild, e.g. when routes are added or
+        deleted. It is rebuilt on next query."""
+        self._valid = False
+
+    def build(self, routes):
+        """Computes the conflict matrix of the given initialized routes and
+        the currently held routes from the state of their items."""
+        routes = sorted(routes)
+        self._bits = {rte.routeNum: bit for bit, rte in enumerate(routes)}
+        self._routes = routes
+        # Mask of the routes going through each item
+        itemMasks = {}
+        for bit, rte in enumerate(routes):
+            for pos in rte.positions:
+                tiId = pos.trackItem.tiId
+                itemMasks[tiId] = itemMasks.get(tiId, 0) | (1 << bit)
+        self._conflictMasks = []
+        for rte in routes:
+            mask = 0
+            for pos in rte.positions[1:-1]:
+                ti = pos.trackItem
+                mask |= itemMasks.get(ti.tiId, 0)
+                if ti.conflictTI is not None:
+                    mask |= itemMasks.get(ti.conflictTI.tiId, 0)
+            self._conflictMasks.append(mask)
+        self._heldCounts = [0] * len(routes)
+        self.heldMask = 0
+        self._valid = True
+        for rte in routes:
+            for pos in rte.positions:
+                if pos.trackItem.activeRoute is rte:
+                    self.itemHeld(rte)
+
+    def _ensureValid(self, simulation):
+        if not self._valid:
+            self.build(simulation.routes.values())
+
+    def bit(self, rte):
+        """Returns the bit of rte, or None if rte is not in the matrix."""
+        return self._bits.get(rte.routeNum)
+
+    def itemHeld(self, rte):
+        """Called when a track item is set on route rte."""
+        bit = self._bits.get(rte.routeNum) if self._valid else None
+        if bit is None or self._routes[bit] is not rte:
+            return
+        self._heldCounts[bit] += 1
+        self.heldMask |= 1 << bit
+
+    def itemReleased(self, rte):
+        """Called when a track item set on route rte is released."""
+        bit = self._bits.get(rte.routeNum) if self._valid else None
+        if bit is None or self._routes[bit] is not rte \
+                or not self._heldCounts[bit]:
+            return
+        self._heldCounts[bit] -= 1
+        if not self._heldCounts[bit]:
+            self.heldMask &= ~(1 << bit)
+
+    def conflictMask(self, rte):
+        """Returns the mask of the routes that may prevent rte from being
+        activated, or None if rte is not in the matrix."""
+        self._ensureValid(rte.simulation)
+        bit = self._bits.get(rte.routeNum)
+        if bit is None or self._routes[bit] is not rte:
+            return None
+        return self._conflictMasks[bit]
+
+    def conflicts(self, rte, other):
+        """Returns True if other, when active, may prevent rte from being
+        activated."""
+        mask = self.conflictMask(rte)
+        bit = self.bit(other)
+        return mask is None or bit is None or bool(mask >> bit & 1)
+
+    def isFree(self, rte):
+        """Returns True if no route that may conflict with rte is held, in
+        which case rte is activable. Returns False if rte is unknown to the
+        matrix, e.g. a route being edited."""
+        mask = self.conflictMask(rte)
+        return mask is not None and not mask & self.heldMask
+
+    def routesFromMask(self, mask):
+        """Returns the list of routes whose bits are set in mask."""
+        routes = []
+        bit = 0
+        while mask:
+            if mask & 1:
+                routes.append(self._routes[bit])
+            mask >>= 1
+            bit += 1
+        return routes
+
+    def activableRoutes(self, simulation):
+        """Returns the list of the routes of simulation that can be activated
+        now, in route number order."""
+        self._ensureValid(simulation)
+        held = self.heldMask
+        return [rte for rte, mask in zip(self._routes, self._conflictMasks)
+                if not mask & held or rte.isActivable()]
+
+    def routeStatuses(self, simulation, routes):
+        """Returns the list of the :class:`RouteStatus` of routes.
+
+        The held routes and the occupancy of each track item are read once
+        for all the routes, which typically share their first items.
+        """
+        self._ensureValid(simulation)
+        held = self.heldMask
+        occupancy = {}
+        statuses = []
+        for rte in routes:
+            mask = self.conflictMask(rte)
+            if mask is not None and not mask & held:
+                reason, blockingRoute = None, None
+            else:
+                reason, blockingRoute = rte.blockingReason()
+            occupied = False
+            for pos in rte.positions[1:-1]:
+                ti = pos.trackItem
+                present = occupancy.get(ti.tiId)
+                if present is None:
+                    present = occupancy[ti.tiId] = bool(ti.trainPresent())
+                if present:
+                    occupied = True
+                    break
+            statuses.append(RouteStatus(rte, reason, blockingRoute, occupied))
+        return statuses
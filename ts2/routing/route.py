@@ -23,7 +23,7 @@ from Qt import QtCore, Qt
 from ts2 import utils
 from ts2.game import logger
 from ts2.scenery import pointsitem
-from . import position
+from . import position, conflicts
 
 
 class RoutesModel(QtCore.QAbstractTableModel):
@@ -64,7 +64,11 @@ class RoutesModel(QtCore.QAbstractTableModel):
         if role == Qt.EditRole:
             if index.column() == 3:
                 routeNum = int(index.sibling(index.row(), 0).data())
-                self._editor.routes[routeNum].initialState = value
+                self._editor.editAttributes(
+                    self.tr("Edit route"),
+                    [(self._editor.routes[routeNum], "initialState", value)],
+                    self
+                )
                 self.dataChanged.emit(index, index)
                 return True
         return False
@@ -295,7 +299,19 @@ class Route(QtCore.QObject):
         :return: ``True`` - if this route can be activated, i.e. that no other
                     active route is conflicting with this route.
         """
-        flag = False
+        if self.simulation.routeConflicts.isFree(self):
+            # No route that may conflict with this one is set
+            return True
+        return self.blockingReason()[0] is None
+
+    def blockingReason(self):
+        """
+        :return: ``(reason, route)`` - why this route cannot be activated and
+                 the active route preventing it. reason is one of the
+                 :class:`~ts2.routing.conflicts.RouteStatus` reasons, or
+                 ``None`` if this route can be activated.
+        """
+        flag = None
         for pos in self._positions:
             if pos.trackItem != self.beginSignal and \
                pos.trackItem != self.endSignal:
@@ -303,33 +319,35 @@ class Route(QtCore.QObject):
                    and pos.trackItem.conflictTI.activeRoute is not None:
                     # The trackItem has a conflict item and this conflict item
                     # has an active route
-                    return False
+                    return (conflicts.RouteStatus.CONFLICTING_ROUTE,
+                            pos.trackItem.conflictTI.activeRoute)
                 if pos.trackItem.activeRoute is not None:
                     # The trackItem already has an active route
                     if isinstance(pos.trackItem, pointsitem.PointsItem) \
-                            and not flag:
+                            and flag is None:
                         # The trackItem is a pointsItem and it is the first
                         # trackItem with active route that we meet
-                        return False
+                        return (conflicts.RouteStatus.POINTS_LOCKED,
+                                pos.trackItem.activeRoute)
                     if pos.previousTI != pos.trackItem.activeRoutePreviousItem:
                         # The direction of this route is different from that
                         # of the active route of the TI
-                        return False
+                        return (conflicts.RouteStatus.CONFLICTING_ROUTE,
+                                pos.trackItem.activeRoute)
                     if pos.trackItem.activeRoute == self:
                         # Always allow to setup the same route again
-                        return True
+                        return None, None
                     else:
-                        # We set flag to true to remember we have come across
-                        # a TI with activeRoute with same dir. This enables
-                        # the user to set a route ending with the same end
-                        # signal when it is cleared by a train still
-                        # on the route
-                        flag = True
-                elif flag:
+                        # We remember the route we have come across on a TI
+                        # with the same dir. This enables the user to set a
+                        # route ending with the same end signal when it is
+                        # cleared by a train still on the route
+                        flag = pos.trackItem.activeRoute
+                elif flag is not None:
                     # We had a route with same direction but does not end with
                     # the same signal
-                    return False
-        return True
+                    return conflicts.RouteStatus.CONFLICTING_ROUTE, flag
+        return None, None
 
     @property
     def persistent(self):
@@ -341,6 +359,9 @@ class Route(QtCore.QObject):
     def persistent(self, p=True):
         """Setter function for the ``persistent`` property"""
         self._persistent = p
+        if self.simulation is not None and \
+                self.simulation.changeTracker is not None:
+            self.simulation.changeTracker.persistenceChanged(self)
 
     def __eq__(self, other):
         """
@@ -0,0 +1,179 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+import heapq
+
+from ts2.scenery.signals import signalitem
+
+
+class RouteGraph:
+    """Graph of the signals of a simulation, linked by its routes.
+
+    Signals are the nodes and routes the edges, weighted by their length in
+    metres, i.e. the sum of the real length of the items from the begin
+    signal to the end signal. Path queries use A* with the straight line
+    distance on the scene as heuristic, scaled by the smallest ratio between
+    the length of a route and the scene distance between its signals, so
+    that it never overestimates the remaining length.
+
+    The graph and the query results are cached until :meth:`invalidate` is
+    called, e.g. when routes are edited.
+    """
+
+    def __init__(self, simulation):
+        """Constructor for the RouteGraph class."""
+        self.simulation = simulation
+        self._edges = {}
+        self._lengths = {}
+        self._ratio = 0.0
+        self._paths = {}
+        self._valid = False
+
+    def invalidate(self):
+        """Discards the graph and the cached paths. They are computed again
+        on next query."""
+        self._valid = False
+        self._paths = {}
+
+    def _build(self):
+        self._edges = {}
+        self._lengths = {}
+        ratios = []
+        for rte in sorted(self.simulation.routes.values()):
+            length = sum(pos.trackItem.realLength
+                         for pos in rte.positions[1:])
+            self._lengths[rte.routeNum] = length
+            self._edges.setdefault(rte.beginSignal.tiId, []).append(
+                (rte, length)
+            )
+            distance = self.simulation.distanceBetween(
+                rte.beginSignal.origin, rte.endSignal.origin
+            )
+            if distance > 0:
+                ratios.append(length / distance)
+        self._ratio = min(ratios) if ratios else 0.0
+        self._valid = True
+
+    def _ensureValid(self):
+        if not self._valid:
+            self._build()
+
+    def routeLength(self, rte):
+        """Returns the length of rte in metres."""
+        self._ensureValid()
+        return self._lengths[rte.routeNum]
+
+    def routesFrom(self, si):
+        """Returns the list of (route, length) of the routes starting at
+        signal si."""
+        self._ensureValid()
+        return self._edges.get(si.tiId, [])
+
+    def search(self, start, isGoal, goalSignals=(), k=1, maxDepth=None):
+        """Finds the k shortest paths from start to a goal.
+
+        :param start: The :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        to start from.
+        :param isGoal: Function taking a route and returning True if a path
+        ending with this route reaches the goal.
+        :param goalSignals: Signals at or after which the goal is reached,
+        used for the heuristic. If empty, the search is a Dijkstra search.
+        :param k: Maximum number of paths to return.
+        :param maxDepth: Maximum number of routes of a path.
+        :return: The paths as tuples of routes, shortest first. Paths do not
+        go twice through the same signal.
+        :rtype: list of tuples of :class:`~ts2.routing.route.Route`
+        """
+        self._ensureValid()
+        goalPoints = [si.origin for si in goalSignals]
+        distanceBetween = self.simulation.distanceBetween
+        ratio = self._ratio
+        heuristics = {}
+
+        def heuristic(si):
+            if not goalPoints:
+                return 0
+            h = heuristics.get(si.tiId)
+            if h is None:
+                h = heuristics[si.tiId] = ratio * min(
+                    distanceBetween(si.origin, p) for p in goalPoints
+                )
+            return h
+
+        paths = []
+        expansions = {}
+        counter = 0
+        heap = [(heuristic(start), 0, counter, start, ())]
+        while heap and len(paths) < k:
+            f, length, _, si, path = heapq.heappop(heap)
+            if path and isGoal(path[-1]):
+                paths.append(path)
+                continue
+            expansions[si.tiId] = expansions.get(si.tiId, 0) + 1
+            if expansions[si.tiId] > k or \
+                    maxDepth is not None and len(path) >= maxDepth:
+                continue
+            visited = {rte.beginSignal.tiId for rte in path}
+            visited.add(si.tiId)
+            for rte, routeLength in self._edges.get(si.tiId, ()):
+                endSignal = rte.endSignal
+                if endSignal.tiId in visited:
+                    continue
+                counter += 1
+                heapq.heappush(heap, (
+                    length + routeLength + heuristic(endSignal),
+                    length + routeLength, counter, endSignal, path + (rte,)
+                ))
+        return paths
+
+    def findPaths(self, startSignal, target, k=1):
+        """Returns the k shortest paths of routes from startSignal to target.
+
+        :param startSignal: A
+        :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        :param target: The :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        ending the path, or any other
+        :class:`~ts2.scenery.abstract.TrackItem` (e.g. a platform) that the
+        last route of the path goes through.
+        :rtype: list of tuples of :class:`~ts2.routing.route.Route`
+        """
+        key = (startSignal.tiId, target.tiId, k)
+        if key in self._paths:
+            return self._paths[key]
+        self._ensureValid()
+        if isinstance(target, signalitem.SignalItem):
+            goalSignals = [target]
+
+            def isGoal(rte):
+                return rte.endSignal is target
+        else:
+            goalRoutes = {
+                rte.routeNum: rte
+                for rte in self.simulation.routes.values()
+                if any(pos.trackItem is target for pos in rte.positions[1:-1])
+            }
+            goalSignals = [rte.endSignal for rte in goalRoutes.values()]
+
+            def isGoal(rte):
+                return rte.routeNum in goalRoutes
+        paths = self.search(startSignal, isGoal, goalSignals, k)
+        self._paths[key] = paths
+        return paths
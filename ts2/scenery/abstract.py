@@ -308,6 +308,14 @@ class TrackItem(QtCore.QObject):
 
     graphicsItem = property(_getGraphicsItem)
 
+    @property
+    def graphicsItems(self):
+        """
+        :return: All the graphics items of this TrackItem
+        :rtype: list
+        """
+        return list(self._gi.values())
+
     def _getSelected(self):
         """
         :return: True if the item is selected.
@@ -384,6 +392,13 @@ class TrackItem(QtCore.QObject):
         :param r: The newly active Route on this TrackItem.
         :param previous: The previous :class:`~ts2.scenery.abstract.TrackItem`
                on this route (to know the direction)."""
+        if self.activeRoute is not r:
+            routeConflicts = self.simulation.routeConflicts
+            if self.activeRoute is not None:
+                routeConflicts.itemReleased(self.activeRoute)
+            routeConflicts.itemHeld(r)
+        if self.simulation.changeTracker is not None:
+            self.simulation.changeTracker.highlightChanged(self)
         self.activeRoute = r
         self.activeRoutePreviousItem = previous
         self.updateGraphics()
@@ -391,6 +406,10 @@ class TrackItem(QtCore.QObject):
     def resetActiveRoute(self):
         """Resets the activeRoute and activeRoutePreviousItem informations. It
         is called upon route desactivation."""
+        if self.activeRoute is not None:
+            self.simulation.routeConflicts.itemReleased(self.activeRoute)
+            if self.simulation.changeTracker is not None:
+                self.simulation.changeTracker.highlightChanged(self)
         self.activeRoute = None
         self.activeRoutePreviousItem = None
         self.updateGraphics()
@@ -446,6 +465,8 @@ class TrackItem(QtCore.QObject):
                     th = self.realLength - trainTail.positionOnTI
             self._trainHeads.append(th)
             self._trainTails.append(tt)
+        if self.simulation.changeTracker is not None:
+            self.simulation.changeTracker.occupationChanged(self)
         self.updateTrain()
 
     def trainPresent(self):
@@ -533,6 +554,12 @@ class TrackItem(QtCore.QObject):
         for gi in self._gi.values():
             self.simulation.scene.removeItem(gi)
 
+    def addAllGraphicsItems(self):
+        """Adds back to the scene the graphics items removed by
+        removeAllGraphicsItems()."""
+        for gi in self._gi.values():
+            self.simulation.registerGraphicsItem(gi)
+
     @QtCore.pyqtSlot()
     def updateGraphics(self):
         self.__updateGraphics()
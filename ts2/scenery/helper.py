@@ -152,13 +152,18 @@ class TrackPropertiesModel(QtCore.QAbstractTableModel):
         """Sets the data to the model"""
         if role == Qt.EditRole:
             if index.column() == 1:
+                edits = []
                 for ti in self.trackItems:
                     if self.multiType:
-                        setattr(ti,
-                                ti.multiProperties[index.row()].name,
-                                value)
+                        edits.append(
+                            (ti, ti.multiProperties[index.row()].name, value)
+                        )
                     else:
-                        setattr(ti, ti.properties[index.row()].name, value)
+                        edits.append(
+                            (ti, ti.properties[index.row()].name, value)
+                        )
+                self.simulation.editAttributes(self.tr("Edit properties"),
+                                               edits, self)
                 self.dataChanged.emit(index, index)
                 return True
         return False
@@ -56,6 +56,7 @@ class LineItem(abstract.ResizableItem):
         if self._place is not None:
             self._trackCode = trackCode
             self._place.addTrack(self)
+            simulation.indexLineItem(self)
         if simulation.context in utils.Context.EDITORS:
             self._gi[0].setCursor(Qt.PointingHandCursor)
             self.positionSelected.connect(simulation.setSelectedTrainHead)
@@ -128,6 +129,7 @@ class LineItem(abstract.ResizableItem):
     def placeCode(self, value):
         """Setter function for the placeCode property"""
         if self.simulation.context == utils.Context.EDITOR_SCENERY:
+            self.simulation.unindexLineItem(self)
             place = self.simulation.place(value)
             if place is not None:
                 self._placeCode = value
@@ -135,6 +137,7 @@ class LineItem(abstract.ResizableItem):
                 self._place.addTrack(self)
             else:
                 self._placeCode = ""
+            self.simulation.indexLineItem(self)
 
     @property
     def trackCode(self):
@@ -147,10 +150,12 @@ class LineItem(abstract.ResizableItem):
     def trackCode(self, value):
         """Setter function for the trackCode property"""
         if self.simulation.context == utils.Context.EDITOR_SCENERY:
+            self.simulation.unindexLineItem(self)
             if self._place is not None:
                 self._trackCode = value
             else:
                 self._trackCode = ""
+            self.simulation.indexLineItem(self)
 
     @property
     def line(self):
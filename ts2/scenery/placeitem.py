@@ -18,6 +18,8 @@
 #   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
+import bisect
+
 from Qt import QtGui, QtCore, QtWidgets, Qt
 
 from ts2.scenery import abstract, helper
@@ -44,6 +46,7 @@ class Place(abstract.TrackItem):
         gi.setZValue(self.defaultZValue)
         self._gi[0] = gi
         self._timetable = []
+        self._timetableTimes = []
         self._tracks = {}
 
     @staticmethod
@@ -88,7 +91,9 @@ class Place(abstract.TrackItem):
     def placeCode(self, value):
         """Setter function for the placeCode property"""
         if self.simulation.context == utils.Context.EDITOR_SCENERY:
+            self.simulation.unindexPlace(self)
             self._placeCode = value
+            self.simulation.indexPlace(self)
 
     # ## Methods #######################################################
 
@@ -96,8 +101,54 @@ class Place(abstract.TrackItem):
         self._tracks[li.trackCode] = li
 
     def addTimetable(self, sl):
-        self._timetable.append(sl)
-        self._timetable.sort(key=lambda x: x.scheduledDepartureTime)
+        """Inserts the ServiceLine sl in the timetable, keeping it sorted by
+        scheduled departure time."""
+        index = bisect.bisect_right(self._timetableTimes,
+                                    sl.scheduledDepartureTime)
+        self._timetable.insert(index, sl)
+        self._timetableTimes.insert(index, sl.scheduledDepartureTime)
+
+    def removeTimetable(self, sl):
+        """Removes the ServiceLine sl from the timetable. sl must not have
+        been modified since it was added."""
+        index = bisect.bisect_left(self._timetableTimes,
+                                   sl.scheduledDepartureTime)
+        end = bisect.bisect_right(self._timetableTimes,
+                                  sl.scheduledDepartureTime)
+        for i in range(index, end):
+            if self._timetable[i] is sl:
+                del self._timetable[i]
+                del self._timetableTimes[i]
+                return
+
+    def setTimetable(self, serviceLines):
+        """Replaces the timetable by serviceLines, which are sorted once."""
+        self._timetable = sorted(serviceLines,
+                                 key=lambda x: x.scheduledDepartureTime)
+        self._timetableTimes = [sl.scheduledDepartureTime
+                                for sl in self._timetable]
+
+    def timetableBetween(self, startTime, endTime=None):
+        """Returns the ServiceLines of the timetable scheduled to depart
+        from startTime included to endTime excluded, in departure order.
+
+        :param QTime startTime: beginning of the time window
+        :param QTime endTime: end of the time window, None for the end of the
+        day
+        """
+        start = bisect.bisect_left(self._timetableTimes, startTime)
+        if endTime is None:
+            return self._timetable[start:]
+        end = bisect.bisect_left(self._timetableTimes, endTime, start)
+        return self._timetable[start:end]
+
+    def nextDepartures(self, time, count=None):
+        """Returns the count first ServiceLines of the timetable scheduled
+        to depart at or after time, or all of them if count is None."""
+        start = bisect.bisect_left(self._timetableTimes, time)
+        if count is None:
+            return self._timetable[start:]
+        return self._timetable[start:start + count]
 
     def track(self, trackCode):
         return self._tracks[trackCode]
@@ -113,7 +164,7 @@ class Place(abstract.TrackItem):
     @QtCore.pyqtSlot()
     def sortTimetable(self):
         """Sorts the timetable of the place."""
-        self._timetable.sort(key=lambda x: x.scheduledDepartureTime)
+        self.setTimetable(self._timetable)
 
     # ## Graphics Methods ##############################################
 
@@ -153,26 +204,52 @@ class PlaceInfoModel(QtCore.QAbstractTableModel):
 
     def columnCount(self, parent=None, *args, **kwargs):
         if self._place is not None:
-            return 5
+            return 6
         else:
             return 0
 
+    def lineForecast(self, line):
+        """Returns the forecast of line, or None if there is none."""
+        forecaster = getattr(self._place.simulation, "forecaster", None)
+        if forecaster is None:
+            return None
+        return forecaster.lineForecast(line)
+
     def data(self, index, role=Qt.DisplayRole):
         if self._place is not None and role == Qt.DisplayRole:
             line = self._place.timetable[index.row() - 2]
             if index.column() == 0:
                 return line.scheduledDepartureTime
             elif index.column() == 1:
-                return line.service.serviceCode
+                forecast = self.lineForecast(line)
+                if forecast is None:
+                    return ""
+                return forecast.expectedDeparture
             elif index.column() == 2:
-                return line.service.exitPlaceName
+                return line.service.serviceCode
             elif index.column() == 3:
-                return line.trackCode
+                return line.service.exitPlaceName
             elif index.column() == 4:
+                return line.trackCode
+            elif index.column() == 5:
+                remarks = []
                 if not line.mustStop:
-                    return self.tr("Non-stop")
-                else:
-                    return ""
+                    remarks.append(self.tr("Non-stop"))
+                forecast = self.lineForecast(line)
+                if forecast is not None and forecast.conflicts:
+                    remarks.append(self.tr("Platform conflict with %s") %
+                                   ", ".join(f.line.service.serviceCode
+                                             for f in forecast.conflicts))
+                return " - ".join(remarks)
+        elif self._place is not None and role == Qt.ForegroundRole:
+            line = self._place.timetable[index.row() - 2]
+            forecast = self.lineForecast(line)
+            if index.column() == 1 and forecast is not None and \
+                    (forecast.delay or 0) >= 60:
+                return QtGui.QBrush(Qt.red)
+            if index.column() == 5 and forecast is not None and \
+                    forecast.conflicts:
+                return QtGui.QBrush(Qt.red)
         return None
 
     def headerData(self, column, orientation, role=Qt.DisplayRole):
@@ -182,12 +259,14 @@ class PlaceInfoModel(QtCore.QAbstractTableModel):
             if column == 0:
                 return self.tr("Time")
             elif column == 1:
-                return self.tr("Code")
+                return self.tr("Expected")
             elif column == 2:
-                return self.tr("Destination")
+                return self.tr("Code")
             elif column == 3:
-                return self.tr("Platform")
+                return self.tr("Destination")
             elif column == 4:
+                return self.tr("Platform")
+            elif column == 5:
                 return self.tr("Remarks")
             else:
                 return ""
@@ -210,6 +289,15 @@ class PlaceInfoModel(QtCore.QAbstractTableModel):
     def setPlace(self, place):
         self.place = place
 
+    @QtCore.pyqtSlot(list)
+    def updateForecast(self, placeCodes):
+        """Refreshes the expected times if the forecast of the displayed
+        place changed."""
+        if self._place is not None and self._place.placeCode in placeCodes \
+                and self.rowCount():
+            self.dataChanged.emit(self.index(0, 1),
+                                  self.index(self.rowCount() - 1, 5))
+
 class PlacesModel(QtCore.QAbstractTableModel):
     """Model listing places to be used in item delegates."""
     def __init__(self, editor):
@@ -145,7 +145,7 @@ class PlatformItem(abstract.ResizableItem):
         y2 = self.end.y()
         painter.setPen(QtGui.QPen(QtGui.QColor("#88ffbb")))
         painter.setBrush(QtGui.QBrush(QtGui.QColor("#88ffbb")))
-        painter.drawRect(0, 0, x2 - x1, y2 - y1)
+        painter.drawRect(QtCore.QRectF(0, 0, x2 - x1, y2 - y1))
         if self.simulation.context == utils.Context.EDITOR_SCENERY:
             self.drawConnectionRect(painter, QtCore.QPointF(0, 0))
             self.drawConnectionRect(painter, QtCore.QPointF(x2 - x1, y2 - y1))
@@ -278,6 +278,9 @@ class PointsItem(abstract.TrackItem):
     def pointsReversed(self, rev):
         """Setter function for the pointsReversed property"""
         self._pointsReversed = True if rev else False
+        if self.simulation is not None and \
+                self.simulation.changeTracker is not None:
+            self.simulation.changeTracker.pointsChanged(self)
 
     @property
     def commonItem(self):
@@ -151,7 +151,7 @@ class SignalItem(abstract.TrackItem):
         super().__init__(parameters)
         reverse = bool(parameters.get("reverse", 0))
         self._signalType = None
-        for customProperty in signalLibrary.tiProperties.values():
+        for customProperty in SignalLibrary.tiProperties.values():
             # Initialize backend vars for custom properties
             propName = "_" + customProperty.name[:-3]
             setattr(self, propName,
@@ -207,9 +207,11 @@ class SignalItem(abstract.TrackItem):
         self._activeAspect = self._signalType.getDefaultAspect()
         if simulation.context == utils.Context.GAME:
             self.signalSelected.connect(simulation.activateRoute)
+            self.pathSelected.connect(simulation.activateRoutePath)
             self.signalUnselected.connect(simulation.desactivateRoute)
         else:
             self.signalSelected.connect(simulation.prepareRoute)
+            self.pathSelected.connect(simulation.prepareRoute)
             self.signalUnselected.connect(simulation.deselectRoute)
         self.trainSelected.connect(simulation.trainSelected)
         super().initialize(simulation)
@@ -217,9 +219,9 @@ class SignalItem(abstract.TrackItem):
     @staticmethod
     def getProperties():
         signalTypeNames = sorted(
-            list(signalLibrary.signalTypes.keys())
+            list(SignalLibrary.getDefault().signalTypes.keys())
         )
-        signalCustomProperties = list(signalLibrary.tiProperties.values())
+        signalCustomProperties = list(SignalLibrary.tiProperties.values())
         return abstract.TrackItem.getProperties() + [
             helper.TIProperty("reverse",
                               translate("SignalItem", "Reverse")),
@@ -236,7 +238,7 @@ class SignalItem(abstract.TrackItem):
     def for_json(self):
         """Dumps the signalItem to JSON."""
         jsonData = super().for_json()
-        signalCustomProperties = list(signalLibrary.tiProperties.values())
+        signalCustomProperties = list(SignalLibrary.tiProperties.values())
         for customProp in signalCustomProperties:
             jsonData[customProp.name[:-3]] = getattr(self, customProp.name[:-3])
         jsonData.update({
@@ -250,6 +252,9 @@ class SignalItem(abstract.TrackItem):
     signalSelected = QtCore.pyqtSignal(int, bool, bool)
     """pyqtSignal(int, bool, bool)"""
 
+    pathSelected = QtCore.pyqtSignal(int)
+    """pyqtSignal(int)"""
+
     signalUnselected = QtCore.pyqtSignal(int)
     """pyqtSignal(int)"""
 
@@ -408,6 +413,8 @@ class SignalItem(abstract.TrackItem):
     def _setTrainId(self, code):
         """Sets the trainId of this signal to the given Id."""
         self._trainId = code
+        if self.simulation.changeTracker is not None:
+            self.simulation.changeTracker.signalChanged(self)
         self.updateGraphics()
 
     trainId = property(_getTrainId, _setTrainId)
@@ -415,6 +422,8 @@ class SignalItem(abstract.TrackItem):
     def resetTrainId(self):
         """Resets the trainId of this signal."""
         self._trainId = None
+        if self.simulation.changeTracker is not None:
+            self.simulation.changeTracker.signalChanged(self)
         self.updateGraphics()
 
     def _getActiveAspect(self):
@@ -583,6 +592,8 @@ class SignalItem(abstract.TrackItem):
 
         if self.activeAspect != oldAspect:
             self.aspectChanged.emit()
+        if self.simulation.changeTracker is not None:
+            self.simulation.changeTracker.signalChanged(self)
 
         if self.previousActiveRoute is not None:
             self.previousActiveRoute.beginSignal.updateSignalState()
@@ -601,16 +612,21 @@ class SignalItem(abstract.TrackItem):
         """Reimplemented from TrackItem.graphicsMousePressEvent to handle the
         mousePressEvent of the owned TrackGraphicsItem.
         It processes mouse clicks on the signal and emits the signals
-        signalSelected, trainSelected, or signalUnselected depending on the
-        case."""
+        signalSelected, pathSelected, trainSelected, or signalUnselected
+        depending on the case."""
         super().graphicsMousePressEvent(e, itemId)
         if e.button() == Qt.LeftButton:
             if itemId == SignalItem.SIGNAL_GRAPHIC_ITEM:
                 if self.simulation.context != utils.Context.EDITOR_SCENERY:
                     self.selected = True
-                persistent = (e.modifiers() == Qt.ShiftModifier)
-                force = (e.modifiers() == Qt.AltModifier | Qt.ControlModifier)
-                self.signalSelected.emit(self.tiId, persistent, force)
+                if e.modifiers() == Qt.ControlModifier:
+                    # Set all the routes up to this signal
+                    self.pathSelected.emit(self.tiId)
+                else:
+                    persistent = (e.modifiers() == Qt.ShiftModifier)
+                    force = (e.modifiers() ==
+                             Qt.AltModifier | Qt.ControlModifier)
+                    self.signalSelected.emit(self.tiId, persistent, force)
             elif itemId == SignalItem.BERTH_GRAPHIC_ITEM:
                 if self.trainId is not None:
                     self.trainSelected.emit(self.trainId)
@@ -888,22 +904,29 @@ class SignalLibrary:
         self.signalAspects.update(other.signalAspects)
         self.signalTypes.update(other.signalTypes)
 
+    _default = None
+
+    @staticmethod
+    def tslFiles():
+        """Returns the sorted list of tsl files of the general and user data
+        directories."""
+        tslFiles = set()
+        for dataDir in (utils.settings.dataDir, utils.settings.userDataDir):
+            try:
+                fileNames = os.listdir(dataDir)
+            except OSError:
+                continue
+            tslFiles.update(os.path.join(dataDir, f) for f in fileNames
+                            if f.endswith('.tsl'))
+        return sorted(tslFiles)
+
     @staticmethod
     def createSignalLibrary():
         """Returns a SignalLibrary with the builtin signal types and those
-        defined in tsl files in the data directory."""
+        defined in tsl files in the data directories."""
+        tslFiles = SignalLibrary.tslFiles()
         builtinLibrary = json.loads(BUILTIN_SIGNAL_LIBRARY,
                                     object_hook=json_hook, encoding="utf-8")
-        # General data directory
-        tslGenFiles = [os.path.join("data", f) for f in os.listdir("data")
-                       if f.endswith('.tsl')]
-        # User data directory
-        tslUserFiles = [os.path.join(utils.settings.userDataDir, f)
-                        for f in os.listdir(utils.settings.userDataDir)
-                        if f.endswith('.tsl')]
-
-        tslFiles = list(set(tslGenFiles + tslUserFiles))
-        tslFiles.sort()
         for tslFile in tslFiles:
             with open(tslFile) as fileStream:
                 sl = json.load(fileStream, object_hook=json_hook,
@@ -913,8 +936,13 @@ class SignalLibrary:
         builtinLibrary.initialize()
         return builtinLibrary
 
-
-signalLibrary = SignalLibrary.createSignalLibrary()
+    @staticmethod
+    def getDefault():
+        """Returns the SignalLibrary shared by all simulations of this
+        process, creating it on first call."""
+        if SignalLibrary._default is None:
+            SignalLibrary._default = SignalLibrary.createSignalLibrary()
+        return SignalLibrary._default
 
 
 def condition(cls):
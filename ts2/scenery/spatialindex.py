@@ -0,0 +1,203 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Uniform grid index of the rectangles of the scenery, used by the editor
+to find the items in an area or near a point without looking at all the
+items."""
+
+import math
+
+from Qt import QtCore
+
+CELL_SIZE = 100.0
+"""Default size in pixels of the cells of a GridIndex."""
+
+
+class GridIndex:
+    """Spatial index of rectangles identified by hashable keys.
+
+    The plane is divided in square cells of cellSize pixels and each
+    rectangle is registered in all the cells it overlaps, so that a query
+    only looks at the rectangles of the cells overlapped by the query area.
+    The bounds of all the rectangles are maintained as they are inserted, and
+    only computed again when a rectangle on the border is removed.
+    """
+
+    def __init__(self, cellSize=CELL_SIZE):
+        """Constructor for the GridIndex class."""
+        self.cellSize = float(cellSize)
+        self._cells = {}
+        self._rects = {}
+        self._bounds = None
+        self._boundsValid = True
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, key):
+        return key in self._rects
+
+    @staticmethod
+    def _toTuple(rect):
+        if isinstance(rect, QtCore.QPointF):
+            return rect.x(), rect.y(), rect.x(), rect.y()
+        rect = rect.normalized()
+        return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+    def _cellRange(self, rect):
+        size = self.cellSize
+        return (range(math.floor(rect[0] / size),
+                      math.floor(rect[2] / size) + 1),
+                range(math.floor(rect[1] / size),
+                      math.floor(rect[3] / size) + 1))
+
+    def rect(self, key):
+        """Returns the rectangle registered for key, or None."""
+        rect = self._rects.get(key)
+        if rect is None:
+            return None
+        return QtCore.QRectF(QtCore.QPointF(rect[0], rect[1]),
+                             QtCore.QPointF(rect[2], rect[3]))
+
+    def insert(self, key, rect):
+        """Registers rect, a QRectF or a QPointF, for key, replacing the
+        rectangle previously registered for key if any."""
+        rect = self._toTuple(rect)
+        oldRect = self._rects.get(key)
+        if oldRect == rect:
+            return
+        if oldRect is not None:
+            self._removeFromCells(key, oldRect)
+        self._rects[key] = rect
+        columns, rows = self._cellRange(rect)
+        cells = self._cells
+        for i in columns:
+            for j in rows:
+                cell = cells.get((i, j))
+                if cell is None:
+                    cells[(i, j)] = {key}
+                else:
+                    cell.add(key)
+        if self._boundsValid:
+            bounds = self._bounds
+            if bounds is None:
+                self._bounds = rect
+            else:
+                self._bounds = (min(bounds[0], rect[0]),
+                                min(bounds[1], rect[1]),
+                                max(bounds[2], rect[2]),
+                                max(bounds[3], rect[3]))
+
+    def remove(self, key):
+        """Removes the rectangle registered for key, if any."""
+        rect = self._rects.pop(key, None)
+        if rect is not None:
+            self._removeFromCells(key, rect)
+
+    def _removeFromCells(self, key, rect):
+        columns, rows = self._cellRange(rect)
+        cells = self._cells
+        for i in columns:
+            for j in rows:
+                cell = cells.get((i, j))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del cells[(i, j)]
+        bounds = self._bounds
+        if self._boundsValid and bounds is not None and (
+                rect[0] <= bounds[0] or rect[1] <= bounds[1] or
+                rect[2] >= bounds[2] or rect[3] >= bounds[3]):
+            self._boundsValid = False
+
+    def clear(self):
+        """Removes all the rectangles."""
+        self._cells = {}
+        self._rects = {}
+        self._bounds = None
+        self._boundsValid = True
+
+    def bounds(self):
+        """Returns the bounding rectangle of all the registered rectangles,
+        or a null QRectF if the index is empty."""
+        if not self._boundsValid:
+            rects = self._rects.values()
+            if rects:
+                self._bounds = (min(r[0] for r in rects),
+                                min(r[1] for r in rects),
+                                max(r[2] for r in rects),
+                                max(r[3] for r in rects))
+            else:
+                self._bounds = None
+            self._boundsValid = True
+        if self._bounds is None:
+            return QtCore.QRectF()
+        return QtCore.QRectF(QtCore.QPointF(self._bounds[0], self._bounds[1]),
+                             QtCore.QPointF(self._bounds[2], self._bounds[3]))
+
+    def itemsInRect(self, rect):
+        """Returns the set of the keys whose rectangle intersects rect. The
+        edges are included, so that points on the border of rect are
+        found."""
+        query = self._toTuple(rect)
+        columns, rows = self._cellRange(query)
+        rects = self._rects
+        cells = self._cells
+        result = set()
+        seen = set()
+        for i in columns:
+            for j in rows:
+                for key in cells.get((i, j), ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    r = rects[key]
+                    if r[0] <= query[2] and r[2] >= query[0] and \
+                       r[1] <= query[3] and r[3] >= query[1]:
+                        result.add(key)
+        return result
+
+    def nearest(self, point, radius, accept=None):
+        """Returns the key whose rectangle is the nearest to point within
+        radius, or None.
+
+        :param point: QPointF
+        :param radius: maximum distance in pixels
+        :param accept: if not None, function called with a key, returning
+        False if the key must be ignored
+        """
+        x, y = point.x(), point.y()
+        candidates = self.itemsInRect(QtCore.QRectF(x - radius, y - radius,
+                                                    2 * radius, 2 * radius))
+        bestKey = None
+        bestDistance = None
+        for key in candidates:
+            if accept is not None and not accept(key):
+                continue
+            r = self._rects[key]
+            dx = max(r[0] - x, 0.0, x - r[2])
+            dy = max(r[1] - y, 0.0, y - r[3])
+            distance = math.hypot(dx, dy)
+            if distance <= radius and \
+               (bestKey is None or distance < bestDistance):
+                bestKey = key
+                bestDistance = distance
+        return bestKey
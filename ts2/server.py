@@ -0,0 +1,527 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Simulation server, to which several game windows can connect on a local
+socket.
+
+Usage::
+
+    python -m ts2.server [--host HOST] [--port PORT] simulation.json
+
+The server owns the simulation. Each viewer, i.e. a main window connected to
+the server, loads the same simulation as a mirror (see
+:class:`~ts2.simulationworker.SimulationMirror`) and sends its player
+commands to the server.
+
+The protocol is a stream of frames, each made of a 5 bytes header, the
+length of the payload and flags, followed by the payload. The payload is
+msgpack if the sender has it, JSON otherwise, and is compressed with zlib
+when it is large. The server replies in msgpack to the viewers that sent
+msgpack. The first frame, sent by the server, holds the simulation data. The
+server then sends a record of its :class:`~ts2.changetracker.ChangeTracker`
+each time the viewer gives it a credit by sending ``["ready"]`` and the
+simulation changed since the previous record. A viewer which cannot apply a
+record sends ``["resync"]`` to get a keyframe.
+"""
+
+import argparse
+import os
+import socket
+import struct
+import sys
+import zlib
+
+import simplejson as json
+from Qt import QtCore, QtWidgets
+
+from ts2 import changetracker, simulation, utils
+from ts2.game import logger
+from ts2.simulationworker import EMPTY_SNAPSHOT, CoreWindow, \
+    SimulationMirror, executeCommand
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+translate = QtWidgets.qApp.translate
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 22222
+
+HEADER = struct.Struct(">IB")
+"""Frame header: payload length and flags."""
+
+FLAG_MSGPACK = 0x01
+FLAG_ZLIB = 0x02
+
+COMPRESS_THRESHOLD = 2048
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+REMOTE_COMMANDS = {
+    "simulation": {"activateRoute", "activateRoutePath", "desactivateRoute",
+                   "pause", "setTimeFactor", "setAutoRouteSetting"},
+    "train": {"serviceCode", "nextPlaceIndex", "reverse", "splitTrain"},
+}
+"""Player commands that viewers may send, by kind of target."""
+
+
+def encodeFrame(message, packed=False):
+    """Returns the frame holding message, in msgpack if packed is True and
+    msgpack is available, in JSON otherwise."""
+    if packed and msgpack is not None:
+        payload = msgpack.packb(message, use_bin_type=True)
+        flags = FLAG_MSGPACK
+    else:
+        payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        flags = 0
+    if len(payload) > COMPRESS_THRESHOLD:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(len(payload), flags) + payload
+
+
+def decodePayload(flags, payload):
+    """Returns the message held in payload, read with the given flags."""
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise utils.FormatException(
+                translate("server", "msgpack is required to read this frame")
+            )
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload.decode("utf-8"))
+
+
+def readMessage(sock):
+    """Reads the next message from the blocking socket sock."""
+    def readExactly(size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError(
+                    translate("server", "Connection closed by the server")
+                )
+            data += chunk
+        return bytes(data)
+
+    length, flags = HEADER.unpack(readExactly(HEADER.size))
+    return decodePayload(flags, readExactly(length))
+
+
+class Connection(QtCore.QObject):
+    """Frame transport over a non blocking socket, driven by the Qt event
+    loop."""
+
+    messageReceived = QtCore.pyqtSignal(object)
+    closed = QtCore.pyqtSignal()
+
+    def __init__(self, sock, packed=False, parent=None):
+        """
+        :param sock: connected socket
+        :param packed: whether to send msgpack. This is also set as soon as
+        msgpack is received.
+        """
+        super().__init__(parent)
+        self.socket = sock
+        self.packed = packed and msgpack is not None
+        self._inbox = bytearray()
+        self._outbox = bytearray()
+        sock.setblocking(False)
+        self._readNotifier = QtCore.QSocketNotifier(
+            sock.fileno(), QtCore.QSocketNotifier.Read, self
+        )
+        self._readNotifier.activated.connect(self.receive)
+        self._writeNotifier = QtCore.QSocketNotifier(
+            sock.fileno(), QtCore.QSocketNotifier.Write, self
+        )
+        self._writeNotifier.setEnabled(False)
+        self._writeNotifier.activated.connect(self.flush)
+
+    def send(self, message):
+        """Sends message to the peer."""
+        self.sendFrame(encodeFrame(message, self.packed))
+
+    def sendFrame(self, frame):
+        """Sends the already encoded frame to the peer."""
+        if self.socket is None:
+            return
+        self._outbox += frame
+        self.flush()
+
+    @QtCore.pyqtSlot()
+    def flush(self):
+        """Writes as much of the pending data as the socket accepts."""
+        if self.socket is None:
+            return
+        try:
+            sent = self.socket.send(self._outbox)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.close()
+            return
+        del self._outbox[:sent]
+        self._writeNotifier.setEnabled(bool(self._outbox))
+
+    @QtCore.pyqtSlot()
+    def receive(self):
+        """Reads the available data and emits messageReceived for each
+        complete frame."""
+        while self.socket is not None:
+            try:
+                chunk = self.socket.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                chunk = b""
+            if not chunk:
+                self.close()
+                return
+            self._inbox += chunk
+        while len(self._inbox) >= HEADER.size:
+            length, flags = HEADER.unpack_from(self._inbox)
+            if length > MAX_FRAME_SIZE:
+                self.close()
+                return
+            end = HEADER.size + length
+            if len(self._inbox) < end:
+                break
+            payload = bytes(self._inbox[HEADER.size:end])
+            del self._inbox[:end]
+            if flags & FLAG_MSGPACK and msgpack is not None:
+                self.packed = True
+            try:
+                message = decodePayload(flags, payload)
+            except (ValueError, zlib.error, utils.FormatException):
+                self.close()
+                return
+            self.messageReceived.emit(message)
+            if self.socket is None:
+                return
+
+    def close(self):
+        """Closes the connection and emits closed."""
+        if self.socket is None:
+            return
+        self._readNotifier.setEnabled(False)
+        self._writeNotifier.setEnabled(False)
+        self.socket.close()
+        self.socket = None
+        self.closed.emit()
+
+
+class Viewer:
+    """State of the server for one of its viewers."""
+
+    def __init__(self, connection, subscription, messagesSent):
+        """Constructor for the Viewer class."""
+        self.connection = connection
+        self.subscription = subscription
+        self.credit = False
+        self.dirty = True
+        self.commands = 0
+        self.selectedSignal = None
+        self.messagesSent = messagesSent
+        self.requests = []
+
+
+class SimulationServer(QtCore.QObject):
+    """Runs a simulation and serves it to the viewers connecting to it."""
+
+    def __init__(self, data, host="127.0.0.1", port=DEFAULT_PORT,
+                 publishInterval=40):
+        """
+        :param data: simulation data, see :func:`ts2.simulation.loadData`
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        :param publishInterval: minimum interval in ms between two deltas
+        sent to a viewer
+        """
+        super().__init__()
+        self.window = CoreWindow()
+        self.simulation = simulation.loadData(self.window, data)
+        self.tracker = changetracker.ChangeTracker(self.simulation)
+        self.viewers = []
+        self._data = data
+        self._helloFrame = None
+        self._initialMessages = len(self.simulation.messageLogger)
+        self.simulation.timeElapsed.connect(self.setDirty)
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(8)
+        self._listener.setblocking(False)
+        self._acceptNotifier = QtCore.QSocketNotifier(
+            self._listener.fileno(), QtCore.QSocketNotifier.Read, self
+        )
+        self._acceptNotifier.activated.connect(self.accept)
+
+        self._publishTimer = QtCore.QTimer(self)
+        self._publishTimer.setInterval(publishInterval)
+        self._publishTimer.timeout.connect(self.publish)
+        self._publishTimer.start()
+
+    @property
+    def address(self):
+        """(host, port) on which the server listens."""
+        return self._listener.getsockname()[:2]
+
+    @QtCore.pyqtSlot()
+    def setDirty(self):
+        """Records that the simulation changed for all the viewers."""
+        for viewer in self.viewers:
+            viewer.dirty = True
+
+    @QtCore.pyqtSlot()
+    def accept(self):
+        """Accepts the pending connections and sends them the simulation."""
+        while True:
+            try:
+                sock, peer = self._listener.accept()
+            except (BlockingIOError, OSError):
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = Connection(sock, parent=self)
+            viewer = Viewer(connection, self.tracker.subscribe(),
+                            self._initialMessages)
+            connection.messageReceived.connect(
+                lambda message, v=viewer: self.onMessage(v, message)
+            )
+            connection.closed.connect(
+                lambda v=viewer: self.removeViewer(v)
+            )
+            self.viewers.append(viewer)
+            if self._helloFrame is None:
+                self._helloFrame = encodeFrame({
+                    "version": PROTOCOL_VERSION,
+                    "simulation": self._data
+                })
+            connection.sendFrame(self._helloFrame)
+
+    def removeViewer(self, viewer):
+        if viewer in self.viewers:
+            self.viewers.remove(viewer)
+            self.tracker.unsubscribe(viewer.subscription)
+            viewer.connection.deleteLater()
+
+    def onMessage(self, viewer, message):
+        if not isinstance(message, list) or not message:
+            return
+        if message[0] == "ready":
+            viewer.credit = True
+        elif message[0] == "resync":
+            viewer.subscription.resync()
+            viewer.dirty = True
+        elif message[0] == "call" and len(message) == 5:
+            self.execute(viewer, *message[1:])
+
+    def execute(self, viewer, kind, trainId, methodName, args):
+        """Executes the player command of viewer. Each viewer has its own
+        selected signal, which is set on the simulation for the command."""
+        viewer.commands += 1
+        self.setDirty()
+        sim = self.simulation
+        if methodName not in REMOTE_COMMANDS.get(kind, ()):
+            return
+        sim._setSelectedSignal(sim.trackItem(viewer.selectedSignal))
+        try:
+            executeCommand(sim, kind, trainId, methodName, args)
+        except Exception as err:
+            sim.messageLogger.addMessage(
+                self.tr("Command %s failed: %s") % (methodName, err),
+                logger.Message.SOFTWARE_MSG
+            )
+        viewer.selectedSignal = sim.selectedSignal and \
+            sim.selectedSignal.tiId
+        sim._setSelectedSignal(None)
+        viewer.requests.extend(self.window.requests)
+        self.window.requests = []
+
+    @QtCore.pyqtSlot()
+    def publish(self):
+        """Sends a record to each viewer which holds a credit and for which
+        the simulation changed."""
+        viewers = [v for v in self.viewers if v.credit and v.dirty]
+        if not viewers:
+            return
+        messageLogger = self.simulation.messageLogger
+        total = len(messageLogger)
+        for viewer in viewers:
+            messages = []
+            for num in range(viewer.messagesSent, total):
+                message = messageLogger.message(num)
+                messages.append((message.msgType, message.msgText,
+                                 message.trainId))
+            record = viewer.subscription.nextRecord()
+            record["c"] = viewer.commands
+            record["sel"] = viewer.selectedSignal
+            if messages:
+                record["msg"] = messages
+            if viewer.requests:
+                record["req"] = viewer.requests
+            viewer.connection.send(record)
+            viewer.messagesSent = total
+            viewer.requests = []
+            viewer.credit = False
+            viewer.dirty = False
+
+    def close(self):
+        """Disconnects all the viewers and stops listening."""
+        self._publishTimer.stop()
+        self._acceptNotifier.setEnabled(False)
+        for viewer in list(self.viewers):
+            viewer.connection.close()
+        self._listener.close()
+
+
+class SimulationClient(SimulationMirror):
+    """Mirrors the simulation of a server."""
+
+    def __init__(self, sim, connection):
+        """
+        :param sim: the local simulation, loaded from the data sent by the
+        server
+        :param connection: :class:`Connection` to the server
+        """
+        super().__init__(sim)
+        self._received = EMPTY_SNAPSHOT
+        self._sequence = None
+        self.connection = connection
+        connection.setParent(self)
+        connection.messageReceived.connect(self.onRecord)
+        connection.closed.connect(self.onClosed)
+        connection.send(["ready"])
+
+    def sendCommand(self, target, methodName, args):
+        """Reimplemented from SimulationMirror to send the command to the
+        server."""
+        kind = "simulation" if target is self.simulation else "train"
+        if methodName not in REMOTE_COMMANDS[kind]:
+            self.simulation.messageLogger.addMessage(
+                self.tr("%s is not available on a simulation server")
+                % methodName,
+                logger.Message.SOFTWARE_MSG
+            )
+            return
+        self.connection.send(list(self.makeCommand(target, methodName,
+                                                   args)))
+
+    @QtCore.pyqtSlot(object)
+    def onRecord(self, record):
+        """Applies the record received from the server, or asks for a
+        keyframe if it does not follow the previous one."""
+        if record.get("k"):
+            received = EMPTY_SNAPSHOT
+        elif record.get("p") == self._sequence:
+            received = self._received
+        else:
+            received = None
+        if received is not None:
+            try:
+                self._received = changetracker.patchSnapshot(received,
+                                                             record)
+            except (IndexError, TypeError, ValueError):
+                received = None
+        if received is None:
+            self.connection.send(["resync"])
+        else:
+            self._sequence = record["q"]
+            self.applySnapshot(self._received)
+        self.connection.send(["ready"])
+
+    @QtCore.pyqtSlot()
+    def onClosed(self):
+        if self.simulation.worker is self:
+            self.simulation.messageLogger.addMessage(
+                self.tr("The connection to the simulation server was lost"),
+                logger.Message.SOFTWARE_MSG
+            )
+
+    def stop(self):
+        """Disconnects from the server."""
+        self.connection.closed.disconnect(self.onClosed)
+        self.connection.close()
+
+
+def parseAddress(address):
+    """Returns (host, port) from a "host[:port]" string."""
+    host, sep, port = address.strip().rpartition(":")
+    if not sep:
+        return address.strip(), DEFAULT_PORT
+    return host or "127.0.0.1", int(port)
+
+
+def connect(simulationWindow, host, port=DEFAULT_PORT, timeout=10):
+    """Connects to the simulation server at host:port and returns the local
+    simulation mirroring it.
+
+    :raises OSError: if the server cannot be reached
+    :raises ts2.utils.FormatException: if the server is not compatible
+    """
+    sock = socket.create_connection((host, port), timeout)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        hello = readMessage(sock)
+        if not isinstance(hello, dict) or \
+                hello.get("version") != PROTOCOL_VERSION:
+            raise utils.FormatException(
+                translate("server", "Incompatible simulation server")
+            )
+        sim = simulation.loadData(simulationWindow, hello["simulation"])
+    except Exception:
+        sock.close()
+        raise
+    SimulationClient(sim, Connection(sock, packed=True))
+    return sim
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        "ts2.server", description="Serves a simulation to the game windows "
+                                  "connecting to it."
+    )
+    parser.add_argument("file", help="simulation file or saved game")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port to listen on (default: %i)" % DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    server = SimulationServer(simulation.readData(args.file), args.host,
+                              args.port)
+    host, port = server.address
+    print("Serving %s on %s:%i" % (server.simulation.option("title"), host,
+                                   port))
+    sys.stdout.flush()
+    try:
+        return app.exec_()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,6 +20,7 @@
 
 from math import sqrt
 import collections
+import random
 import zipfile
 import simplejson as json
 
@@ -27,10 +28,11 @@ from Qt import QtCore, QtWidgets
 
 from ts2 import __FILE_FORMAT__
 from ts2 import utils, trains
-from ts2.routing import route, position
-from ts2.game import logger, scorer
+from ts2.routing import route, position, conflicts, autoroute, \
+    routegraph
+from ts2.game import logger, scorer, forecast
 from ts2.scenery import placeitem, lineitem, platformitem, invisiblelinkitem, \
-    enditem, pointsitem, textitem
+    enditem, pointsitem, textitem, spatialindex
 from ts2.scenery.signals import signalitem
 
 translate = QtWidgets.qApp.translate
@@ -98,7 +100,7 @@ def json_hook(dct):
         )
 
 
-def load(simulationWindow, jsonStream):
+def load(simulationWindow, jsonStream, seed=None):
     """Loads the simulation from jsonStream and returns it.
 
     The logic of loading is the following:
@@ -115,12 +117,59 @@ def load(simulationWindow, jsonStream):
 
     :param simulationWindow:
     :param jsonStream:
+    :param seed: if not None, seed of the random generator of the simulation,
+    so that the random values drawn at load time and during the game are
+    reproducible
     """
     simulation = json.load(jsonStream, object_hook=json_hook, encoding='utf-8')
     if not isinstance(simulation, Simulation):
         raise utils.FormatException(
             translate("simulation.load", "Loaded file is not a TS2 simulation")
         )
+    if seed is not None:
+        simulation.random.seed(seed)
+    simulation.initialize(simulationWindow)
+    return simulation
+
+
+def readData(fileName):
+    """Returns the content of the simulation file or saved game fileName,
+    parsed without hook, to be given to :func:`loadData`."""
+    if zipfile.is_zipfile(fileName):
+        with zipfile.ZipFile(fileName) as zipArchive:
+            with zipArchive.open("simulation.json") as file:
+                return json.loads(file.read().decode("utf-8"))
+    with open(fileName, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def buildObjects(data):
+    """Returns the graph of objects of data, the content of a simulation file
+    parsed without hook, as ``json.load()`` with :func:`json_hook` would
+    return it. data is not modified, so that it can be built several times.
+    """
+    if isinstance(data, dict):
+        return json_hook({key: buildObjects(value)
+                          for key, value in data.items()})
+    elif isinstance(data, list):
+        return [buildObjects(value) for value in data]
+    return data
+
+
+def loadData(simulationWindow, data, seed=None):
+    """Loads the simulation from data, the content of a simulation file
+    parsed without hook, and returns it. See :func:`load` for seed.
+
+    This avoids parsing the file again to load the same simulation several
+    times.
+    """
+    simulation = buildObjects(data)
+    if not isinstance(simulation, Simulation):
+        raise utils.FormatException(
+            translate("simulation.load", "Loaded file is not a TS2 simulation")
+        )
+    if seed is not None:
+        simulation.random.seed(seed)
     simulation.initialize(simulationWindow)
     return simulation
 
@@ -146,6 +195,9 @@ class Simulation(QtCore.QObject):
         self._messageLogger = messageLogger
         self._scorer = scorer.Scorer(self)
         self._selectedSignal = None
+        # Random generator of the trains delays, not shared with other code
+        # so that a game can be replayed from its seed
+        self.random = random.Random()
         self._options = collections.OrderedDict()
         self._options.update(BUILTIN_OPTIONS)
         self._options.update(options)
@@ -155,14 +207,24 @@ class Simulation(QtCore.QObject):
         self._trackItems = collections.OrderedDict()
         for key, value in trackItems.items():
             self._trackItems[int(key)] = value
+        self._routesIndex = {}
+        self._routesFromSignal = {}
+        self.routeConflicts = conflicts.RouteConflicts()
+        self.routeGraph = routegraph.RouteGraph(self)
+        self.autoRouteSetter = None
+        self.forecaster = None
+        self.worker = None
+        self.changeTracker = None
+        self.recorder = None
         self.activeRouteNumbers = []
         self._trainTypes = collections.OrderedDict()
         self._trainTypes.update(trainTypes)
         self._services = collections.OrderedDict()
         self._services.update(services)
         self._places = collections.OrderedDict()
+        self._lineItemsIndex = {}
         self._trains = trns
-        self.signalLibrary = signalitem.signalLibrary
+        self.signalLibrary = signalitem.SignalLibrary.getDefault()
         self._time = QtCore.QTime()
         self._startTime = QtCore.QTime()
         self._serviceListModel = trains.ServiceListModel(self)
@@ -192,6 +254,7 @@ class Simulation(QtCore.QObject):
 
         for rte in self.routes.values():
             rte.initialize(self)
+        self.rebuildRoutesIndex()
         for rte in self.routes.values():
             # We need routes initialized before setting them up
             rte.setToInitialState()
@@ -202,6 +265,7 @@ class Simulation(QtCore.QObject):
             trainType.initialize(self)
         for service in self.services.values():
             service.initialize(self)
+        self.buildTimetables()
         for train in self.trains:
             train.initialize(self)
         self._trains.sort(key=lambda x:
@@ -241,6 +305,7 @@ class Simulation(QtCore.QObject):
             "messageLogger": self.messageLogger
         }
 
+    @utils.playerCommand
     def saveGame(self, fileName):
         """Saves the game.
 
@@ -272,6 +337,14 @@ class Simulation(QtCore.QObject):
         """
         return self._messageLogger
 
+    @property
+    def timerInterval(self):
+        """
+        :return: The interval in ms between two ticks of the game clock.
+        :rtype: int
+        """
+        return self._timer.interval()
+
     @property
     def scorer(self):
         """
@@ -445,6 +518,9 @@ class Simulation(QtCore.QObject):
     """pyqtSignal(:class:`~ts2.scenery.signals.signalitem.SignalItem`,
     :class:`~ts2.scenery.signals.signalitem.SignalItem`)"""
 
+    selectedSignalChanged = QtCore.pyqtSignal()
+    """pyqtSignal()"""
+
     timeChanged = QtCore.pyqtSignal(QtCore.QTime)
     """pyqtSignal(QtCore.QTime)"""
 
@@ -457,6 +533,10 @@ class Simulation(QtCore.QObject):
     trainStatusChanged = QtCore.pyqtSignal(int)
     """pyqtSignal(int)"""
 
+    forecastChanged = QtCore.pyqtSignal(list)
+    """pyqtSignal(list), with the codes of the places whose forecast changed,
+    see :meth:`setForecasting`"""
+
     selectionChanged = QtCore.pyqtSignal()
     """pyqtSignal()"""
 
@@ -466,7 +546,22 @@ class Simulation(QtCore.QObject):
         class."""
         pass
 
+    @property
+    def selectedSignal(self):
+        """
+        :return: The signal selected by the player as the beginning of the
+        next route to set, if any.
+        :rtype: :class:`~ts2.scenery.signals.signalitem.SignalItem` or None
+        """
+        return self._selectedSignal
+
+    def _setSelectedSignal(self, si):
+        if si is not self._selectedSignal:
+            self._selectedSignal = si
+            self.selectedSignalChanged.emit()
+
     @QtCore.pyqtSlot(int, bool, bool)
+    @utils.playerCommand
     def activateRoute(self, siId, persistent=False, force=False):
         """This slot is normally connected to a
         :class:`~ts2.scenery.signals.signalitem.SignalItem`
@@ -496,7 +591,7 @@ class Simulation(QtCore.QObject):
         si = self._trackItems[siId]
         if self._selectedSignal is None or self._selectedSignal == si:
             # First signal selected
-            self._selectedSignal = si
+            self._setSelectedSignal(si)
         else:
             # Second signal selected
             r = self.findRoute(self._selectedSignal, si)
@@ -506,7 +601,7 @@ class Simulation(QtCore.QObject):
                     # We can activate it
                     r.activate(persistent)
                     self._selectedSignal.unselect()
-                    self._selectedSignal = None
+                    self._setSelectedSignal(None)
                     si.unselect()
                 else:
                     # We cannot activate it (another route is conflicting)
@@ -520,13 +615,67 @@ class Simulation(QtCore.QObject):
                 # No route between both signals
                 self.noRouteBetweenSignals.emit(self._selectedSignal, si)
                 self._selectedSignal.unselect()
-                self._selectedSignal = si
+                self._setSelectedSignal(si)
                 self.messageLogger.addMessage(
                     self.tr("No route between signals"),
                     logger.Message.PLAYER_WARNING_MSG
                 )
 
     @QtCore.pyqtSlot(int)
+    @utils.playerCommand
+    def activateRoutePath(self, siId):
+        """This slot is normally connected to a
+        :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        :attr:`~ts2.scenery.signals.signalitem.SignalItem.pathSelected`
+        signal, which itself is emitted when a signal is ctrl-clicked.
+
+        It works as :meth:`activateRoute`, but the second signal may be any
+        signal reachable from the first one: the routes of the shortest path
+        between both signals are all activated. Routes already active are
+        kept. If one of the others cannot be activated, none is.
+
+        :param int siId: ID of the clicked
+        :class:`~ts2.scenery.signals.signalitem.SignalItem`.
+        """
+        si = self._trackItems[siId]
+        if self._selectedSignal is None or self._selectedSignal == si:
+            # First signal selected
+            self._setSelectedSignal(si)
+            return
+        path = self.findRoutePath(self._selectedSignal, si)
+        if path is None:
+            self.noRouteBetweenSignals.emit(self._selectedSignal, si)
+            self._selectedSignal.unselect()
+            self._setSelectedSignal(si)
+            self.messageLogger.addMessage(
+                self.tr("No route between signals"),
+                logger.Message.PLAYER_WARNING_MSG
+            )
+            return
+        activated = []
+        for r in path:
+            if r.beginSignal.nextActiveRoute is r:
+                # Already set, e.g. by a previous click
+                continue
+            if not r.isActivable():
+                # Roll back the routes already activated
+                for ar in reversed(activated):
+                    ar.desactivate()
+                self.conflictingRoute.emit(r)
+                si.unselect()
+                self.messageLogger.addMessage(
+                    self.tr("Conflicting route"),
+                    logger.Message.PLAYER_WARNING_MSG
+                )
+                return
+            r.activate()
+            activated.append(r)
+        self._selectedSignal.unselect()
+        self._setSelectedSignal(None)
+        si.unselect()
+
+    @QtCore.pyqtSlot(int)
+    @utils.playerCommand
     def desactivateRoute(self, siId):
         """ This slot is normally connected to the
         :class:`~ts2.scenery.signals.signalitem.SignalItem`'s
@@ -541,12 +690,13 @@ class Simulation(QtCore.QObject):
         if self._selectedSignal is not None:
             # Unselect the selected signal if any
             self._selectedSignal.unselect()
-            self._selectedSignal = None
+            self._setSelectedSignal(None)
         r = si.nextActiveRoute
         if r is not None:
             r.desactivate()
 
     @QtCore.pyqtSlot(bool)
+    @utils.playerCommand
     def pause(self, paused=True):
         """Toggle pause.
 
@@ -557,7 +707,46 @@ class Simulation(QtCore.QObject):
         else:
             self._timer.start()
 
+    @QtCore.pyqtSlot(bool)
+    @utils.playerCommand
+    def setAutoRouteSetting(self, enabled=True):
+        """Enables or disables the automatic setting of routes according to
+        the trains timetables.
+
+        :param enabled: If ``True``, routes are set automatically.
+        """
+        if enabled and self.autoRouteSetter is None:
+            self.autoRouteSetter = autoroute.AutoRouteSetter(self)
+            self.timeElapsed.connect(self.autoRouteSetter.update)
+        elif not enabled and self.autoRouteSetter is not None:
+            self.timeElapsed.disconnect(self.autoRouteSetter.update)
+            self.autoRouteSetter = None
+
+    @QtCore.pyqtSlot(bool)
+    def setForecasting(self, enabled=True):
+        """Enables or disables the forecast of the trains expected times at
+        each place, see :class:`~ts2.game.forecast.DepartureForecaster`.
+
+        The forecast is costly, so it should only be enabled while it is
+        shown. The forecastChanged signal is emitted for all the places when
+        it is enabled or disabled, so that views can be connected to it once.
+
+        :param enabled: If ``True``, the forecast is updated at each step.
+        """
+        if enabled and self.forecaster is None:
+            self.forecaster = forecast.DepartureForecaster(self)
+            self.forecaster.forecastChanged.connect(self.forecastChanged)
+            self.timeElapsed.connect(self.forecaster.update)
+            self.forecaster.update(0)
+        elif not enabled and self.forecaster is not None:
+            self.timeElapsed.disconnect(self.forecaster.update)
+            self.trainStatusChanged.disconnect(self.forecaster.trackTrain)
+            self.forecaster.deleteLater()
+            self.forecaster = None
+            self.forecastChanged.emit(sorted(self.places))
+
     @QtCore.pyqtSlot(int)
+    @utils.playerCommand
     def setTimeFactor(self, timeFactor):
         """
         :param int timeFactor: Sets the time factor to timeFactor.
@@ -573,7 +762,9 @@ class Simulation(QtCore.QObject):
         timeElapsed signals
         This function is normally connected to the timer timeout signal."""
         timeFactor = float(self.option("timeFactor"))
-        self._time = self._time.addMSecs((self._timer.interval()) * timeFactor)
+        self._time = self._time.addMSecs(
+            int(self._timer.interval() * timeFactor)
+        )
         self.timeChanged.emit(self._time)
         secs = self._timer.interval() * timeFactor / 1000
         self.timeElapsed.emit(secs)
@@ -590,6 +781,50 @@ class Simulation(QtCore.QObject):
             if isinstance(ti, placeitem.Place):
                 self._places[ti.placeCode] = ti
 
+    def buildTimetables(self):
+        """Fills the timetable of each place with the lines of all the
+        services, sorting each timetable only once."""
+        serviceLines = {}
+        for service in self.services.values():
+            for line in service.lines:
+                place = line.place
+                if place is not None:
+                    serviceLines.setdefault(place.tiId, []).append(line)
+        for place in self._places.values():
+            place.setTimetable(serviceLines.get(place.tiId, []))
+
+    def indexPlace(self, place):
+        """Adds place to the places dictionary under its current place
+        code."""
+        if place.placeCode:
+            self._places[place.placeCode] = place
+
+    def unindexPlace(self, place):
+        """Removes place from the places dictionary."""
+        if self._places.get(place.placeCode) is place:
+            del self._places[place.placeCode]
+
+    def indexLineItem(self, li):
+        """Adds the LineItem li to the (placeCode, trackCode) index used by
+        :meth:`getLineItem`. Lines which do not belong to a place are not
+        indexed."""
+        if li.place is not None:
+            key = (li.placeCode, li.trackCode)
+            lines = self._lineItemsIndex.setdefault(key, [])
+            if li not in lines:
+                lines.append(li)
+
+    def unindexLineItem(self, li):
+        """Removes the LineItem li from the (placeCode, trackCode) index."""
+        key = (li.placeCode, li.trackCode)
+        lines = self._lineItemsIndex.get(key, [])
+        for i, line in enumerate(lines):
+            if line is li:
+                del lines[i]
+                break
+        if not lines:
+            self._lineItemsIndex.pop(key, None)
+
     def findRoute(self, si1, si2):
         """Checks whether a route exists between two signals.
 
@@ -601,46 +836,152 @@ class Simulation(QtCore.QObject):
         None
         :rtype: :class:`~ts2.routing.route.Route` or None
         """
-        for r in self._routes.values():
-            if r.links(si1, si2):
-                return r
-        return None
+        return self._routesIndex.get((si1.tiId, si2.tiId))
+
+    def routesFrom(self, si):
+        """
+        :param si: A :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        :return: The routes starting at signal si, in route number order.
+        :rtype: list of :class:`~ts2.routing.route.Route`
+        """
+        return sorted(self._routesFromSignal.get(si.tiId, {}).values())
+
+    def findRoutePath(self, startSignal, target):
+        """Finds the shortest sequence of routes from a signal to a target.
+
+        :param startSignal: The
+        :class:`~ts2.scenery.signals.signalitem.SignalItem` to start from.
+        :param target: The :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        to reach, or any other :class:`~ts2.scenery.abstract.TrackItem`, e.g.
+        a platform, that the last route must go through.
+        :return: The routes of the shortest path, in order, or None if
+        target cannot be reached.
+        :rtype: list of :class:`~ts2.routing.route.Route` or None
+        """
+        paths = self.routeGraph.findPaths(startSignal, target)
+        return list(paths[0]) if paths else None
+
+    def findRoutePaths(self, startSignal, target, k=3):
+        """
+        :return: The k shortest paths from startSignal to target (see
+        :meth:`findRoutePath`), shortest first.
+        :rtype: list of lists of :class:`~ts2.routing.route.Route`
+        """
+        return [list(p) for p in self.routeGraph.findPaths(startSignal,
+                                                            target, k)]
+
+    def indexRoute(self, rte):
+        """Adds the initialized route rte to the routes index. If a route
+        between the same signals is already indexed, it is kept."""
+        key = (rte.beginSignal.tiId, rte.endSignal.tiId)
+        self._routesIndex.setdefault(key, rte)
+        self._routesFromSignal.setdefault(key[0], {})[rte.routeNum] = rte
+        self.routeConflicts.invalidate()
+        self.routeGraph.invalidate()
+
+    def unindexRoute(self, rte):
+        """Removes rte from the routes index."""
+        self.routeConflicts.invalidate()
+        self.routeGraph.invalidate()
+        key = (rte.beginSignal.tiId, rte.endSignal.tiId)
+        if self._routesIndex.get(key) is rte:
+            del self._routesIndex[key]
+            # Another route may link the same signals
+            for other in self._routesFromSignal.get(key[0], {}).values():
+                if other is not rte and other.endSignal.tiId == key[1]:
+                    self._routesIndex[key] = other
+                    break
+        outgoing = self._routesFromSignal.get(key[0], {})
+        if outgoing.get(rte.routeNum) is rte:
+            del outgoing[rte.routeNum]
+            if not outgoing:
+                del self._routesFromSignal[key[0]]
+
+    def rebuildRoutesIndex(self):
+        """Rebuilds the index of routes by begin and end signals. Routes must
+        be initialized."""
+        self._routesIndex = {}
+        self._routesFromSignal = {}
+        for rte in self._routes.values():
+            self.indexRoute(rte)
+        self.routeConflicts.build(self._routes.values())
+
+    def activableRoutes(self):
+        """
+        :return: The routes that can be activated now, i.e. that no active
+        route is conflicting with, in route number order.
+        :rtype: list of :class:`~ts2.routing.route.Route`
+        """
+        return self.routeConflicts.activableRoutes(self)
+
+    def routeStatusesFrom(self, si):
+        """
+        :param si: A :class:`~ts2.scenery.signals.signalitem.SignalItem`
+        :return: The status of each route starting at signal si, i.e. whether
+        it can be activated now, the reason if not, and whether a train is on
+        it, in route number order.
+        :rtype: list of :class:`~ts2.routing.conflicts.RouteStatus`
+        """
+        return self.routeConflicts.routeStatuses(self, self.routesFrom(si))
 
     def createTrackItemsLinks(self):
         """Find the items that are linked together through their coordinates
         and populate the _nextItem and _previousItem variables of each items.
+
+        The ends of the items are registered in a spatial index so that only
+        the pairs of items having ends close to each other are compared.
         """
         self.messageLogger.addMessage(self.tr("Creating TrackItem links"),
                                       logger.Message.SOFTWARE_MSG)
+        ends = spatialindex.GridIndex(cellSize=1.0)
+        points = []
+        order = {}
         for ki, vi in self._trackItems.items():
-            for kj, vj in self._trackItems.items():
+            order[ki] = len(order)
+            points.append((ki, "origin", vi.origin))
+            points.append((ki, "end", vi.end))
+            if isinstance(vi, pointsitem.PointsItem):
+                points.append((ki, "reverse", vi.reverse))
+        for ki, name, point in points:
+            ends.insert((ki, name), point)
+        candidates = collections.defaultdict(set)
+        for ki, name, point in points:
+            near = ends.itemsInRect(QtCore.QRectF(point.x() - 1.0,
+                                                  point.y() - 1.0, 2.0, 2.0))
+            for kj, otherName in near:
                 if ki < kj:
-                    if self.distanceBetween(vi.origin, vj.origin) <= 1.0:
-                        vi.previousItem = vj
+                    candidates[ki].add(kj)
+        # Pairs are linked in the same order as if all pairs were compared,
+        # since a link can be overwritten by a later pair.
+        for ki, vi in self._trackItems.items():
+            for kj in sorted(candidates.get(ki, ()), key=order.get):
+                vj = self._trackItems[kj]
+                if self.distanceBetween(vi.origin, vj.origin) <= 1.0:
+                    vi.previousItem = vj
+                    vj.previousItem = vi
+                elif self.distanceBetween(vi.origin, vj.end) <= 1.0:
+                    vi.previousItem = vj
+                    vj.nextItem = vi
+                elif self.distanceBetween(vi.end, vj.origin) <= 1.0:
+                    vi.nextItem = vj
+                    vj.previousItem = vi
+                elif self.distanceBetween(vi.end, vj.end) <= 1.0:
+                    vi.nextItem = vj
+                    vj.nextItem = vi
+                elif isinstance(vi, pointsitem.PointsItem):
+                    if self.distanceBetween(vi.reverse, vj.origin) <= 1.0:
+                        vi.reverseItem = vj
                         vj.previousItem = vi
-                    elif self.distanceBetween(vi.origin, vj.end) <= 1.0:
-                        vi.previousItem = vj
+                    elif self.distanceBetween(vi.reverse, vj.end) <= 1.0:
+                        vi.reverseItem = vj
                         vj.nextItem = vi
-                    elif self.distanceBetween(vi.end, vj.origin) <= 1.0:
-                        vi.nextItem = vj
-                        vj.previousItem = vi
-                    elif self.distanceBetween(vi.end, vj.end) <= 1.0:
+                elif isinstance(vj, pointsitem.PointsItem):
+                    if self.distanceBetween(vi.origin, vj.reverse) <= 1.0:
+                        vi.previousItem = vj
+                        vj.reverseItem = vi
+                    elif self.distanceBetween(vi.end, vj.reverse) <= 1.0:
                         vi.nextItem = vj
-                        vj.nextItem = vi
-                    elif isinstance(vi, pointsitem.PointsItem):
-                        if self.distanceBetween(vi.reverse, vj.origin) <= 1.0:
-                            vi.reverseItem = vj
-                            vj.previousItem = vi
-                        elif self.distanceBetween(vi.reverse, vj.end) <= 1.0:
-                            vi.reverseItem = vj
-                            vj.nextItem = vi
-                    elif isinstance(vj, pointsitem.PointsItem):
-                        if self.distanceBetween(vi.origin, vj.reverse) <= 1.0:
-                            vi.previousItem = vj
-                            vj.reverseItem = vi
-                        elif self.distanceBetween(vi.end, vj.reverse) <= 1.0:
-                            vi.nextItem = vj
-                            vj.reverseItem = vi
+                        vj.reverseItem = vi
 
     def checkTrackItemsLinks(self):
         """
@@ -687,8 +1028,5 @@ class Simulation(QtCore.QObject):
         :return: the :class:`~ts2.scenery.lineitem.LineItem` instance defined by
         placeCode and trackCode.
         """
-        for ti in self._trackItems.values():
-            if isinstance(ti, lineitem.LineItem):
-                if ti.placeCode == placeCode and ti.trackCode == trackCode:
-                    return ti
-        return None
+        lines = self._lineItemsIndex.get((placeCode, trackCode))
+        return lines[0] if lines else None
@@ -0,0 +1,572 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Simulation core running in a separate process.
+
+In this mode, trains, signals and routes are computed by a simulation core
+running in a worker process, with its own clock. The main window displays a
+local copy of the simulation, the mirror, which computes nothing:
+
+- The core takes a :class:`Snapshot` of what is displayed (train positions
+  on each track item, signal aspects, route highlights, clock, score...)
+  and sends it to the GUI process.
+- The GUI process applies the latest snapshot to the mirror at its own frame
+  rate. Only the differences with the previous snapshot are applied.
+- Player commands, i.e. the methods decorated with
+  :func:`~ts2.utils.playerCommand`, are sent to the core instead of being
+  executed on the mirror.
+
+Neither side waits for the other: the GUI process gives a credit to the
+core each time it has applied a snapshot, and the core only sends a
+snapshot when it holds a credit. So at most one snapshot is in flight, and
+snapshots do not pile up when the GUI is slow.
+"""
+
+import collections
+import multiprocessing
+import os
+
+from Qt import QtCore, QtWidgets
+
+from ts2 import simulation, trains
+from ts2.game import logger
+from ts2.routing import position
+from ts2.scenery import abstract, pointsitem
+from ts2.scenery.signals import signalitem
+
+TrainState = collections.namedtuple("TrainState", [
+    "serviceCode", "trainTypeCode", "status", "speed", "head",
+    "nextPlaceIndex", "stoppedTime", "minimumStopTime", "initialDelay"
+])
+"""State of a train. head is a (tiId, previousTiId, positionOnTI) tuple."""
+
+SignalState = collections.namedtuple("SignalState", [
+    "aspectName", "trainId", "nextRoute", "previousRoute"
+])
+"""State of a signal. Routes are given by their number."""
+
+Snapshot = collections.namedtuple("Snapshot", [
+    "commands", "time", "score", "trains", "occupation", "highlights",
+    "signals", "reversedPoints", "persistentRoutes", "selectedSignal",
+    "messages", "requests"
+])
+"""Immutable state of a simulation.
+
+- commands: number of player commands executed by the core
+- time: current time in ms since midnight
+- trains: tuple of :class:`TrainState`, in trainId order
+- occupation: tuple of (tiId, trainIds, trainHeads, trainTails) for each
+  track item on which there are trains
+- highlights: tuple of (tiId, routeNum, previousTiId) for each track item on
+  which a route is set
+- signals: tuple of (tiId, :class:`SignalState`)
+- reversedPoints: frozenset of the tiId of the reversed points
+- persistentRoutes: frozenset of the routeNum of the persistent routes
+- selectedSignal: tiId of the signal selected to set a route, or None
+- messages: tuple of (msgType, msgText, trainId) of the messages logged since
+  the previous snapshot
+- requests: tuple of (methodName, trainId) of the calls to the main window
+  since the previous snapshot
+"""
+
+EMPTY_SNAPSHOT = Snapshot(
+    commands=0, time=0, score=0, trains=(), occupation=(), highlights=(),
+    signals=(), reversedPoints=frozenset(), persistentRoutes=frozenset(),
+    selectedSignal=None, messages=(), requests=()
+)
+"""Snapshot of nothing, to which any snapshot can be compared."""
+
+MSECS_PER_DAY = 86400000
+
+
+def _routeNum(rte):
+    return rte.routeNum if rte is not None else None
+
+
+def _tiId(ti):
+    return ti.tiId if ti is not None else None
+
+
+def trainState(train):
+    """Returns the :class:`TrainState` of train."""
+    return TrainState(train.serviceCode, train.trainTypeCode, train.status,
+                      train.speed,
+                      (_tiId(train.trainHead.trackItem),
+                       _tiId(train.trainHead.previousTI),
+                       train.trainHead.positionOnTI),
+                      train.nextPlaceIndex, train.stoppedTime,
+                      train.minimumStopTime, train.initialDelay)
+
+
+def signalState(si):
+    """Returns the :class:`SignalState` of the signal si."""
+    aspect = si.activeAspect
+    return SignalState(aspect.name if aspect is not None else None,
+                       si.trainId, _routeNum(si.nextActiveRoute),
+                       _routeNum(si.previousActiveRoute))
+
+
+def occupationEntry(ti, trainIds):
+    """Returns the occupation entry of a snapshot for the track item ti, on
+    which there are trains. trainIds maps id(train) to trainId."""
+    return (ti.tiId, tuple(trainIds[id(train)] for train in ti.trainPresent()),
+            tuple(ti._trainHeads), tuple(ti._trainTails))
+
+
+def highlightEntry(ti):
+    """Returns the highlight entry of a snapshot for the track item ti, on
+    which a route is set."""
+    return (ti.tiId, ti.activeRoute.routeNum,
+            _tiId(ti.activeRoutePreviousItem))
+
+
+def takeSnapshot(sim, commands=0, messages=(), requests=()):
+    """Returns the :class:`Snapshot` of the simulation sim."""
+    trainIds = {id(train): trainId
+                for trainId, train in enumerate(sim.trains)}
+    trainStates = tuple(trainState(train) for train in sim.trains)
+    occupation = []
+    highlights = []
+    signals = []
+    reversedPoints = []
+    for tiId, ti in sim.trackItems.items():
+        if ti.trainPresent():
+            occupation.append(occupationEntry(ti, trainIds))
+        if ti.activeRoute is not None:
+            highlights.append(highlightEntry(ti))
+        if isinstance(ti, signalitem.SignalItem):
+            signals.append((tiId, signalState(ti)))
+        elif isinstance(ti, pointsitem.PointsItem) and ti.pointsReversed:
+            reversedPoints.append(tiId)
+    return Snapshot(
+        commands=commands,
+        time=sim.currentTime.msecsSinceStartOfDay(),
+        score=sim.scorer.score,
+        trains=trainStates,
+        occupation=tuple(occupation),
+        highlights=tuple(highlights),
+        signals=tuple(signals),
+        reversedPoints=frozenset(reversedPoints),
+        persistentRoutes=frozenset(rte.routeNum
+                                   for rte in sim.routes.values()
+                                   if rte.persistent),
+        selectedSignal=_tiId(sim.selectedSignal),
+        messages=tuple(messages),
+        requests=tuple(requests)
+    )
+
+
+def executeCommand(sim, kind, trainId, methodName, args):
+    """Executes the player command methodName with args on sim if kind is
+    "simulation", or on its train trainId if kind is "train". methodName may
+    also be the name of a property, which is then set."""
+    if kind == "train":
+        target = sim.trains[trainId]
+    else:
+        target = sim
+    if isinstance(getattr(type(target), methodName, None), property):
+        setattr(target, methodName, *args)
+    else:
+        getattr(target, methodName)(*args)
+
+
+class HeadlessWindow:
+    """Stands for the main window, which the simulation calls back, when the
+    simulation is run without a GUI. The calls are ignored."""
+
+    def openReassignServiceWindow(self, trainId):
+        pass
+
+    def openSplitTrainWindow(self, trainId):
+        pass
+
+
+class CoreWindow:
+    """Stands for the main window in the worker process. The calls are sent
+    to the main window of the GUI process with the next snapshot."""
+
+    def __init__(self):
+        """Constructor for the CoreWindow class."""
+        self.requests = []
+
+    def openReassignServiceWindow(self, trainId):
+        self.requests.append(("openReassignServiceWindow", trainId))
+
+    def openSplitTrainWindow(self, trainId):
+        self.requests.append(("openSplitTrainWindow", trainId))
+
+
+class SimulationCore(QtCore.QObject):
+    """Runs the simulation in the worker process, executes the commands
+    received from the GUI process and sends it snapshots."""
+
+    def __init__(self, data, commands, snapshots, pollInterval=20):
+        """
+        :param data: simulation data, see :func:`ts2.simulation.loadData`
+        :param commands: connection from which to receive the commands
+        :param snapshots: connection on which to send the snapshots
+        :param pollInterval: interval in ms at which commands are read
+        """
+        super().__init__()
+        self.window = CoreWindow()
+        self.simulation = simulation.loadData(self.window, data)
+        self._commands = commands
+        self._snapshots = snapshots
+        self._commandCount = 0
+        self._credit = False
+        self._dirty = True
+        self._messagesSent = len(self.simulation.messageLogger)
+        self.simulation.timeElapsed.connect(self.setDirty)
+        self._pollTimer = QtCore.QTimer(self)
+        self._pollTimer.setInterval(pollInterval)
+        self._pollTimer.timeout.connect(self.poll)
+        self._pollTimer.start()
+
+    @QtCore.pyqtSlot()
+    def setDirty(self):
+        """Records that the simulation changed since the last snapshot."""
+        self._dirty = True
+
+    @QtCore.pyqtSlot()
+    def poll(self):
+        """Executes the pending commands and sends a snapshot if the GUI
+        process is ready for it."""
+        try:
+            while self._commands.poll():
+                command = self._commands.recv()
+                if command[0] == "ready":
+                    self._credit = True
+                elif command[0] == "quit":
+                    QtWidgets.qApp.quit()
+                    return
+                else:
+                    self.execute(*command[1:])
+            if self._credit and self._dirty:
+                self.publish()
+        except (EOFError, OSError):
+            # The GUI process is gone
+            QtWidgets.qApp.quit()
+
+    def execute(self, kind, trainId, methodName, args):
+        """Executes the player command methodName on the simulation or on
+        the train trainId."""
+        self._commandCount += 1
+        self._dirty = True
+        try:
+            executeCommand(self.simulation, kind, trainId, methodName, args)
+        except Exception as err:
+            self.simulation.messageLogger.addMessage(
+                self.tr("Command %s failed: %s") % (methodName, err),
+                logger.Message.SOFTWARE_MSG
+            )
+
+    def publish(self):
+        """Sends the snapshot of the simulation to the GUI process."""
+        messageLogger = self.simulation.messageLogger
+        messages = []
+        for num in range(self._messagesSent, len(messageLogger)):
+            message = messageLogger.message(num)
+            messages.append((message.msgType, message.msgText,
+                             message.trainId))
+        self._messagesSent = len(messageLogger)
+        self._snapshots.send(takeSnapshot(
+            self.simulation, self._commandCount, messages,
+            self.window.requests
+        ))
+        self.window.requests = []
+        self._credit = False
+        self._dirty = False
+
+
+def runCore(data, commands, snapshots):
+    """Entry point of the worker process."""
+    # The core never shows anything
+    os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    core = SimulationCore(data, commands, snapshots)
+    app.exec_()
+    del core
+
+
+class SimulationMirror(QtCore.QObject):
+    """Turns a local simulation into a mirror of a simulation computed
+    elsewhere: snapshots of the remote simulation are applied to the mirror,
+    and player commands are sent to the remote simulation. Subclasses
+    provide the transport."""
+
+    def __init__(self, sim):
+        """
+        :param sim: the local simulation
+        """
+        super().__init__(sim)
+        self.simulation = sim
+        self._applied = takeSnapshot(sim)
+        self._commandCount = 0
+        # The mirror computes nothing
+        sim.pause()
+        for train in sim.trains:
+            self._detachTrain(train)
+        sim.worker = self
+
+    def _detachTrain(self, train):
+        self.simulation.timeElapsed.disconnect(train.advance)
+        self.simulation.timeChanged.disconnect(train.activate)
+
+    def makeCommand(self, target, methodName, args):
+        """Returns the message calling methodName with args on target, the
+        simulation or one of its trains, and counts it as sent."""
+        self._commandCount += 1
+        if target is self.simulation:
+            return ("call", "simulation", None, methodName, args)
+        return ("call", "train", target.trainId, methodName, args)
+
+    def sendCommand(self, target, methodName, args):
+        """Sends the call of methodName with args on target to the remote
+        simulation. Implemented by subclasses."""
+        raise NotImplementedError
+
+    def stop(self):
+        """Stops mirroring. Implemented by subclasses."""
+        raise NotImplementedError
+
+    def applySnapshot(self, snapshot):
+        """Updates the mirror with snapshot."""
+        sim = self.simulation
+        previous = self._applied
+        self._applied = snapshot
+        self._applyTrains(snapshot.trains, previous.trains)
+        self._applyHighlights(snapshot.highlights, previous.highlights)
+        for tiId in snapshot.reversedPoints ^ previous.reversedPoints:
+            sim.trackItem(tiId).pointsReversed = \
+                tiId in snapshot.reversedPoints
+        for routeNum in snapshot.persistentRoutes ^ previous.persistentRoutes:
+            sim.routes[routeNum].persistent = \
+                routeNum in snapshot.persistentRoutes
+        self._applySignals(snapshot.signals, previous.signals)
+        self._applyOccupation(snapshot.occupation, previous.occupation)
+        sim.scorer.score = snapshot.score
+        if snapshot.commands == self._commandCount and \
+                (snapshot.commands != previous.commands or
+                 snapshot.selectedSignal != previous.selectedSignal):
+            # Only once the core has caught up with our clicks
+            self._applySelection(snapshot.selectedSignal)
+        for msgType, msgText, trainId in snapshot.messages:
+            sim.messageLogger.insertMessage(logger.Message({
+                "msgType": msgType, "msgText": msgText, "trainId": trainId
+            }))
+        for methodName, trainId in snapshot.requests:
+            # Dialogs must not be opened while applying a snapshot
+            QtCore.QTimer.singleShot(0, lambda m=methodName, t=trainId:
+                                     getattr(sim.simulationWindow, m)(t))
+        if snapshot.time != previous.time:
+            elapsed = (snapshot.time - previous.time) % MSECS_PER_DAY
+            sim._time = QtCore.QTime(0, 0).addMSecs(snapshot.time)
+            sim.timeChanged.emit(sim.currentTime)
+            sim.timeElapsed.emit(elapsed / 1000)
+
+    def _applyTrains(self, states, previousStates):
+        sim = self.simulation
+        for trainId, state in enumerate(states):
+            if trainId >= len(sim.trains):
+                self._addTrain(state)
+            elif trainId < len(previousStates) and \
+                    state == previousStates[trainId]:
+                continue
+            train = sim.trains[trainId]
+            statusChanged = (train.status != state.status or
+                             train.serviceCode != state.serviceCode or
+                             train.nextPlaceIndex != state.nextPlaceIndex)
+            train._serviceCode = state.serviceCode
+            if train.trainTypeCode != state.trainTypeCode:
+                train._trainType = sim.trainTypes[state.trainTypeCode]
+            train._status = state.status
+            train._speed = state.speed
+            tiId, previousTiId, positionOnTI = state.head
+            train._trainHead = position.Position(
+                sim.trackItem(tiId), sim.trackItem(previousTiId),
+                positionOnTI
+            )
+            train._nextPlaceIndex = state.nextPlaceIndex
+            train._stoppedTime = state.stoppedTime
+            train._minimumStopTime = state.minimumStopTime
+            train._initialDelay = state.initialDelay
+            if statusChanged:
+                sim.trainStatusChanged.emit(trainId)
+
+    def _addTrain(self, state):
+        """Adds to the mirror a train created by the core, e.g. when a train
+        is split."""
+        tiId, previousTiId, positionOnTI = state.head
+        train = trains.Train({
+            "__type__": "Train",
+            "serviceCode": None,
+            "trainTypeCode": state.trainTypeCode,
+            "status": trains.TrainStatus.OUT,
+            "speed": 0.0,
+            "trainHead": position.Position(parameters={
+                "trackItem": tiId,
+                "previousTI": previousTiId,
+                "positionOnTI": positionOnTI
+            }),
+            "appearTime": self.simulation.currentTime.toString(),
+            "initialDelay": 0,
+            "nextPlaceIndex": None,
+        })
+        self.simulation.addTrain(train)
+        train.initialize(self.simulation)
+        self._detachTrain(train)
+
+    def _applyHighlights(self, highlights, previousHighlights):
+        sim = self.simulation
+        current = {tiId: (routeNum, previousTiId)
+                   for tiId, routeNum, previousTiId in highlights}
+        for tiId, routeNum, previousTiId in previousHighlights:
+            if tiId not in current:
+                # Bypass the subclasses, which would update the signals
+                abstract.TrackItem.resetActiveRoute(sim.trackItem(tiId))
+        previous = {tiId: (routeNum, previousTiId)
+                    for tiId, routeNum, previousTiId in previousHighlights}
+        for tiId, value in current.items():
+            if previous.get(tiId) != value:
+                routeNum, previousTiId = value
+                abstract.TrackItem.setActiveRoute(
+                    sim.trackItem(tiId), sim.routes[routeNum],
+                    sim.trackItem(previousTiId)
+                )
+
+    def _applySignals(self, signals, previousSignals):
+        sim = self.simulation
+        aspects = sim.signalLibrary.signalAspects
+        previous = dict(previousSignals)
+        for tiId, state in signals:
+            if previous.get(tiId) == state:
+                continue
+            si = sim.trackItem(tiId)
+            if state.aspectName is not None:
+                si._activeAspect = aspects[state.aspectName]
+            si._trainId = state.trainId
+            si._nextActiveRoute = sim.routes.get(state.nextRoute)
+            si._previousActiveRoute = sim.routes.get(state.previousRoute)
+            si.updateGraphics()
+
+    def _applyOccupation(self, occupation, previousOccupation):
+        sim = self.simulation
+        current = {entry[0]: entry for entry in occupation}
+        for entry in previousOccupation:
+            if entry[0] not in current:
+                ti = sim.trackItem(entry[0])
+                ti._trains = []
+                ti._trainHeads = []
+                ti._trainTails = []
+                ti.updateTrain()
+        previous = {entry[0]: entry for entry in previousOccupation}
+        for tiId, entry in current.items():
+            if previous.get(tiId) == entry:
+                continue
+            ti = sim.trackItem(tiId)
+            ti._trains = [sim.trains[trainId] for trainId in entry[1]]
+            ti._trainHeads = list(entry[2])
+            ti._trainTails = list(entry[3])
+            ti.updateTrain()
+
+    def _applySelection(self, selectedSignal):
+        sim = self.simulation
+        selected = sim.trackItem(selectedSignal)
+        for ti in sim.trackItems.values():
+            if isinstance(ti, signalitem.SignalItem) and ti.selected and \
+                    ti is not selected:
+                ti.selected = False
+        if selected is not None and not selected.selected:
+            selected.selected = True
+        sim._setSelectedSignal(selected)
+
+
+class SimulationWorker(SimulationMirror):
+    """Runs the core of the simulation in a worker process and displays its
+    state on the local simulation, which becomes a mirror of the core."""
+
+    def __init__(self, sim, data, frameInterval=40):
+        """
+        :param sim: the local simulation, loaded from data
+        :param data: simulation data, see :func:`ts2.simulation.loadData`
+        :param frameInterval: interval in ms at which snapshots are applied
+        """
+        super().__init__(sim)
+        self._stopped = False
+        context = multiprocessing.get_context("spawn")
+        coreCommands, self._commands = context.Pipe(duplex=False)
+        self._snapshots, coreSnapshots = context.Pipe(duplex=False)
+        self._process = context.Process(
+            target=runCore, args=(data, coreCommands, coreSnapshots),
+            daemon=True
+        )
+        self._process.start()
+        coreCommands.close()
+        coreSnapshots.close()
+        self._commands.send(("ready",))
+        self._frameTimer = QtCore.QTimer(self)
+        self._frameTimer.setInterval(frameInterval)
+        self._frameTimer.timeout.connect(self.applyLatest)
+        self._frameTimer.start()
+
+    def sendCommand(self, target, methodName, args):
+        """Reimplemented from SimulationMirror to send the command to the
+        core."""
+        if not self._stopped:
+            self._commands.send(self.makeCommand(target, methodName, args))
+
+    @QtCore.pyqtSlot()
+    def applyLatest(self):
+        """Applies the latest snapshot received from the core, if any."""
+        snapshot = None
+        try:
+            while self._snapshots.poll():
+                snapshot = self._snapshots.recv()
+        except (EOFError, OSError):
+            self._coreStopped()
+            return
+        if snapshot is None:
+            if not self._process.is_alive():
+                self._coreStopped()
+            return
+        self.applySnapshot(snapshot)
+        self._commands.send(("ready",))
+
+    def _coreStopped(self):
+        self._frameTimer.stop()
+        self._stopped = True
+        self.simulation.messageLogger.addMessage(
+            self.tr("The simulation process stopped unexpectedly"),
+            logger.Message.SOFTWARE_MSG
+        )
+
+    def stop(self):
+        """Stops the worker process."""
+        self._frameTimer.stop()
+        if not self._stopped:
+            self._stopped = True
+            try:
+                self._commands.send(("quit",))
+            except OSError:
+                pass
+        self._process.join(2)
+        if self._process.is_alive():
+            self._process.terminate()
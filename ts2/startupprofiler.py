@@ -0,0 +1,157 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""Startup time profiling, enabled with the ``--profile-startup`` command
+line option.
+
+This module must not import anything from ts2 or Qt, so that it can be
+started before any of them is imported.
+"""
+
+import builtins
+import contextlib
+import importlib.util
+import sys
+import time
+
+
+class StartupProfiler:
+    """Records the time spent importing each module and in each phase of the
+    application startup."""
+
+    def __init__(self):
+        """Constructor for the StartupProfiler class."""
+        self.startTime = time.perf_counter()
+        self.imports = []
+        self.phases = []
+        self._childTimes = []
+        self._originalImport = None
+
+    def installImportHook(self):
+        """Starts recording module imports."""
+        if self._originalImport is None:
+            self._originalImport = builtins.__import__
+            builtins.__import__ = self._import
+
+    def removeImportHook(self):
+        """Stops recording module imports."""
+        if self._originalImport is not None:
+            builtins.__import__ = self._originalImport
+            self._originalImport = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            try:
+                name = importlib.util.resolve_name(
+                    "." * level + name, (globals or {}).get("__package__")
+                )
+                level = 0
+            except (ImportError, ValueError):
+                pass
+        alreadyLoaded = name in sys.modules
+        if alreadyLoaded and not fromlist:
+            return self._originalImport(name, globals, locals, fromlist,
+                                        level)
+        modulesBefore = len(sys.modules)
+        if alreadyLoaded:
+            # from package import submodule: report the submodules
+            subModules = ["%s.%s" % (name, f) for f in fromlist
+                          if "%s.%s" % (name, f) not in sys.modules]
+        self._childTimes.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._originalImport(name, globals, locals, fromlist,
+                                        level)
+        finally:
+            elapsed = time.perf_counter() - start
+            childTime = self._childTimes.pop()
+            if len(sys.modules) > modulesBefore:
+                if self._childTimes:
+                    self._childTimes[-1] += elapsed
+                if alreadyLoaded and subModules:
+                    name = ", ".join(subModules)
+                self.imports.append((name, elapsed - childTime, elapsed,
+                                     len(self._childTimes)))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager recording the time spent in the phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - self.startTime,
+                                time.perf_counter() - start))
+
+    def report(self, stream=None, maxImports=30):
+        """Writes the startup time breakdown to stream (stderr by
+        default)."""
+        stream = stream or sys.stderr
+        total = time.perf_counter() - self.startTime
+        stream.write("Startup profile (times in ms)\n")
+        stream.write("\nPhases:\n")
+        stream.write("  %9s %9s  %s\n" % ("start", "duration", "phase"))
+        for name, start, duration in self.phases:
+            stream.write("  %9.1f %9.1f  %s\n"
+                         % (start * 1000, duration * 1000, name))
+        stream.write("\nImports (top %i by cumulative time):\n" % maxImports)
+        stream.write("  %9s %9s  %s\n" % ("self", "cumul.", "module"))
+        imports = sorted(self.imports, key=lambda i: i[2], reverse=True)
+        for name, selfTime, cumulTime, depth in imports[:maxImports]:
+            stream.write("  %9.1f %9.1f  %s%s\n"
+                         % (selfTime * 1000, cumulTime * 1000,
+                            "  " * depth, name))
+        importTime = sum(i[2] for i in self.imports if i[3] == 0)
+        stream.write("\nTotal import time: %.1f ms\n" % (importTime * 1000))
+        stream.write("Time to first window: %.1f ms\n" % (total * 1000))
+        stream.flush()
+
+
+_profiler = None
+
+
+def start():
+    """Starts profiling the application startup."""
+    global _profiler
+    if _profiler is None:
+        _profiler = StartupProfiler()
+        _profiler.installImportHook()
+    return _profiler
+
+
+def isActive():
+    return _profiler is not None
+
+
+def phase(name):
+    """Returns a context manager recording the time spent in the startup
+    phase name, or a no-op context manager if profiling is not active."""
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.phase(name)
+
+
+def finish():
+    """Stops profiling and prints the report."""
+    global _profiler
+    if _profiler is not None:
+        _profiler.removeImportHook()
+        _profiler.report()
+        _profiler = None
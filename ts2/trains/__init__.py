@@ -23,3 +23,4 @@ from ts2.trains.service import Service, ServiceInfoModel, ServiceLine, \
     ServiceLinesModel, ServiceInfoModel, ServiceListModel, ServicesModel
 from ts2.trains.train import TrainStatus, TrainInfoModel, TrainListModel, \
     Train, TrainsModel
+from ts2.trains.filters import ServiceFilterModel, TrainFilterModel
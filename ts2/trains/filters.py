@@ -0,0 +1,457 @@
+#
+#   Copyright (C) 2008-2015 by Nicolas Piganeau
+#   npi@m4x.org
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the
+#   Free Software Foundation, Inc.,
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+
+"""Sorted and filtered views of the train and service lists.
+
+The proxy models of this module keep, for each row of their source model,
+the value of each filtered field in an index {value: set of rows}, the
+service codes in a sorted list for prefix searches, and the sort keys of the
+shown rows in a sorted list. When a row of the source model changes, this
+row alone is moved, inserted or removed, instead of filtering and sorting
+the whole list again as QSortFilterProxyModel does.
+
+Source models may only append rows or be reset.
+"""
+
+import bisect
+
+from Qt import QtCore, Qt
+
+from ts2.trains.train import rowRanges
+
+
+def _sortValue(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, QtCore.QTime):
+        return value.toString("hh:mm:ss")
+    if value is None:
+        return ""
+    return str(value)
+
+
+class SortedIndex:
+    """Sorted list of (key, row) pairs."""
+
+    def __init__(self, pairs=()):
+        """Constructor for the SortedIndex class."""
+        self._pairs = sorted(pairs)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def __getitem__(self, position):
+        return self._pairs[position]
+
+    def position(self, key, row):
+        """Returns the position of (key, row), or the position at which it
+        would be inserted."""
+        return bisect.bisect_left(self._pairs, (key, row))
+
+    def insert(self, key, row):
+        bisect.insort(self._pairs, (key, row))
+
+    def remove(self, key, row):
+        del self._pairs[self.position(key, row)]
+
+    def rowsWithPrefix(self, prefix):
+        """Returns the rows of the keys starting with prefix, keys being
+        strings."""
+        first = bisect.bisect_left(self._pairs, (prefix,))
+        last = bisect.bisect_left(self._pairs, (prefix + "\U0010ffff",))
+        return [row for key, row in self._pairs[first:last]]
+
+
+class IndexedFilterModel(QtCore.QAbstractProxyModel):
+    """Base class of the proxy models sorting and filtering a flat source
+    model with indexes. Subclasses define FIELDS and :meth:`fieldValues`."""
+
+    FIELDS = ()
+    """Names of the fields by which rows can be filtered."""
+
+    def __init__(self, parent=None):
+        """Constructor for the IndexedFilterModel class."""
+        super().__init__(parent)
+        self._sortColumn = 0
+        self._sortOrder = Qt.AscendingOrder
+        self._filters = {}
+        self._prefix = ""
+        self._clear()
+
+    def _clear(self):
+        self._indexes = {field: {} for field in self.FIELDS}
+        self._rowValues = {}
+        self._codes = SortedIndex()
+        self._rowCodes = {}
+        self._sorted = SortedIndex()
+        self._rowKeys = {}
+
+    # ## To be defined in subclasses ####################################
+
+    def fieldValues(self, sourceRow):
+        """Returns a dict {field: value} of the row sourceRow of the source
+        model."""
+        raise NotImplementedError()
+
+    def serviceCode(self, sourceRow):
+        """Returns the service code of the row sourceRow."""
+        return _sortValue(
+            self.sourceModel().data(self.sourceModel().index(sourceRow, 0))
+        )
+
+    # ## Filters ##########################################################
+
+    def setFilter(self, field, condition=None):
+        """Only shows the rows whose value of field matches condition, which
+        is a collection of accepted values, a function returning True for the
+        accepted values, or a single value. None shows all the rows."""
+        if condition is None:
+            self._filters.pop(field, None)
+        elif callable(condition):
+            self._filters[field] = condition
+        elif isinstance(condition, (set, frozenset, list, tuple)):
+            self._filters[field] = frozenset(condition).__contains__
+        else:
+            self._filters[field] = lambda value: value == condition
+        self._refilter()
+
+    def setServiceCodePrefix(self, prefix):
+        """Only shows the rows whose service code starts with prefix."""
+        self._prefix = prefix or ""
+        self._refilter()
+
+    def _accepts(self, sourceRow):
+        values = self._rowValues[sourceRow]
+        if self._prefix and \
+                not self._rowCodes[sourceRow].startswith(self._prefix):
+            return False
+        return all(condition(values[field])
+                   for field, condition in self._filters.items())
+
+    def _acceptedRows(self):
+        """Returns the rows matching the filters, looked up in the
+        indexes."""
+        rows = None
+        if self._prefix:
+            rows = set(self._codes.rowsWithPrefix(self._prefix))
+        for field, condition in self._filters.items():
+            matching = set()
+            for value, valueRows in self._indexes[field].items():
+                if condition(value):
+                    matching |= valueRows
+            rows = matching if rows is None else rows & matching
+        if rows is None:
+            return self._rowValues.keys()
+        return rows
+
+    def _refilter(self):
+        self.beginResetModel()
+        self._rowKeys = {row: self._sortKey(row)
+                         for row in self._acceptedRows()}
+        self._sorted = SortedIndex((key, row)
+                                   for row, key in self._rowKeys.items())
+        self.endResetModel()
+
+    # ## Indexes ##########################################################
+
+    def _sortKey(self, sourceRow):
+        source = self.sourceModel()
+        return _sortValue(
+            source.data(source.index(sourceRow, self._sortColumn))
+        )
+
+    def _indexRow(self, sourceRow):
+        """Updates the indexes with the values of sourceRow."""
+        values = self.fieldValues(sourceRow)
+        oldValues = self._rowValues.get(sourceRow)
+        if values != oldValues:
+            for field, value in values.items():
+                if oldValues is not None:
+                    oldValue = oldValues[field]
+                    if oldValue == value:
+                        continue
+                    oldRows = self._indexes[field][oldValue]
+                    oldRows.discard(sourceRow)
+                    if not oldRows:
+                        del self._indexes[field][oldValue]
+                self._indexes[field].setdefault(value, set()).add(sourceRow)
+            self._rowValues[sourceRow] = values
+        code = self.serviceCode(sourceRow)
+        oldCode = self._rowCodes.get(sourceRow)
+        if code != oldCode:
+            if oldCode is not None:
+                self._codes.remove(oldCode, sourceRow)
+            self._codes.insert(code, sourceRow)
+            self._rowCodes[sourceRow] = code
+
+    def _build(self):
+        self._clear()
+        for row in range(self.sourceModel().rowCount()):
+            self._indexRow(row)
+        self._rowKeys = {row: self._sortKey(row)
+                         for row in self._acceptedRows()}
+        self._sorted = SortedIndex((key, row)
+                                   for row, key in self._rowKeys.items())
+
+    @QtCore.pyqtSlot()
+    def rebuild(self):
+        """Indexes again all the rows of the source model."""
+        self.beginResetModel()
+        self._build()
+        self.endResetModel()
+
+    def _proxyRow(self, position, count=None):
+        """Returns the row of the proxy model at position in the sorted
+        index of count rows."""
+        if self._sortOrder == Qt.AscendingOrder:
+            return position
+        if count is None:
+            count = len(self._sorted)
+        return count - 1 - position
+
+    def _position(self, proxyRow):
+        if self._sortOrder == Qt.AscendingOrder:
+            return proxyRow
+        return len(self._sorted) - 1 - proxyRow
+
+    def refreshRow(self, sourceRow):
+        """Updates the indexes of sourceRow, and inserts, removes or moves
+        its row in the proxy model. Returns False if the row is not shown."""
+        self._indexRow(sourceRow)
+        oldKey = self._rowKeys.get(sourceRow)
+        newKey = self._sortKey(sourceRow) \
+            if self._accepts(sourceRow) else None
+        count = len(self._sorted)
+        parent = QtCore.QModelIndex()
+        if oldKey is None and newKey is None:
+            return False
+        elif oldKey is None:
+            position = self._sorted.position(newKey, sourceRow)
+            row = self._proxyRow(position, count + 1)
+            self.beginInsertRows(parent, row, row)
+            self._sorted.insert(newKey, sourceRow)
+            self._rowKeys[sourceRow] = newKey
+            self.endInsertRows()
+            return False
+        elif newKey is None:
+            position = self._sorted.position(oldKey, sourceRow)
+            row = self._proxyRow(position, count)
+            self.beginRemoveRows(parent, row, row)
+            self._sorted.remove(oldKey, sourceRow)
+            del self._rowKeys[sourceRow]
+            self.endRemoveRows()
+            return False
+        elif newKey != oldKey:
+            oldPosition = self._sorted.position(oldKey, sourceRow)
+            newPosition = self._sorted.position(newKey, sourceRow)
+            if newPosition > oldPosition:
+                newPosition -= 1
+            oldRow = self._proxyRow(oldPosition, count)
+            newRow = self._proxyRow(newPosition, count)
+            moved = oldRow != newRow
+            if moved:
+                self.beginMoveRows(parent, oldRow, oldRow, parent,
+                                   newRow if newRow < oldRow else newRow + 1)
+            self._sorted.remove(oldKey, sourceRow)
+            self._sorted.insert(newKey, sourceRow)
+            self._rowKeys[sourceRow] = newKey
+            if moved:
+                self.endMoveRows()
+        return True
+
+    @QtCore.pyqtSlot(QtCore.QModelIndex, QtCore.QModelIndex)
+    def _onDataChanged(self, topLeft, bottomRight):
+        self.refreshRows(range(topLeft.row(), bottomRight.row() + 1))
+
+    def refreshRows(self, sourceRows):
+        """Refreshes sourceRows with :meth:`refreshRow`, then emits the
+        dataChanged signal for the rows still shown."""
+        shown = [row for row in sourceRows if self.refreshRow(row)]
+        proxyRows = [self.mapFromSource(self.sourceModel().index(row, 0))
+                     .row() for row in shown]
+        lastColumn = self.columnCount() - 1
+        for first, last in rowRanges(proxyRows):
+            self.dataChanged.emit(self.index(first, 0),
+                                  self.index(last, lastColumn))
+
+    @QtCore.pyqtSlot(QtCore.QModelIndex, int, int)
+    def _onRowsInserted(self, parent, first, last):
+        for row in range(first, last + 1):
+            self.refreshRow(row)
+
+    # ## QAbstractProxyModel ##############################################
+
+    def setSourceModel(self, model):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.dataChanged.connect(self._onDataChanged)
+        model.rowsInserted.connect(self._onRowsInserted)
+        model.modelReset.connect(self.rebuild)
+        model.layoutChanged.connect(self.rebuild)
+        self._build()
+        self.endResetModel()
+
+    def mapToSource(self, proxyIndex):
+        if not proxyIndex.isValid() or \
+                not 0 <= proxyIndex.row() < len(self._sorted):
+            return QtCore.QModelIndex()
+        sourceRow = self._sorted[self._position(proxyIndex.row())][1]
+        return self.sourceModel().index(sourceRow, proxyIndex.column())
+
+    def mapFromSource(self, sourceIndex):
+        if not sourceIndex.isValid():
+            return QtCore.QModelIndex()
+        sourceRow = sourceIndex.row()
+        key = self._rowKeys.get(sourceRow)
+        if key is None:
+            return QtCore.QModelIndex()
+        position = self._sorted.position(key, sourceRow)
+        return self.createIndex(self._proxyRow(position),
+                                sourceIndex.column())
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if parent.isValid() or not 0 <= row < len(self._sorted) or \
+                not 0 <= column < self.columnCount():
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        return QtCore.QModelIndex()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._sorted)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        return self.sourceModel().columnCount()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sorts the rows by the values of column."""
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        sourceIndexes = [self.mapToSource(index) for index in persistent]
+        self._sortColumn = column
+        self._sortOrder = order
+        self._rowKeys = {row: self._sortKey(row) for row in self._rowKeys}
+        self._sorted = SortedIndex((key, row)
+                                   for row, key in self._rowKeys.items())
+        self.changePersistentIndexList(
+            persistent,
+            [self.mapFromSource(index) for index in sourceIndexes]
+        )
+        self.layoutChanged.emit()
+
+
+class TrainFilterModel(IndexedFilterModel):
+    """Sorted and filtered view of the
+    :class:`~ts2.trains.train.TrainListModel` of a simulation.
+
+    The rows can be filtered by status, next place code, lateness in whole
+    minutes at the next place as forecast, entry and exit place names, and
+    service code prefix.
+    """
+
+    FIELDS = ("status", "nextPlace", "late", "entryPlace", "exitPlace")
+
+    def __init__(self, simulation, parent=None):
+        """Constructor for the TrainFilterModel class."""
+        super().__init__(parent)
+        self.simulation = simulation
+        self.setSourceModel(simulation.trainListModel)
+        simulation.forecastChanged.connect(self.updateForecast)
+
+    def fieldValues(self, sourceRow):
+        train = self.simulation.trains[sourceRow]
+        service = train.currentService
+        line = None
+        if service is not None and train.nextPlaceIndex is not None:
+            line = service.lines[train.nextPlaceIndex]
+        late = 0
+        forecaster = self.simulation.forecaster
+        if forecaster is not None and line is not None:
+            forecast = forecaster.lineForecast(line)
+            if forecast is not None and forecast.delay:
+                late = max(int(forecast.delay // 60), 0)
+        return {
+            "status": train.status,
+            "nextPlace": line.placeCode if line is not None else None,
+            "late": late,
+            "entryPlace": service.entryPlaceName if service else None,
+            "exitPlace": service.exitPlaceName if service else None,
+        }
+
+    def serviceCode(self, sourceRow):
+        return self.simulation.trains[sourceRow].serviceCode or ""
+
+    def trainId(self, proxyRow):
+        """Returns the trainId shown at proxyRow."""
+        return self._sorted[self._position(proxyRow)][1]
+
+    def rowOfTrain(self, trainId):
+        """Returns the row showing the train trainId, or -1."""
+        return self.mapFromSource(
+            self.sourceModel().index(trainId, 0)
+        ).row()
+
+    @QtCore.pyqtSlot(list)
+    def updateForecast(self, placeCodes):
+        """Updates the lateness of the trains going to placeCodes."""
+        nextPlaceIndex = self._indexes["nextPlace"]
+        rows = set()
+        for placeCode in placeCodes:
+            rows |= nextPlaceIndex.get(placeCode, set())
+        self.refreshRows(sorted(rows))
+
+
+class ServiceFilterModel(IndexedFilterModel):
+    """Sorted and filtered view of the
+    :class:`~ts2.trains.service.ServiceListModel` of a simulation.
+
+    The rows can be filtered by entry and exit place names and service code
+    prefix.
+    """
+
+    FIELDS = ("entryPlace", "exitPlace")
+
+    def __init__(self, simulation, parent=None):
+        """Constructor for the ServiceFilterModel class."""
+        super().__init__(parent)
+        self.simulation = simulation
+        self.setSourceModel(simulation.serviceListModel)
+
+    def fieldValues(self, sourceRow):
+        source = self.sourceModel()
+        return {
+            "entryPlace": source.data(source.index(sourceRow, 3)),
+            "exitPlace": source.data(source.index(sourceRow, 4)),
+        }
+
+    def rowOfService(self, serviceCode):
+        """Returns the row showing the service serviceCode, or -1."""
+        for sourceRow in self._codes.rowsWithPrefix(serviceCode):
+            if self._rowCodes[sourceRow] == serviceCode:
+                return self.mapFromSource(
+                    self.sourceModel().index(sourceRow, 0)
+                ).row()
+        return -1
@@ -109,11 +109,13 @@ class ServiceListModel(QtCore.QAbstractTableModel):
     def updateModel(self):
         """Updates the internal copy of the services with the simulation
         services."""
+        self.beginResetModel()
         self._services = sorted(
             self.simulation.services.values(),
             key=lambda x: x.lines and x.lines[0].scheduledDepartureTimeStr
                           or x.serviceCode
         )
+        self.endResetModel()
 
     def rowCount(self, parent=None, *args, **kwargs):
         """Returns the number of rows of the model, corresponding to the
@@ -222,19 +224,23 @@ class ServicesModel(QtCore.QAbstractTableModel):
             code = index.sibling(index.row(), self.C.serviceCode).data()
 
             if index.column() == self.C.nextServiceCode:
-                self._editor.services[code].nextServiceCode = value
+                attribute = "nextServiceCode"
 
             elif index.column() == self.C.autoReverse:
-                self._editor.services[code].autoReverse = value
+                attribute = "autoReverse"
 
             elif index.column() == self.C.plannedTrainType:
-                self._editor.services[code].plannedTrainType = value
+                attribute = "plannedTrainType"
 
             elif index.column() == self.C.description:
-                self._editor.services[code].description = value
+                attribute = "description"
 
             else:
                 return False
+            self._editor.editAttributes(
+                self.tr("Edit service"),
+                [(self._editor.services[code], attribute, value)], self
+            )
             self.dataChanged.emit(index, index)
             return True
         return False
@@ -323,7 +329,13 @@ class ServiceLine:
     def placeCode(self, value):
         """Setter function for the placeCode property"""
         if self.simulation.context == utils.Context.EDITOR_SERVICES:
+            place = self.place
+            if place is not None:
+                place.removeTimetable(self)
             self._placeCode = value
+            place = self.place
+            if place is not None:
+                place.addTimetable(self)
 
     @property
     def trackCode(self):
@@ -364,7 +376,12 @@ class ServiceLine:
     def scheduledDepartureTimeStr(self, value):
         """Setter function for the scheduledDepartureTime property"""
         if self.simulation.context == utils.Context.EDITOR_SERVICES:
+            place = self.place
+            if place is not None:
+                place.removeTimetable(self)
             self._scheduledDepartureTime = QtCore.QTime.fromString(value)
+            if place is not None:
+                place.addTimetable(self)
 
     @property
     def scheduledArrivalTime(self):
@@ -435,17 +452,19 @@ class ServiceLinesModel(QtCore.QAbstractTableModel):
         if role == Qt.EditRole:
             line = self._service.lines[index.row()]
             if index.column() == 0:
-                line.placeCode = value
+                attribute = "placeCode"
             elif index.column() == 1:
-                line.trackCode = value
+                attribute = "trackCode"
             elif index.column() == 2:
-                line.scheduledArrivalTimeStr = value
+                attribute = "scheduledArrivalTimeStr"
             elif index.column() == 3:
-                line.scheduledDepartureTimeStr = value
+                attribute = "scheduledDepartureTimeStr"
             elif index.column() == 4:
-                line.mustStop = value
+                attribute = "mustStop"
             else:
                 return False
+            self._editor.editAttributes(self.tr("Edit service line"),
+                                        [(line, attribute, value)], self)
             self.dataChanged.emit(index, index)
             return True
         return False
@@ -512,7 +531,20 @@ class Service:
         self.simulation = simulation
         for line in self._lines:
             line.initialize(self)
-            line.place.addTimetable(line)
+
+    def addToTimetables(self):
+        """Adds the lines of this service to the timetables of their
+        places."""
+        for line in self._lines:
+            if line.place is not None:
+                line.place.addTimetable(line)
+
+    def removeFromTimetables(self):
+        """Removes the lines of this service from the timetables of their
+        places."""
+        for line in self._lines:
+            if line.place is not None:
+                line.place.removeTimetable(line)
 
     def for_json(self):
         """Data for JSON dump."""
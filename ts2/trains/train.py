@@ -78,13 +78,54 @@ class TrainStatus(QtCore.QObject):
             return ""
 
 
+def rowRanges(rows):
+    """Returns the list of (first, last) ranges of consecutive numbers in the
+    iterable rows."""
+    ranges = []
+    for row in sorted(rows):
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+    return [tuple(r) for r in ranges]
+
+
+def _statusBrush(status):
+    if status == TrainStatus.RUNNING:
+        return QtGui.QBrush(Qt.darkGreen)
+    elif status == TrainStatus.STOPPED:
+        return QtGui.QBrush(Qt.darkBlue)
+    elif status == TrainStatus.WAITING:
+        return QtGui.QBrush(Qt.red)
+    else:
+        return QtGui.QBrush(Qt.darkGray)
+
+
+def _deferredTimer(model):
+    """Returns a timer calling model.flush once control returns to the event
+    loop, i.e. after the current simulation tick."""
+    timer = QtCore.QTimer(model)
+    timer.setSingleShot(True)
+    timer.setInterval(0)
+    timer.timeout.connect(model.flush)
+    return timer
+
+
 class TrainListModel(QtCore.QAbstractTableModel):
     """Model for displaying trains as a list during the game.
+
+    The displayed values of each row are cached until the service, status or
+    next place of its train change, and the rows updated during a tick are
+    notified at once, as ranges of consecutive rows, after the tick.
     """
     def __init__(self, simulation):
         """Constructor for the TrainListModel class"""
         super().__init__()
         self.simulation = simulation
+        self._rows = {}
+        self._trainRows = {}
+        self._dirtyRows = set()
+        self._flushTimer = _deferredTimer(self)
 
     def rowCount(self, parent=QtCore.QModelIndex(), *args):
         """Returns the number of rows of the model, corresponding to the
@@ -98,44 +139,48 @@ class TrainListModel(QtCore.QAbstractTableModel):
 
         return 8
 
-    def data(self, index, role=Qt.DisplayRole):
-        """Returns the data at the given index"""
-        train = self.simulation.trains[index.row()]
+    def _rowValues(self, train):
+        """Returns the displayed values and the foreground brush of the row
+        of train."""
+        service = train.currentService
         if train.nextPlaceIndex is not None:
-            line = train.currentService.lines[train.nextPlaceIndex]
+            line = service.lines[train.nextPlaceIndex]
         else:
             line = None
-        if role == Qt.DisplayRole:
-            if index.column() == 0:
-                return train.serviceCode
-            elif index.column() == 1:
-                return TrainStatus.text(train.status)
-            elif index.column() == 2 and train.currentService:
-                return train.currentService.entryPlaceName
-            elif index.column() == 3 and train.currentService:
-                return train.currentService.exitPlaceName
-            elif index.column() == 4 and line is not None:
-                return line.place.placeName
-            elif index.column() == 5 and line is not None:
-                return line.trackCode
-            elif index.column() == 6 and line is not None:
-                if line.mustStop:
-                    return line.scheduledArrivalTime.toString("hh:mm:ss")
-                else:
-                    return self.tr("Non-stop")
-            elif index.column() == 7 and line is not None:
-                return line.scheduledDepartureTime.toString("hh:mm:ss")
+        values = [train.serviceCode, TrainStatus.text(train.status)]
+        if service:
+            values += [service.entryPlaceName, service.exitPlaceName]
+        else:
+            values += ["", ""]
+        if line is not None:
+            if line.mustStop:
+                arrival = line.scheduledArrivalTime.toString("hh:mm:ss")
             else:
-                return ""
+                arrival = self.tr("Non-stop")
+            values += [line.place.placeName, line.trackCode, arrival,
+                       line.scheduledDepartureTime.toString("hh:mm:ss")]
+        else:
+            values += ["", "", "", ""]
+        return values, _statusBrush(train.status)
+
+    def _row(self, row):
+        train = self.simulation.trains[row]
+        key = (train, train.serviceCode, train.status, train.nextPlaceIndex)
+        cached = self._rows.get(row)
+        if cached is None or cached[0] != key:
+            cached = (key, self._rowValues(train))
+            self._rows[row] = cached
+        return cached[1]
+
+    def data(self, index, role=Qt.DisplayRole):
+        """Returns the data at the given index"""
+        if role == Qt.DisplayRole:
+            values = self._row(index.row())[0]
+            if 0 <= index.column() < len(values):
+                return values[index.column()]
+            return ""
         elif role == Qt.ForegroundRole:
-            if train.status == TrainStatus.RUNNING:
-                return QtGui.QBrush(Qt.darkGreen)
-            elif train.status == TrainStatus.STOPPED:
-                return QtGui.QBrush(Qt.darkBlue)
-            elif train.status == TrainStatus.WAITING:
-                return QtGui.QBrush(Qt.red)
-            else:
-                return QtGui.QBrush(Qt.darkGray)
+            return self._row(index.row())[1]
         return None
 
     def headerData(self, column, orientation, role=Qt.DisplayRole):
@@ -167,9 +212,33 @@ class TrainListModel(QtCore.QAbstractTableModel):
 
     @QtCore.pyqtSlot(int)
     def update(self, trainId):
-        """Emits the dataChanged signal for the train defined by trainId."""
-        row = trainId
-        self.dataChanged.emit(self.index(row, 0), self.index(row, 7))
+        """Emits the dataChanged signal for the train defined by trainId after
+        the current tick."""
+        self._dirtyRows.add(trainId)
+        if not self._flushTimer.isActive():
+            self._flushTimer.start()
+
+    def trainChanged(self, train):
+        """Emits the dataChanged signal for train after the current tick,
+        e.g. because its service or its next place changed."""
+        trains = self.simulation.trains
+        row = self._trainRows.get(id(train))
+        if row is None or row >= len(trains) or trains[row] is not train:
+            self._trainRows = {id(t): r for r, t in enumerate(trains)}
+            row = self._trainRows.get(id(train))
+        if row is not None:
+            self.update(row)
+
+    @QtCore.pyqtSlot()
+    def flush(self):
+        """Emits the dataChanged signal for the trains updated since the last
+        call."""
+        rows = self._dirtyRows
+        self._dirtyRows = set()
+        rowCount = self.rowCount()
+        for first, last in rowRanges(row for row in rows if row < rowCount):
+            self.dataChanged.emit(self.index(first, 0),
+                                  self.index(last, 7))
 
 
 class TrainsModel(QtCore.QAbstractTableModel):
@@ -236,19 +305,23 @@ class TrainsModel(QtCore.QAbstractTableModel):
         """Updates data when modified in the view"""
         if role == Qt.EditRole:
             if index.column() == 1:
-                self._editor.trains[index.row()].serviceCode = value
+                attribute = "serviceCode"
             elif index.column() == 2:
-                self._editor.trains[index.row()].trainTypeCode = value
+                attribute = "trainTypeCode"
             elif index.column() == 3:
-                self._editor.trains[index.row()].appearTimeStr = value
+                attribute = "appearTimeStr"
             elif index.column() == 4:
-                self._editor.trains[index.row()].trainHeadStr = value
+                attribute = "trainHeadStr"
             elif index.column() == 5:
-                self._editor.trains[index.row()].initialSpeed = value
+                attribute = "initialSpeed"
             elif index.column() == 6:
-                self._editor.trains[index.row()].initialDelayStr = value
+                attribute = "initialDelayStr"
             else:
                 return False
+            self._editor.editAttributes(
+                self.tr("Edit train"),
+                [(self._editor.trains[index.row()], attribute, value)], self
+            )
             self.dataChanged.emit(index, index)
             return True
         return False
@@ -268,12 +341,19 @@ class TrainsModel(QtCore.QAbstractTableModel):
 
 class TrainInfoModel(QtCore.QAbstractTableModel):
     """Model for displaying a single service information in a view
+
+    The values are cached, and the rows whose value changed during a tick are
+    notified at once after the tick.
     """
     def __init__(self, simulation):
         """Constructor for the TrainInfoModel class"""
         super().__init__()
         self.simulation = simulation
         self._train = None
+        self._key = None
+        self._values = None
+        self._shownValues = None
+        self._flushTimer = _deferredTimer(self)
 
     def rowCount(self, parent=None, *args, **kwargs):
         """Returns the number of rows in the model"""
@@ -289,14 +369,49 @@ class TrainInfoModel(QtCore.QAbstractTableModel):
         else:
             return 0
 
+    def _computeValues(self):
+        """Returns the values of the second column."""
+        train = self._train
+        nextPlaceIndex = train.nextPlaceIndex
+        if nextPlaceIndex is not None:
+            line = train.currentService.lines[nextPlaceIndex]
+        else:
+            line = None
+        values = [
+            train.serviceCode,
+            TrainStatus.text(train.status),
+            self.tr("%3.0d km/h") % (float(train.speed) * 3.6),
+            train.trainType.description,
+            "",
+            train.currentService.entryPlaceName,
+            train.currentService.exitPlaceName,
+            ""
+        ]
+        if line is not None:
+            if line.mustStop:
+                arrival = line.scheduledArrivalTime.toString("hh:mm:ss")
+            else:
+                arrival = self.tr("Non-stop")
+            values += [line.place.placeName, line.trackCode, arrival,
+                       line.scheduledDepartureTime.toString("hh:mm:ss")]
+        else:
+            values += ["", "", "", ""]
+        return values
+
+    def values(self):
+        """Returns the values of the second column, computed again only if
+        the train changed."""
+        train = self._train
+        key = (train, train.serviceCode, train.status, train.nextPlaceIndex,
+               train.speed)
+        if key != self._key:
+            self._key = key
+            self._values = self._computeValues()
+        return self._values
+
     def data(self, index, role=Qt.DisplayRole):
         """Returns the data at the given index"""
         if self._train is not None:
-            nextPlaceIndex = self._train.nextPlaceIndex
-            if nextPlaceIndex is not None:
-                line = self._train.currentService.lines[nextPlaceIndex]
-            else:
-                line = None
             if role == Qt.DisplayRole:
                 if index.column() == 0:
                     if index.row() == 0:
@@ -323,49 +438,11 @@ class TrainInfoModel(QtCore.QAbstractTableModel):
                         return self.tr("Arrival time:")
                     elif index.row() == 11:
                         return self.tr("Departure time:")
-                elif index.column() == 1:
-                    if index.row() == 0:
-                        return self._train.serviceCode
-                    elif index.row() == 1:
-                        return TrainStatus.text(self._train.status)
-                    elif index.row() == 2:
-                        return self.tr("%3.0d km/h") % \
-                            (float(self._train.speed) * 3.6)
-                    elif index.row() == 3:
-                        return self._train.trainType.description
-                    elif index.row() == 4:
-                        return ""
-                    elif index.row() == 5:
-                        return self._train.currentService.entryPlaceName
-                    elif index.row() == 6:
-                        return self._train.currentService.exitPlaceName
-                    elif index.row() == 7:
-                        return ""
-                    elif index.row() == 8 and line is not None:
-                            return line.place.placeName
-                    elif index.row() == 9 and line is not None:
-                        return line.trackCode
-                    elif index.row() == 10 and line is not None:
-                        if line.mustStop:
-                            return \
-                                line.scheduledArrivalTime.toString("hh:mm:ss")
-                        else:
-                            return self.tr("Non-stop")
-                    elif index.row() == 11 and line is not None:
-                        return \
-                            line.scheduledDepartureTime.toString("hh:mm:ss")
-                    else:
-                        return ""
+                elif index.column() == 1 and 0 <= index.row() < 12:
+                    return self.values()[index.row()]
             elif role == Qt.ForegroundRole:
                 if index.row() == 1 and index.column() == 1:
-                    if self._train.status == TrainStatus.RUNNING:
-                        return QtGui.QBrush(Qt.darkGreen)
-                    elif self._train.status == TrainStatus.STOPPED:
-                        return QtGui.QBrush(Qt.darkBlue)
-                    elif self._train.status == TrainStatus.WAITING:
-                        return QtGui.QBrush(Qt.red)
-                    else:
-                        return QtGui.QBrush(Qt.darkGray)
+                    return _statusBrush(self._train.status)
                 return QtGui.QBrush()
         return None
 
@@ -397,18 +474,39 @@ class TrainInfoModel(QtCore.QAbstractTableModel):
         trainId"""
         self.beginResetModel()
         self._train = self.simulation.trains[trainId]
+        self._key = None
+        self._shownValues = self.values()
         self.endResetModel()
 
+    def _scheduleFlush(self):
+        if self._train is not None and not self._flushTimer.isActive():
+            self._flushTimer.start()
+
     @QtCore.pyqtSlot()
     def update(self):
-        """Emits the dataChanged signal for the lines that may change."""
-        self.dataChanged.emit(self.index(1, 1), self.index(2, 1))
-        self.dataChanged.emit(self.index(8, 1), self.index(11, 1))
+        """Emits the dataChanged signal for the lines that changed, after the
+        current tick."""
+        self._scheduleFlush()
 
     @QtCore.pyqtSlot()
     def updateSpeed(self):
-        """Emits the dataChanged signal for the speed only."""
-        self.dataChanged.emit(self.index(2, 1), self.index(2, 1))
+        """Emits the dataChanged signal for the lines that changed, including
+        the speed, after the current tick."""
+        self._scheduleFlush()
+
+    @QtCore.pyqtSlot()
+    def flush(self):
+        """Emits the dataChanged signal for the lines whose value changed
+        since the last call."""
+        if self._train is None:
+            return
+        values = self.values()
+        shown = self._shownValues
+        self._shownValues = values
+        rows = [row for row, value in enumerate(values)
+                if value != shown[row]]
+        for first, last in rowRanges(rows):
+            self.dataChanged.emit(self.index(first, 1), self.index(last, 1))
 
 
 class Train(QtCore.QObject):
@@ -578,11 +676,14 @@ class Train(QtCore.QObject):
         return self._serviceCode
 
     @serviceCode.setter
+    @utils.playerCommand
     def serviceCode(self, serviceCode):
         """Changes the train current service code to serviceCode"""
         if serviceCode not in self.simulation.services:
             raise Exception(self.tr("No service with code %s") % serviceCode)
         self._serviceCode = serviceCode
+        self._markChanged()
+        self.simulation.trainListModel.trainChanged(self)
         if self.simulation.context == utils.Context.GAME:
             if self._stoppedTime != 0:
                 self.status = TrainStatus.STOPPED
@@ -613,13 +714,15 @@ class Train(QtCore.QObject):
                 self._speed = 0
                 self._status = TrainStatus.OUT
                 self.simulation.messageLogger.addMessage(
-                    self.tr("Train %s exited the area") % self.serviceCode
+                    self.tr("Train %s exited the area") % self.serviceCode,
+                    trainId=self.trainId
                 )
             else:
                 self._status = value
         else:
             self._status = value
         if self._status != oldStatus:
+            self._markChanged()
             self.trainStatusChanged.emit(self.trainId)
 
     @property
@@ -637,6 +740,7 @@ class Train(QtCore.QObject):
         return self._nextPlaceIndex
 
     @nextPlaceIndex.setter
+    @utils.playerCommand
     def nextPlaceIndex(self, index):
         """Setter function for the nextPlaceIndex property."""
         if index is None or \
@@ -645,6 +749,8 @@ class Train(QtCore.QObject):
             self._nextPlaceIndex = None
         else:
             self._nextPlaceIndex = index
+        self._markChanged()
+        self.simulation.trainListModel.trainChanged(self)
 
     @property
     def trainType(self):
@@ -758,6 +864,14 @@ class Train(QtCore.QObject):
         if self.simulation.context == utils.Context.EDITOR_TRAINS:
             self._initialDelayProba = utils.DurationProba(value)
 
+    @property
+    def appearTime(self):
+        """
+        :return: the time at which this train is scheduled to enter the area
+        :rtype: ``QTime``
+        """
+        return self._appearTime
+
     @property
     def appearTimeStr(self):
         """Returns the time at which this train appears on the scene as a
@@ -810,7 +924,8 @@ class Train(QtCore.QObject):
     def updateMinimumStopTime(self):
         """Updates the minimum stopping time for next station."""
         self._minimumStopTime = utils.DurationProba(
-            self.simulation.option("defaultMinimumStopTime")).yieldValue()
+            self.simulation.option("defaultMinimumStopTime")
+        ).yieldValue(self.simulation.random)
 
     def showTrainActionsMenu(self, widget, pos):
         """Pops-up the train actions menu on the given QWidget"""
@@ -825,15 +940,26 @@ class Train(QtCore.QObject):
         """Sets up the initial delay variable."""
         if self._initialDelayProba.isNull():
             self._initialDelay = utils.DurationProba(
-                self.simulation.option("defaultDelayAtEntry")).yieldValue()
+                self.simulation.option("defaultDelayAtEntry")
+            ).yieldValue(self.simulation.random)
         else:
-            self._initialDelay = self._initialDelayProba.yieldValue()
+            self._initialDelay = self._initialDelayProba.yieldValue(
+                self.simulation.random
+            )
+
+    def _markChanged(self):
+        """Records the change of this train in the change tracker of the
+        simulation, if any."""
+        tracker = self.simulation.changeTracker
+        if tracker is not None:
+            tracker.trainChanged(self)
 
     @QtCore.pyqtSlot(float)
     def advance(self, secs):
         """Advances the train by a step corresponding to the elapsed secs,
         and executes all the associated actions."""
         if self.isActive():
+            self._markChanged()
             self.updateSignalActions()
             self.setSpeed(secs)
             advanceLength = self._speed * secs
@@ -849,7 +975,7 @@ class Train(QtCore.QObject):
         :meth:`~ts2.trains.train.Train.appearTime`.
         """
         if self.status == TrainStatus.INACTIVE:
-            realAppearTime = self._appearTime.addSecs(self.initialDelay)
+            realAppearTime = self._appearTime.addSecs(int(self.initialDelay))
             if self.simulation.startTime.addSecs(-3600) \
                     <= realAppearTime < time:
                 self._speed = self._initialSpeed
@@ -877,17 +1003,19 @@ class Train(QtCore.QObject):
                 if abs(self.initialDelay) < 60:
                     self.simulation.messageLogger.addMessage(
                         self.tr("Train %s entered the area on time") %
-                        self.serviceCode
+                        self.serviceCode, trainId=self.trainId
                     )
                 else:
                     loe = self.tr("late") if self.initialDelay > 0 \
                         else self.tr("early")
                     self.simulation.messageLogger.addMessage(
                         self.tr("Train %s entered the area %i minutes %s") %
-                        (self.serviceCode, abs(self.initialDelay // 60), loe)
+                        (self.serviceCode, abs(self.initialDelay // 60), loe),
+                        trainId=self.trainId
                     )
 
     @QtCore.pyqtSlot()
+    @utils.playerCommand
     def reverse(self):
         """Reverses the train direction."""
         if self._speed == 0:
@@ -900,6 +1028,7 @@ class Train(QtCore.QObject):
             trainTail = self._trainHead - self._trainType.length
             self._trainHead = trainTail.reversed()
             self._speed = 0
+            self._markChanged()
             newSignalAhead = self.findNextSignal()
             if newSignalAhead is not None:
                 newSignalAhead.trainId = self.trainId
@@ -943,6 +1072,7 @@ class Train(QtCore.QObject):
         else:
             self.splitTrainRequested.emit(self.trainId)
 
+    @utils.playerCommand
     def splitTrain(self, splitIndex):
         """Splits this train at the given index.
         :param splitIndex: The index at which to split the train. 1 is between
@@ -975,6 +1105,7 @@ class Train(QtCore.QObject):
             return
         # Change our own train type to the head type
         self._trainType = headTrainType
+        self._markChanged()
         # Create a new train for the tail
         parameters = {
             "__type__": "Train",
@@ -1049,7 +1180,7 @@ class Train(QtCore.QObject):
                 timeToWait = applicableAction[2]
             else:
                 timeToWait = 0
-            if currentTime > self._actionTime.addSecs(timeToWait):
+            if currentTime > self._actionTime.addSecs(int(timeToWait)):
                 # We have waited enough, so we go to next action
                 if len(self.signalActions) > self.applicableActionIndex + 1:
                     self._applicableActionIndex += 1
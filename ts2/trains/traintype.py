@@ -67,21 +67,25 @@ class TrainTypesModel(QtCore.QAbstractTableModel):
         if role == Qt.EditRole:
             code = index.sibling(index.row(), 0).data()
             if index.column() == 1:
-                self._editor.trainTypes[code].description = value
+                attribute = "description"
             elif index.column() == 2:
-                self._editor.trainTypes[code].maxSpeed = value
+                attribute = "maxSpeed"
             elif index.column() == 3:
-                self._editor.trainTypes[code].stdAccel = value
+                attribute = "stdAccel"
             elif index.column() == 4:
-                self._editor.trainTypes[code].stdBraking = value
+                attribute = "stdBraking"
             elif index.column() == 5:
-                self._editor.trainTypes[code].emergBraking = value
+                attribute = "emergBraking"
             elif index.column() == 6:
-                self._editor.trainTypes[code].length = value
+                attribute = "length"
             elif index.column() == 7:
-                self._editor.trainTypes[code].elementsStr = value
+                attribute = "elementsStr"
             else:
                 return False
+            self._editor.editAttributes(
+                self.tr("Edit train type"),
+                [(self._editor.trainTypes[code], attribute, value)], self
+            )
             self.dataChanged.emit(index, index)
             return True
         return False
@@ -18,6 +18,8 @@
 #   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
+import functools
+import inspect
 import random
 
 from Qt import QtCore
@@ -127,9 +129,10 @@ class DurationProba(QtCore.QObject):
         """
         return self._probaList is None
 
-    def yieldValue(self):
+    def yieldValue(self, generator=random):
         """Returns a random value in the bounds and probabilities given by
-        this DurationProba instance.
+        this DurationProba instance, drawn from generator, a random.Random
+        instance or the random module.
 
         This is done in two steps:
         - First we take a random number to determine the segment (tuple) in
@@ -148,7 +151,7 @@ class DurationProba(QtCore.QObject):
             return None
 
         # First determine our segment
-        r0 = 100 * random.random()
+        r0 = 100 * generator.random()
         seg = 0
         for i in range(len(probas) - 1):
             if probas[i] < r0 < probas[i+1]:
@@ -159,11 +162,46 @@ class DurationProba(QtCore.QObject):
             return self._probaList[-1][1]
 
         # Then pick up a number inside our segment
-        r1 = random.random()
+        r1 = generator.random()
         low, high, prob = self._probaList[seg]
         return r1 * (high - low) + low
 
 
+def playerCommand(func):
+    """Decorator for the methods of the simulation and of its trains which
+    are player commands.
+
+    When the simulation is driven by a
+    :class:`~ts2.simulationworker.SimulationWorker`, the call is sent to the
+    simulation core instead of being executed on the local simulation, which
+    only displays the state of the core.
+
+    When the game is recorded, the call is written to the
+    :class:`~ts2.replay.Recorder` of the simulation.
+
+    Keyword arguments are turned into positional arguments, so that the
+    command is sent or recorded with its arguments in order."""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if kwargs:
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            args = bound.args[1:]
+        simulation = getattr(self, "simulation", None) or self
+        worker = getattr(simulation, "worker", None)
+        if worker is not None:
+            worker.sendCommand(self, func.__name__, args)
+            return None
+        recorder = getattr(simulation, "recorder", None)
+        if recorder is not None:
+            with recorder.recording(self, func.__name__, args):
+                return func(self, *args)
+        return func(self, *args)
+    return wrapper
+
+
 def to_json(data):
     """Serialize data to a json string
 
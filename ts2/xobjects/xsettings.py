@@ -30,6 +30,9 @@ class XSettings(QtCore.QSettings):
 
     INITIAL_SETUP = "initial_setup"
     LOAD_LAST = "load_last"
+    MESSAGE_LOG_SIZE = "message_log_size"
+    SIMULATION_WORKER = "simulation_worker"
+    RECORD_REPLAYS = "record_replays"
 
     class HACKERS:
         npi = "npi"
@@ -117,6 +120,34 @@ class XSettings(QtCore.QSettings):
     def userDataDir(self):
         return os.path.join(self._getUserDataDirectory(), "data")
 
+    @property
+    def replaysDir(self):
+        """Folder in which to record the games (created if needed)."""
+        replaysDir = os.path.join(self._getUserDataDirectory(), "replays")
+        os.makedirs(replaysDir, exist_ok=True)
+        return replaysDir
+
+    @property
+    def dataDir(self):
+        """General data folder shipped alongside the ts2 package."""
+        return os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(ts2.__file__))),
+            "data"
+        )
+
+    @property
+    def cacheDir(self):
+        """Folder in which to put regenerable cache files (created if
+        needed)."""
+        baseDir = QtCore.QStandardPaths.writableLocation(
+            QtCore.QStandardPaths.GenericCacheLocation
+        )
+        if not baseDir:
+            baseDir = os.path.join(os.path.expanduser("~"), ".cache")
+        cacheDir = os.path.join(baseDir, ts2.__APP_SHORT__)
+        os.makedirs(cacheDir, exist_ok=True)
+        return cacheDir
+
     def i(self, ki, default=None):
         """Return  value as int"""
         v = self.value(ki, default)